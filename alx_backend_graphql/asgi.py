@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the app registry is ready.
+from crm.websocket import GraphQLWebSocket, router  # noqa: E402
+
+# GraphQL subscriptions are served over WebSocket at /graphql.
+application = router(django_application, GraphQLWebSocket())
@@ -1,6 +1,6 @@
 
 import graphene
-from crm.schema import Query as CRMQuery, Mutation as CRMMutation
+from crm.schema import Query as CRMQuery, Mutation as CRMMutation, Subscription as CRMSubscription
 
 class Query(CRMQuery, graphene.ObjectType):
     pass
@@ -8,4 +8,7 @@ class Query(CRMQuery, graphene.ObjectType):
 class Mutation(CRMMutation, graphene.ObjectType):
     pass
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+class Subscription(CRMSubscription, graphene.ObjectType):
+    pass
+
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
@@ -81,6 +81,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the in-memory default, so tests that place
+        # orders from several threads see SQLite's real locking.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -127,10 +132,128 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 GRAPHENE = {
-    "SCHEMA": "alx_backend_graphql.schema.schema"
+    "SCHEMA": "alx_backend_graphql.schema.schema",
+    "MIDDLEWARE": ["crm.tracing.TracingMiddleware"],
+}
+
+# Per-resolver timing and SQL attribution (crm.tracing), served at /metrics.
+# Staff, or anyone in DEBUG, can send the HEADER to get the request's trace
+# in the response's extensions. /metrics is open to staff and to scrapers
+# sending METRICS_TOKEN as a bearer token.
+GRAPHQL_TRACING = {
+    "ENABLED": True,
+    "HEADER": "X-GraphQL-Trace",
+    "N_PLUS_ONE_THRESHOLD": 10,
+    "METRICS_TOKEN": None,
+}
+
+# LRU of parsed + validated GraphQL documents, also used as the Automatic
+# Persisted Query store. MAX_BYTES bounds the summed query text size.
+GRAPHQL_DOCUMENT_CACHE = {
+    "MAX_ENTRIES": 1000,
+    "MAX_BYTES": 4 * 1024 * 1024,
 }
 
 CRONJOBS = [
     ('*/5 * * * *', 'crm.cron.log_crm_heartbeat'),
     ('0 */12 * * *', 'crm.cron.update_low_stock'),
 ]
+
+# Operations estimated to resolve more than MAX_COST objects, or to nest
+# relations deeper than MAX_DEPTH, are rejected before execution.
+GRAPHQL_QUERY_COST = {
+    "MAX_COST": 50000,
+    "MAX_DEPTH": 8,
+    "DEFAULT_LIST_SIZE": 20,
+}
+
+# Cache for GraphQL query results. Point it at Redis in production, e.g.
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+# 'LOCATION': 'redis://localhost:6379/1'.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Opt-in result cache for query operations; invalidated by any write to
+# Customer, Product or Order. Mutations, and queries selecting one of its
+# UNCACHED_FIELDS (jobStatus, jobRuns), are never cached.
+GRAPHQL_RESPONSE_CACHE = {
+    "ENABLED": False,
+    "CACHE": "default",
+    "TIMEOUT": 60,
+}
+
+# approximateTotalCount on connections: PostgreSQL planner estimates at or
+# above MIN_ESTIMATE rows, otherwise exact counts cached for TIMEOUT seconds.
+GRAPHQL_COUNTS = {
+    "CACHE": "default",
+    "TIMEOUT": 300,
+    "MIN_ESTIMATE": 10000,
+}
+
+# A JSON array posted to /graphql is a batch of operations sharing loaders
+# and one connection. PARALLEL runs all-query batches in MAX_WORKERS threads.
+GRAPHQL_BATCH = {
+    "MAX_OPERATIONS": 10,
+    "PARALLEL": False,
+    "MAX_WORKERS": 4,
+}
+
+# GraphQL subscriptions over WebSocket (crm.websocket). Events are carried by
+# BACKEND: LocalBroker reaches subscribers in this process only; use
+# "crm.pubsub.RedisBroker" with OPTIONS {"url": ...} when mutations are
+# served by other processes.
+GRAPHQL_SUBSCRIPTIONS = {
+    "BACKEND": "crm.pubsub.LocalBroker",
+    "OPTIONS": {},
+    "QUEUE_SIZE": 100,
+    "LOW_STOCK_THRESHOLD": 10,
+    "CONNECTION_INIT_TIMEOUT": 10,
+}
+
+# Backend for the `search` argument on allCustomers/allProducts. By default
+# PostgreSQL uses pg_trgm and SQLite an FTS5 shadow table (crm.search).
+# CRM_SEARCH_BACKEND = "crm.search.SearchBackend"
+
+# Rows per INSERT for the bulkCreate* mutations and bulk imports.
+CRM_BULK_BATCH_SIZE = 500
+
+# Order reminders (crm.reminders, run by crm/cron_jobs/send_order_reminders.py).
+# SENDER "crm.reminders.EmailSender" mails them through EMAIL_BACKEND. The
+# cursor of the last order reminded is kept in the database (JobState), or in
+# STATE_FILE for scripts run against a remote CRM_GRAPHQL_URL.
+CRM_ORDER_REMINDERS = {
+    "DAYS": 7,
+    "PAGE_SIZE": 100,
+    "SENDER": "crm.reminders.LogSender",
+    "OPTIONS": {},
+    "WORKERS": 4,
+}
+
+# Chunked Celery jobs (crm.chunking, crm.jobs): primary keys per chunk task,
+# and seconds of lease a run keeps per chunk still queued or running.
+CRM_CHUNKED_JOBS = {
+    "CHUNK_SIZE": 10000,
+    "LEASE_PER_CHUNK": 60,
+}
+
+# Single-flight leases for cron and Celery jobs (crm.locks). A lease not
+# renewed for TTL seconds expires; holders renew it every HEARTBEAT seconds.
+CRM_JOB_LOCKS = {
+    "TTL": 300,
+    "HEARTBEAT": 60,
+    "HISTORY_DAYS": 30,
+}
+
+# Structured job log (crm.joblog): JSON lines from cron jobs, Celery tasks and
+# scripts, written in batches and rotated into gzipped generations. Read it
+# with `python manage.py job_log`.
+CRM_JOB_LOG = {
+    "PATH": "/tmp/crm_jobs.jsonl",
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "BACKUP_COUNT": 5,
+    "CAPACITY": 100,
+    "FLUSH_INTERVAL": 5,
+}
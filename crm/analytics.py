@@ -0,0 +1,99 @@
+import datetime
+
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Customer, Product, Order
+
+TRUNCATE = {
+    "day": TruncDate,
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+
+
+def date_range(start=None, end=None, field="order_date"):
+    """Filter kwargs for ``start <= field::date <= end`` that keep the index usable."""
+    lookups = {}
+    if start:
+        lookups[f"{field}__gte"] = _midnight(start)
+    if end:
+        lookups[f"{field}__lt"] = _midnight(end + datetime.timedelta(days=1))
+    return lookups
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def orders_in_range(start=None, end=None):
+    return Order.objects.filter(**date_range(start, end))
+
+
+def sales_summary(start=None, end=None):
+    """Customer count, order count and revenue, aggregated in the database."""
+    totals = orders_in_range(start, end).aggregate(orders=Count("pk"), revenue=Sum("total_amount"))
+    return {
+        "total_customers": Customer.objects.count(),
+        "total_orders": totals["orders"],
+        "total_revenue": totals["revenue"] or 0,
+    }
+
+
+async def asales_summary(start=None, end=None):
+    """``sales_summary`` through the async ORM."""
+    totals = await orders_in_range(start, end).aaggregate(orders=Count("pk"), revenue=Sum("total_amount"))
+    return {
+        "total_customers": await Customer.objects.acount(),
+        "total_orders": totals["orders"],
+        "total_revenue": totals["revenue"] or 0,
+    }
+
+
+def revenue_by_period(period="day", start=None, end=None):
+    """Order count and revenue per day, week or month, oldest first."""
+    bucket = TRUNCATE[period]("order_date", output_field=DateField())
+    return (
+        orders_in_range(start, end)
+        .annotate(period=bucket)
+        .values("period")
+        .annotate(orders=Count("pk"), revenue=Sum("total_amount"))
+        .order_by("period")
+    )
+
+
+def revenue_by_customer(start=None, end=None, limit=None):
+    """Customers ranked by the revenue of their orders in the range."""
+    rows = (
+        orders_in_range(start, end)
+        .values("customer")
+        .annotate(orders=Count("pk"), revenue=Sum("total_amount"))
+        .order_by("-revenue", "customer")
+    )
+    return attach(rows[:limit] if limit else rows, Customer, "customer")
+
+
+def revenue_by_product(start=None, end=None, limit=None):
+    """Products ranked by the revenue of the orders that include them.
+
+    An order with several products counts toward each of them, so these
+    figures do not add up to the overall revenue.
+    """
+    rows = (
+        Order.products.through.objects.filter(**date_range(start, end, field="order__order_date"))
+        .values("product")
+        .annotate(orders=Count("order"), revenue=Sum("order__total_amount"))
+        .order_by("-revenue", "product")
+    )
+    return attach(rows[:limit] if limit else rows, Product, "product")
+
+
+def attach(rows, model, key):
+    """Replace the grouped-by pk in each row with the instance, in one query."""
+    rows = list(rows)
+    instances = model.objects.in_bulk([row[key] for row in rows])
+    return [
+        {key: instances[row[key]], "orders": row["orders"], "revenue": row["revenue"]}
+        for row in rows
+    ]
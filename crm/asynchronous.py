@@ -0,0 +1,63 @@
+from functools import partial, wraps
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db.models import Manager, QuerySet
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver, dict_resolver
+from graphene.types.schema import identity_resolve
+
+DEFAULT_RESOLVERS = (dict_or_attr_resolver, attr_resolver, dict_resolver)
+
+
+def async_resolver(func):
+    """Let an ``async def`` resolver run under either view.
+
+    In an operation executed by ``AsyncCRMGraphQLView`` the coroutine runs
+    on the event loop; anywhere else (the WSGI view, ``schema.execute``) it
+    is run to completion with ``async_to_sync``.
+    """
+
+    @wraps(func)
+    def resolver(root, info, **args):
+        if getattr(info.context, "graphql_async", False):
+            return func(root, info, **args)
+        return async_to_sync(func)(root, info, **args)
+
+    resolver.on_event_loop = True
+    return resolver
+
+
+def on_event_loop(resolver):
+    """Whether ``resolver`` is safe to call on the event loop.
+
+    Async resolvers are, and so are graphene's default resolvers, which
+    read an attribute the parent resolver already loaded or return the
+    subscription event.
+    """
+    if resolver is None or resolver is identity_resolve or getattr(resolver, "on_event_loop", False):
+        return True
+    return isinstance(resolver, partial) and resolver.func in DEFAULT_RESOLVERS
+
+
+def call_in_thread(next, root, info, args):
+    result = next(root, info, **args)
+    # Lazy querysets have to be evaluated here, not when graphql-core
+    # iterates them on the event loop.
+    if isinstance(result, Manager):
+        result = result.all()
+    if isinstance(result, QuerySet):
+        result = list(result)
+    return result
+
+
+class ThreadedResolverMiddleware:
+    """Run synchronous resolvers in the request's thread, off the event loop.
+
+    The innermost middleware of ``AsyncCRMGraphQLView``.  Resolvers of a
+    request share one thread (and so one database connection) with the
+    async ORM calls of that request, as Django's ``sync_to_async`` does.
+    """
+
+    def resolve(self, next, root, info, **args):
+        if on_event_loop(info.parent_type.fields[info.field_name].resolve):
+            return next(root, info, **args)
+        return sync_to_async(call_in_thread)(next, root, info, args)
@@ -0,0 +1,390 @@
+import asyncio
+import datetime
+import io
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import importer, rollups
+from .importer import FIRST_NAMES, LAST_NAMES, PRODUCT_WORDS
+from .models import Customer, Order, Product
+from .pagination import encode_cursor, ordering, sort_keys
+
+
+def execute(query, variables=None):
+    from alx_backend_graphql.schema import schema
+
+    result = schema.execute(query, variables=variables, context_value=RequestFactory().post("/graphql"))
+    if result.errors:
+        raise RuntimeError(result.errors)
+    return result.data
+
+
+def timed(func, repeat=5):
+    """Median wall time of ``func`` in milliseconds, after one warm-up call."""
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def seed(orders, customers=1000, products=0, days=730, batch_size=10000, seed=0, stdout=None):
+    """Bulk insert customers, products and ``orders`` spread over ``days``.
+
+    Rows go in with ``bulk_create`` and without product links or rollup
+    rows; only what the benchmarks read.  Tables that already hold enough
+    rows are left alone, so a kept database is reused.
+    """
+    rng = random.Random(seed)
+
+    def fill(model, count, build):
+        start = model.objects.count()
+        for offset in range(start, count, batch_size):
+            model.objects.bulk_create([build(i) for i in range(offset, min(offset + batch_size, count))])
+            if stdout:
+                stdout.write(f"seeded {min(offset + batch_size, count)} {model._meta.verbose_name_plural}")
+
+    def customer(i):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return Customer(name=f"{first} {last}", email=f"{first}.{last}{i}@example.com".lower())
+
+    fill(Customer, customers, customer)
+    fill(Product, products, lambda i: Product(
+        name=f"{rng.choice(PRODUCT_WORDS)} {rng.choice(PRODUCT_WORDS)} {i}",
+        price=rng.randint(100, 50000) / 100,
+        stock=rng.randint(0, 500),
+    ))
+    customer_ids = list(Customer.objects.values_list("pk", flat=True))
+    now = timezone.now()
+    fill(Order, orders, lambda i: Order(
+        customer_id=rng.choice(customer_ids),
+        total_amount=rng.randint(100, 100000) / 100,
+        order_date=now - datetime.timedelta(seconds=rng.randrange(days * 86400)),
+    ))
+
+
+PAGE_QUERY = """
+query ($first: Int, $offset: Int, $after: String) {
+    allOrders(orderBy: ["-order_date"], first: $first, offset: $offset, after: $after) {
+        edges { node { id orderDate totalAmount } }
+        pageInfo { hasNextPage endCursor }
+    }
+}
+"""
+
+
+def pagination(depths, page_size=20, repeat=5):
+    """Latency of one ``allOrders`` page at each depth, OFFSET vs keyset.
+
+    Yields ``(depth, offset_ms, keyset_ms)``.
+    """
+    queryset = Order.objects.order_by("-order_date")
+    keys = sort_keys(queryset)
+    ordered = queryset.order_by(*ordering(keys))
+    for depth in depths:
+        offset_ms = timed(lambda: execute(PAGE_QUERY, {"first": page_size, "offset": depth}), repeat)
+        after = encode_cursor(ordered[depth - 1], keys) if depth else None
+        keyset_ms = timed(lambda: execute(PAGE_QUERY, {"first": page_size, "after": after}), repeat)
+        yield depth, offset_ms, keyset_ms
+
+
+def filter_cases(now=None):
+    """``(label, before query, after query)`` for the filter benchmark.
+
+    The before query is what clients could send without ``search``; an
+    after query of ``None`` repeats it.  Pages select ``totalCount`` so the
+    whole filter is evaluated, not just the rows up to the first page.
+    """
+    day = (now or timezone.now()).date() - datetime.timedelta(days=100)
+    week = f'orderDate_Gte: "{day}", orderDate_Lte: "{day + datetime.timedelta(days=7)}"'
+    customers = "totalCount edges { node { id name } }"
+    products = "totalCount edges { node { id name } }"
+    orders = "totalCount edges { node { id totalAmount } }"
+    return [
+        ("customer name", f'{{ allCustomers(name: "thompson", first: 20) {{ {customers} }} }}',
+         f'{{ allCustomers(search: "thompson", first: 20) {{ {customers} }} }}'),
+        ("customer email", f'{{ allCustomers(email: "ruby.hall12", first: 20) {{ {customers} }} }}',
+         f'{{ allCustomers(search: "ruby.hall12", first: 20) {{ {customers} }} }}'),
+        ("product name", f'{{ allProducts(name: "hub cable", first: 20) {{ {products} }} }}',
+         f'{{ allProducts(search: "hub cable", first: 20) {{ {products} }} }}'),
+        ("low stock", f"{{ allProducts(stock_Lte: 2, first: 20) {{ {products} }} }}", None),
+        ("orders in a week", f"{{ allOrders({week}, first: 20) {{ {orders} }} }}", None),
+        ("orders over 999.9", f'{{ allOrders(totalAmount_Gte: "999.9", first: 20) {{ {orders} }} }}', None),
+        ("a customer's week", f"{{ allCustomers(first: 1) {{ edges {{ node {{ orders({week}) {{ {orders} }} }} }} }} }}",
+         None),
+    ]
+
+
+def run_queries(cases, repeat=5):
+    """Median latency per case; the after query defaults to the before one."""
+    return {label: timed(lambda: execute(query), repeat) for label, query in cases}
+
+
+# ==============================
+# Suite
+# ==============================
+def populate(customers, products, orders, seed=0):
+    """Seed linked customers, products and orders through the importer.
+
+    Unlike ``seed`` this writes order/product links and the sales rollup,
+    which nested pages and the report queries read.  A database that
+    already has customers is reused as is.
+    """
+    if Customer.objects.exists():
+        return
+    for kind, count in (("customers", customers), ("products", products)):
+        importer.run(kind, {"kind": kind, "count": count, "seed": seed})
+    product_ids = list(Product.objects.values_list("pk", flat=True))
+    stats = importer.run("orders", {
+        "kind": "orders", "count": orders, "seed": seed, "customers": customers, "product_ids": product_ids,
+    })
+    rollups.refresh_days(stats.days)
+
+
+NESTED_ORDERS = """{
+    allOrders(orderBy: ["-order_date"], first: 20) { edges { node {
+        id totalAmount orderDate
+        customer { name email }
+        products { edges { node { name price } } }
+    } } }
+}"""
+FILTERED_CUSTOMERS = """{
+    allCustomers(name: "smith", first: 20) { edges { node {
+        name email orders(first: 5) { edges { node { totalAmount } } }
+    } } }
+}"""
+
+
+def suite_cases():
+    """``(name, query, variables)`` for every benchmarked operation.
+
+    Mutation variables are fixed: each run is rolled back, so the same
+    customer email or stock level is valid every time.
+    """
+    customer_id = Customer.objects.order_by("pk").values_list("pk", flat=True).first()
+    product_ids = [str(pk) for pk in Product.objects.filter(stock__gte=100).order_by("pk").values_list("pk", flat=True)[:3]]
+    batch = range(50)
+    return [
+        ("allOrders nested page", NESTED_ORDERS, None),
+        ("allCustomers filtered", FILTERED_CUSTOMERS, None),
+        ("allCustomers search", '{ allCustomers(search: "thompson", first: 20) { edges { node { name email } } } }',
+         None),
+        ("totalRevenue", "{ totalRevenue }", None),
+        ("salesTrend by month", "{ salesTrend(period: MONTH) { period orders revenue } }", None),
+        ("createCustomer",
+         "mutation ($email: String!) { createCustomer(name: \"Bench\", email: $email) { customer { id } } }",
+         {"email": "bench@example.com"}),
+        ("createProduct", 'mutation { createProduct(name: "Bench", price: 9.99, stock: 5) { product { id } } }', None),
+        ("createOrder",
+         "mutation ($customer: ID!, $products: [ID!]) "
+         "{ createOrder(customerId: $customer, productIds: $products) { order { id totalAmount } } }",
+         {"customer": customer_id, "products": product_ids}),
+        ("updateLowStockProducts", "mutation { updateLowStockProducts { updatedCount } }", None),
+        ("bulkCreateCustomers x50",
+         "mutation ($input: [CustomerInput!]!) { bulkCreateCustomers(input: $input) { createdCount } }",
+         {"input": [{"name": f"Bench {i}", "email": f"bench{i}@example.com"} for i in batch]}),
+        ("bulkCreateProducts x50",
+         "mutation ($input: [ProductInput!]!) { bulkCreateProducts(input: $input) { createdCount } }",
+         {"input": [{"name": f"Bench {i}", "price": 1.5, "stock": 10} for i in batch]}),
+        ("bulkCreateOrders x50",
+         "mutation ($input: [OrderInput!]!) { bulkCreateOrders(input: $input) { createdCount } }",
+         {"input": [{"customerId": customer_id, "productIds": product_ids} for _ in batch]}),
+    ]
+
+
+def rolled_back(func):
+    def run():
+        with transaction.atomic():
+            func()
+            transaction.set_rollback(True)
+    return run
+
+
+def measure(func, repeat=20):
+    """Latency percentiles in ms, SQL queries and peak traced memory of ``func``.
+
+    Queries and memory come from one extra, instrumented call, so neither
+    slows down the timed ones.  ``repeat`` must be at least 2.
+    """
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50": cuts[49], "p95": cuts[94], "max": max(samples),
+        "queries": len(queries), "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run_suite(cases, repeat=20):
+    """``{name: measure(...)}`` with every operation rolled back after each run."""
+    return {
+        name: measure(rolled_back(lambda query=query, variables=variables: execute(query, variables)), repeat)
+        for name, query, variables in cases
+    }
+
+
+def compare(results, baseline, threshold=0.25, min_delta_ms=1.0):
+    """Regressions of ``results`` against ``baseline`` as messages.
+
+    A case regresses when its median is more than ``threshold`` (a
+    fraction) and ``min_delta_ms`` slower, when it runs more queries, or
+    when its peak memory grows by more than ``threshold``.  Cases missing
+    from either side are not compared.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        slower = result["p50"] - before["p50"]
+        if result["p50"] > before["p50"] * (1 + threshold) and slower > min_delta_ms:
+            regressions.append(f"{name}: p50 {before['p50']:.2f} -> {result['p50']:.2f} ms")
+        if result["queries"] > before["queries"]:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        if result["peak_kb"] > before["peak_kb"] * (1 + threshold):
+            regressions.append(f"{name}: peak memory {before['peak_kb']} -> {result['peak_kb']} KiB")
+    return regressions
+
+
+# ==============================
+# WSGI vs ASGI load
+# ==============================
+DASHBOARD_QUERY = """{
+    totalCustomers totalOrders totalRevenue
+    salesTrend(period: MONTH) { period orders revenue }
+    allOrders(orderBy: ["-order_date"], first: 10) { edges { node { id totalAmount customer { name } } } }
+}"""
+
+
+def wsgi_call(app, path, body):
+    environ = {
+        "REQUEST_METHOD": "POST", "PATH_INFO": path, "QUERY_STRING": "", "SCRIPT_NAME": "",
+        "CONTENT_TYPE": "application/json", "CONTENT_LENGTH": str(len(body)), "HTTP_HOST": "localhost",
+        "SERVER_NAME": "localhost", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.input": io.BytesIO(body), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+        "wsgi.version": (1, 0), "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+    }
+    status = []
+    response = app(environ, lambda value, headers, exc_info=None: status.append(value))
+    try:
+        b"".join(response)
+    finally:
+        response.close()
+    if not status[0].startswith("200"):
+        raise RuntimeError(f"{path}: {status[0]}")
+
+
+async def asgi_call(app, path, body):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    sent = False
+    status = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Django listens for a disconnect until the response is sent.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    if status[0] != 200:
+        raise RuntimeError(f"{path}: {status[0]}")
+
+
+def wsgi_load(path, query, clients, requests, threads):
+    """Closed-loop load on the WSGI app: ``clients`` callers, ``threads`` server threads.
+
+    Returns ``(requests per second, latencies in ms)``; latency includes
+    waiting for a free server thread.
+    """
+    from django.core.wsgi import get_wsgi_application
+
+    app, body = get_wsgi_application(), json.dumps({"query": query}).encode()
+    server = threading.Semaphore(threads)
+    latencies = []
+
+    def client(count):
+        for _ in range(count):
+            start = time.perf_counter()
+            with server:
+                wsgi_call(app, path, body)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(client, [requests // clients] * clients))
+    return len(latencies) / (time.perf_counter() - start), latencies
+
+
+def asgi_load(path, query, clients, requests):
+    """Closed-loop load on the ASGI app from ``clients`` tasks on one event loop."""
+    from django.core.asgi import get_asgi_application
+
+    app, body = get_asgi_application(), json.dumps({"query": query}).encode()
+    latencies = []
+
+    async def client(count):
+        for _ in range(count):
+            start = time.perf_counter()
+            await asgi_call(app, path, body)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    async def run():
+        await asyncio.gather(*(client(requests // clients) for _ in range(clients)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return len(latencies) / (time.perf_counter() - start), latencies
+
+
+def load(concurrency, requests=200, threads=8, query=DASHBOARD_QUERY):
+    """Throughput and latency of ``query`` for each server mode and client count.
+
+    Yields ``(mode, clients, requests per second, p50 ms, p95 ms)`` for the
+    WSGI view under WSGI, and the WSGI and async views under ASGI.
+    """
+    modes = [
+        ("wsgi /graphql", lambda clients: wsgi_load("/graphql", query, clients, requests, threads)),
+        ("asgi /graphql", lambda clients: asgi_load("/graphql", query, clients, requests)),
+        ("asgi /graphql/async", lambda clients: asgi_load("/graphql/async", query, clients, requests)),
+    ]
+    for clients in concurrency:
+        for mode, run in modes:
+            run(clients)
+            throughput, latencies = run(clients)
+            cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+            yield mode, clients, throughput, cuts[49], cuts[94]
@@ -0,0 +1,171 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from . import pubsub, response_cache, rollups
+from .models import Customer, Product, Order
+
+DEFAULT_BATCH_SIZE = 500
+# Keys per IN (...) lookup; stays under SQLite's bound-parameter limit.
+LOOKUP_SIZE = 900
+
+
+def batch_size_or_default(batch_size=None):
+    return batch_size or getattr(settings, "CRM_BULK_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+
+
+def chunked(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def existing(model, field, values):
+    """Which of ``values`` already exist in ``model.field``, via IN lookups."""
+    found = set()
+    for chunk in chunked(set(values), LOOKUP_SIZE):
+        found.update(model.objects.filter(**{f"{field}__in": chunk}).values_list(field, flat=True))
+    return found
+
+
+def to_decimal(value):
+    try:
+        return Decimal(str(value)).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def finish(instances, errors, all_or_nothing, insert):
+    """Insert the valid instances in one transaction and build per-item results."""
+    if all_or_nothing and any(errors):
+        for item_errors in errors:
+            if not item_errors:
+                item_errors.append("Not created: other items in the batch are invalid.")
+    valid = [obj for obj, item_errors in zip(instances, errors) if not item_errors]
+    if valid:
+        with transaction.atomic():
+            insert(valid)
+            # bulk_create sends no signals.
+            response_cache.invalidate()
+    return [
+        {"index": index, "success": not item_errors, "instance": None if item_errors else obj, "errors": item_errors}
+        for index, (obj, item_errors) in enumerate(zip(instances, errors))
+    ]
+
+
+def create_customers(items, batch_size=None, all_or_nothing=False):
+    batch_size = batch_size_or_default(batch_size)
+    errors = [[] for _ in items]
+    instances = []
+    seen = set()
+    taken = existing(Customer, "email", [(item.get("email") or "").strip() for item in items])
+    for item, item_errors in zip(items, errors):
+        name = (item.get("name") or "").strip()
+        email = (item.get("email") or "").strip()
+        if not name:
+            item_errors.append("Name is required.")
+        try:
+            validate_email(email)
+        except ValidationError:
+            item_errors.append(f"Invalid email: {email!r}.")
+        if email in taken:
+            item_errors.append(f"Email already exists: {email}.")
+        elif email in seen:
+            item_errors.append(f"Duplicate email in batch: {email}.")
+        seen.add(email)
+        instances.append(Customer(name=name, email=email, phone=item.get("phone") or None))
+
+    def insert(valid):
+        Customer.objects.bulk_create(valid, batch_size=batch_size)
+
+    return finish(instances, errors, all_or_nothing, insert)
+
+
+def create_products(items, batch_size=None, all_or_nothing=False):
+    batch_size = batch_size_or_default(batch_size)
+    errors = [[] for _ in items]
+    instances = []
+    for item, item_errors in zip(items, errors):
+        name = (item.get("name") or "").strip()
+        price = to_decimal(item.get("price"))
+        stock = item.get("stock", 0)
+        if not name:
+            item_errors.append("Name is required.")
+        if price is None or price < 0:
+            item_errors.append("Price must be a non-negative number.")
+        if stock is None or stock < 0:
+            item_errors.append("Stock must be a non-negative integer.")
+        instances.append(Product(name=name, price=price, stock=stock))
+
+    def insert(valid):
+        Product.objects.bulk_create(valid, batch_size=batch_size)
+        for product in valid:
+            pubsub.stock_changed(product.pk, None, product.stock)
+
+    return finish(instances, errors, all_or_nothing, insert)
+
+
+def create_orders(items, batch_size=None, all_or_nothing=False):
+    """Create orders and their product links with two bulk inserts.
+
+    When an item has no ``total_amount`` it is the sum of its products'
+    prices.  A product listed twice is linked, and priced, once.
+    """
+    batch_size = batch_size_or_default(batch_size)
+    errors = [[] for _ in items]
+    customer_ids = existing(Customer, "pk", filter(None, (_pk(item["customer_id"]) for item in items)))
+    products = {}
+    product_ids = {_pk(pid) for item in items for pid in item.get("product_ids") or []}
+    for chunk in chunked(filter(None, product_ids), LOOKUP_SIZE):
+        products.update(Product.objects.only("price").in_bulk(chunk))
+
+    instances, product_lists = [], []
+    for item, item_errors in zip(items, errors):
+        customer_id = _pk(item["customer_id"])
+        product_ids = list(dict.fromkeys(_pk(pid) for pid in item.get("product_ids") or []))
+        if customer_id not in customer_ids:
+            item_errors.append(f"Customer not found: {item['customer_id']}.")
+        if not product_ids:
+            item_errors.append("At least one product is required.")
+        missing = list(dict.fromkeys(str(raw) for raw in item.get("product_ids") or [] if _pk(raw) not in products))
+        if missing:
+            item_errors.append(f"Products not found: {', '.join(missing)}.")
+        total = item.get("total_amount")
+        if total is None:
+            total = sum((products[pid].price for pid in product_ids if pid in products), Decimal("0"))
+        total = to_decimal(total)
+        if total is None or total < 0:
+            item_errors.append("Total amount must be a non-negative number.")
+        order = Order(customer_id=customer_id, total_amount=total)
+        if item.get("order_date"):
+            order.order_date = item["order_date"]
+        instances.append(order)
+        product_lists.append(product_ids)
+
+    def insert(valid):
+        Order.objects.bulk_create(valid, batch_size=batch_size)
+        links = dict(zip(map(id, instances), product_lists))
+        Order.products.through.objects.bulk_create(
+            [
+                Order.products.through(order_id=order.pk, product_id=pid)
+                for order in valid
+                for pid in links[id(order)]
+            ],
+            batch_size=batch_size,
+        )
+        # bulk_create sends no signals, so refresh the rollup and publish explicitly.
+        rollups.refresh_orders(valid)
+        for order in valid:
+            pubsub.order_created(order.pk)
+
+    return finish(instances, errors, all_or_nothing, insert)
+
+
+def _pk(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,184 @@
+import logging
+
+from celery import chord, group
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from . import joblog, locks
+from .locks import Lease, record_run
+from .models import ChunkedRun, ChunkResult, JobRun
+
+DEFAULTS = {
+    # Primary keys per chunk; each chunk is one Celery task.
+    "CHUNK_SIZE": 10000,
+    # Seconds of lease per chunk still to run, on top of the lease TTL, so a
+    # run whose chunks wait behind a long queue keeps its lease.
+    "LEASE_PER_CHUNK": 60,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "CRM_CHUNKED_JOBS", {})}
+
+
+def lease_ttl(chunks):
+    """Seconds a run with ``chunks`` chunks left holds its lease without news from a chunk."""
+    return locks.get_options()["TTL"] + chunks * get_options()["LEASE_PER_CHUNK"]
+
+
+class ChunkedJob:
+    """A job whose work splits over primary-key ranges of ``model``.
+
+    ``start`` cuts ``queryset`` into ranges of ``CHUNK_SIZE`` keys, Celery
+    runs ``process`` on every range in parallel, and ``aggregate`` combines
+    their results once all are done.  ``process`` gets ``[start, end)``
+    and returns JSON; its database writes commit together with the chunk's
+    ``ChunkResult``, so a redelivered chunk does not do them twice.
+    """
+
+    name = None
+    model = None
+
+    def prepare(self, params):
+        """The run's parameters, fixed once when it starts; must be JSON."""
+        return params
+
+    def queryset(self, params):
+        return self.model._default_manager.all()
+
+    def process(self, start, end, params):
+        raise NotImplementedError
+
+    def aggregate(self, results, params):
+        return results
+
+
+_jobs = {}
+
+
+def register(cls):
+    """Class decorator adding a ``ChunkedJob`` under its ``name``."""
+    _jobs[cls.name] = cls()
+    return cls
+
+
+def get_job(name):
+    from . import jobs  # noqa: F401  registers the CRM jobs
+
+    try:
+        return _jobs[name]
+    except KeyError:
+        raise ValueError(f"Unknown chunked job: {name!r}.")
+
+
+def id_ranges(queryset, size):
+    """``[(start, end), ...]`` covering the primary keys of ``queryset``, ``size`` keys each.
+
+    Two indexed lookups, whatever the row count; gaps in the keys make
+    some chunks lighter than others.
+    """
+    bounds = queryset.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return []
+    return [(start, min(start + size, bounds["last"] + 1)) for start in range(bounds["first"], bounds["last"] + 1, size)]
+
+
+def start(name, chunk_size=None, **params):
+    """Start a run of job ``name`` and return its ``ChunkedRun``.
+
+    The chunks are sent once the current transaction commits, as a chord
+    whose callback aggregates their results.  The run holds the job's
+    lease (``crm.locks``) until then or until a chunk fails; the lease
+    lasts ``lease_ttl`` of the chunks left and is renewed as each
+    completes.  While another run holds it, the start is recorded as
+    skipped and ``None`` returned.
+    """
+    from .tasks import fail_chunked_run, finish_chunked_run, process_chunk
+
+    started_at = timezone.now()
+    lease = Lease.acquire(name)
+    if lease is None:
+        record_run(name, started_at, JobRun.SKIPPED)
+        return None
+    job = get_job(name)
+    params = job.prepare(params)
+    ranges = id_ranges(job.queryset(params), chunk_size or get_options()["CHUNK_SIZE"])
+    run = ChunkedRun.objects.create(
+        job=name, params=params, chunks=len(ranges), lock_token=lease.token, started_at=started_at
+    )
+    lease.ttl = lease_ttl(len(ranges))
+    lease.renew()
+    failed = fail_chunked_run.s(run.pk)
+    finish = finish_chunked_run.si(run.pk).on_error(failed)
+    if ranges:
+        header = group(
+            process_chunk.si(run.pk, index, *bounds).on_error(failed) for index, bounds in enumerate(ranges)
+        )
+        transaction.on_commit(lambda: chord(header, finish).apply_async())
+    else:
+        transaction.on_commit(finish.apply_async)
+    return run
+
+
+def run_chunk(run_id, index, start, end):
+    """Process chunk ``index`` of a run once; a repeat returns the saved result."""
+    run = ChunkedRun.objects.get(pk=run_id)
+    job = get_job(run.job)
+    try:
+        with transaction.atomic():
+            done = ChunkResult.objects.filter(run=run, index=index).first()
+            if done is not None:
+                return done.result
+            with joblog.job(run.job):
+                result = job.process(start, end, run.params)
+            ChunkResult.objects.create(run=run, index=index, result=result)
+    except IntegrityError:
+        # Another delivery of the chunk committed first and its work stands.
+        done = ChunkResult.objects.filter(run=run, index=index).first()
+        if done is None:
+            raise
+        return done.result
+    # Each chunk done keeps the run's lease alive for the chunks left.
+    Lease(run.job, run.lock_token, lease_ttl(run.chunks - run.results.count())).renew()
+    return result
+
+
+def finish_run(run_id):
+    """Aggregate the chunk results of a run, once."""
+    with transaction.atomic():
+        run = ChunkedRun.objects.select_for_update().get(pk=run_id)
+        if run.finished_at is None:
+            results = list(run.results.order_by("index").values_list("result", flat=True))
+            with joblog.job(run.job):
+                run.result = get_job(run.job).aggregate(results, run.params)
+            run.finished_at = timezone.now()
+            run.save(update_fields=["result", "finished_at"])
+            Lease(run.job, run.lock_token).release()
+            record_run(run.job, run.started_at, JobRun.SUCCESS)
+    return run.result
+
+
+def fail_run(run_id, error):
+    """End a run whose chunk or aggregation failed: free its lease and record the failure, once."""
+    with transaction.atomic():
+        run = ChunkedRun.objects.select_for_update().get(pk=run_id)
+        if run.finished_at is None:
+            joblog.log("Chunked run failed", logging.ERROR, job=run.job, run=run.pk, error=error)
+            run.result = {"error": error}
+            run.finished_at = timezone.now()
+            run.save(update_fields=["result", "finished_at"])
+            Lease(run.job, run.lock_token).release()
+            record_run(run.job, run.started_at, JobRun.FAILURE, error)
+
+
+def progress(run_id):
+    run = ChunkedRun.objects.get(pk=run_id)
+    return {
+        "job": run.job,
+        "chunks": run.chunks,
+        "completed": run.results.count(),
+        "finished": run.finished_at is not None,
+        "result": run.result,
+    }
@@ -0,0 +1,123 @@
+from django.conf import settings
+from graphql import GraphQLError, get_named_type, is_list_type, is_non_null_type
+from graphql.execution.values import get_argument_values
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode, OperationDefinitionNode
+from graphene_django.settings import graphene_settings
+
+DEFAULTS = {
+    "MAX_COST": 50000,
+    "MAX_DEPTH": 8,
+    # Assumed size of plain lists, whose length the client cannot bound.
+    "DEFAULT_LIST_SIZE": 20,
+}
+
+# Relay plumbing that nests the AST without nesting the data.
+CONNECTION_FIELDS = {"edges", "node", "pageInfo"}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "GRAPHQL_QUERY_COST", {})}
+
+
+class QueryCost:
+    """Estimates how many objects an operation can resolve, before executing it.
+
+    Each field costs one per parent object it is resolved on.  A connection
+    multiplies the cost of everything below it by its ``first``/``last``
+    (or the relay max limit when neither is given) and a plain list by
+    ``DEFAULT_LIST_SIZE``.  Depth counts nested relations, not Relay plumbing.
+    """
+
+    def __init__(self, schema, document, variables=None, operation_name=None, options=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.options = options or get_options()
+        self.fragments = {}
+        self.operation = None
+        for definition in document.definitions:
+            if isinstance(definition, OperationDefinitionNode):
+                if operation_name is None or (definition.name and definition.name.value == operation_name):
+                    self.operation = self.operation or definition
+            else:
+                self.fragments[definition.name.value] = definition
+        self.cost = 0
+        self.depth = 0
+
+    def analyze(self):
+        if self.operation is not None:
+            root = self.schema.get_root_type(self.operation.operation)
+            self.visit(root, self.operation.selection_set.selections, 1, 0)
+        return self
+
+    def visit(self, parent_type, selections, multiplier, depth):
+        for selection in selections:
+            if isinstance(selection, FieldNode):
+                self.visit_field(parent_type, selection, multiplier, depth)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value)
+                self.visit(fragment_type, selection.selection_set.selections, multiplier, depth)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is not None:
+                    fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                    self.visit(fragment_type, fragment.selection_set.selections, multiplier, depth)
+
+    def visit_field(self, parent_type, node, multiplier, depth):
+        name = node.name.value
+        if name.startswith("__") or not hasattr(parent_type, "fields"):
+            return
+        field = parent_type.fields.get(name)
+        if field is None:
+            return
+        self.cost += multiplier
+        if not node.selection_set:
+            return
+
+        field_type = field.type
+        if is_non_null_type(field_type):
+            field_type = field_type.of_type
+        named_type = get_named_type(field_type)
+        if "edges" in getattr(named_type, "fields", {}) and "first" in field.args:
+            multiplier *= self.page_size(field, node)
+        elif is_list_type(field_type) and name not in CONNECTION_FIELDS:
+            multiplier *= self.options["DEFAULT_LIST_SIZE"]
+        if name not in CONNECTION_FIELDS:
+            depth += 1
+            self.depth = max(self.depth, depth)
+        self.visit(named_type, node.selection_set.selections, multiplier, depth)
+
+    def page_size(self, field, node):
+        try:
+            args = get_argument_values(field, node, self.variables)
+        except GraphQLError:
+            args = {}
+        size = args.get("first") or args.get("last")
+        max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        if not size:
+            return max_limit or self.options["DEFAULT_LIST_SIZE"]
+        return min(size, max_limit) if max_limit else size
+
+    def errors(self):
+        """Errors for an operation over budget; empty when it may run."""
+        errors = []
+        if self.depth > self.options["MAX_DEPTH"]:
+            errors.append(GraphQLError(
+                f"Query depth {self.depth} exceeds the maximum depth of {self.options['MAX_DEPTH']}.",
+                extensions={"code": "QUERY_TOO_DEEP"},
+            ))
+        if self.cost > self.options["MAX_COST"]:
+            errors.append(GraphQLError(
+                f"Query cost {self.cost} exceeds the maximum cost of {self.options['MAX_COST']}.",
+                extensions={"code": "QUERY_TOO_COMPLEX"},
+            ))
+        return errors
+
+    def extensions(self):
+        return {
+            "requested": self.cost,
+            "maximum": self.options["MAX_COST"],
+            "depth": self.depth,
+            "maxDepth": self.options["MAX_DEPTH"],
+        }
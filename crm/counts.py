@@ -0,0 +1,73 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import QuerySet
+
+DEFAULTS = {
+    "CACHE": "default",
+    # Seconds an exact count is reused as an approximate one.
+    "TIMEOUT": 300,
+    # Planner estimates below this are replaced by a (cached) exact count;
+    # small estimates are the least reliable and exact counts there are cheap.
+    "MIN_ESTIMATE": 10000,
+    "KEY_PREFIX": "graphql-count",
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "GRAPHQL_COUNTS", {})}
+
+
+def exact_count(iterable):
+    if isinstance(iterable, QuerySet):
+        return iterable.count()
+    return len(iterable)
+
+
+def planner_estimate(queryset):
+    """Rows the PostgreSQL planner expects ``queryset`` to return, or ``None``.
+
+    Other backends do not expose a row estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def cached_count(queryset, options=None):
+    """Exact count of ``queryset``, reused for ``TIMEOUT`` seconds."""
+    options = options or get_options()
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.sha256(json.dumps([queryset.db, sql, params], default=str).encode("utf-8")).hexdigest()
+    key = f"{options['KEY_PREFIX']}:{digest}"
+    cache = caches[options["CACHE"]]
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, options["TIMEOUT"])
+    return count
+
+
+def approximate_count(iterable):
+    """A count that may be stale or estimated but never scans on a hot path.
+
+    Large PostgreSQL results use the planner's estimate; everything else is
+    an exact count cached for ``GRAPHQL_COUNTS["TIMEOUT"]`` seconds.
+    """
+    if not isinstance(iterable, QuerySet):
+        return len(iterable)
+    options = get_options()
+    estimate = planner_estimate(iterable)
+    if estimate is not None and estimate >= options["MIN_ESTIMATE"]:
+        return estimate
+    return cached_count(iterable, options)
@@ -1,47 +1,25 @@
-import datetime
-from gql.transport.requests import RequestsHTTPTransport
-from gql import gql, Client
+import logging
 
+from . import joblog
+from .graphql_client import execute
+from .locks import single_flight
 
+
+@single_flight()
 def log_crm_heartbeat():
     """Log a heartbeat message every 5 minutes."""
-    timestamp = datetime.datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-    message = f"{timestamp} CRM is alive\n"
-
-    with open("/tmp/crm_heartbeat_log.txt", "a") as f:
-        f.write(message)
-
-    # Optional: query GraphQL hello endpoint with gql client
     try:
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql/",
-            verify=True,
-            retries=3,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        query = gql("{ hello }")
-        result = client.execute(query)
-
-        with open("/tmp/crm_heartbeat_log.txt", "a") as f:
-            f.write(f"{timestamp} GraphQL hello: {result}\n")
+        result = execute("{ hello }")
+        joblog.log("CRM is alive", hello=result.get("hello"))
     except Exception as e:
-        with open("/tmp/crm_heartbeat_log.txt", "a") as f:
-            f.write(f"{timestamp} GraphQL check failed: {str(e)}\n")
+        joblog.log("GraphQL check failed", logging.ERROR, error=str(e))
 
 
+@single_flight()
 def update_low_stock():
     """Run every 12 hours to restock low products via GraphQL mutation."""
-    timestamp = datetime.datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-
     try:
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql/",
-            verify=True,
-            retries=3,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-
-        mutation = gql("""
+        result = execute("""
             mutation {
                 updateLowStockProducts {
                     success
@@ -53,13 +31,8 @@ def update_low_stock():
                 }
             }
         """)
-
-        result = client.execute(mutation)
         updates = result.get("updateLowStockProducts", {})
-
-        with open("/tmp/low_stock_updates_log.txt", "a") as f:
-            f.write(f"{timestamp} Update Result: {updates}\n")
+        joblog.log("Update result", success=updates.get("success"), updated_products=updates.get("updatedProducts"))
 
     except Exception as e:
-        with open("/tmp/low_stock_updates_log.txt", "a") as f:
-            f.write(f"{timestamp} Update failed: {str(e)}\n")
+        joblog.log("Update failed", logging.ERROR, error=str(e))
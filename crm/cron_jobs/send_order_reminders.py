@@ -1,60 +1,46 @@
 #!/usr/bin/env python3
 # send_order_reminders.py
 
+import os
 import sys
 import logging
-from datetime import datetime, timedelta
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
-
-# Configure logging
-log_file = "/tmp/order_reminders_log.txt"
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format="%(asctime)s - %(message)s",
-)
+
+# Run against the project in-process, unless pointed at a remote endpoint.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+if not os.environ.get("CRM_GRAPHQL_URL"):
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
+    django.setup()
+
+from crm import joblog  # noqa: E402
+from crm.reminders import send_order_reminders  # noqa: E402
+
+if not os.environ.get("CRM_GRAPHQL_URL"):
+    # One run at a time, across hosts, and never beside the Celery job.
+    from crm.locks import single_flight
+
+    send_order_reminders = single_flight("order_reminders")(send_order_reminders)
 
 def main():
-    try:
-        # Set up GraphQL client
-        transport = RequestsHTTPTransport(
-            url="http://localhost:8000/graphql",
-            verify=True,
-            retries=3,
-        )
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-
-        # Calculate cutoff date (7 days ago)
-        cutoff_date = (datetime.now() - timedelta(days=7)).date().isoformat()
-
-        # Define GraphQL query
-        query = gql("""
-        query GetRecentOrders($cutoff: Date!) {
-            orders(orderDate_Gte: $cutoff) {
-                id
-                customer {
-                    email
-                }
-            }
-        }
-        """)
-
-        # Execute query
-        result = client.execute(query, variable_values={"cutoff": cutoff_date})
-        orders = result.get("orders", [])
-
-        # Log each order
-        for order in orders:
-            order_id = order["id"]
-            customer_email = order["customer"]["email"]
-            logging.info(f"Reminder -> Order ID: {order_id}, Customer Email: {customer_email}")
-
-        print("Order reminders processed!")
-
-    except Exception as e:
-        logging.error(f"Error processing reminders: {str(e)}")
-        print(f"Failed: {str(e)}", file=sys.stderr)
+    # Records go to the shared job log (crm.joblog), flushed at exit.
+    with joblog.job("order_reminders"):
+        try:
+            # One reminder per customer for orders of the last 7 days, paged
+            # with keyset cursors; reruns skip orders already reminded.
+            result = send_order_reminders(days=7)
+            if result is None:
+                joblog.log("Skipped: order reminders are already running")
+                return
+            joblog.log("Processed", orders=result["orders"], sent=result["sent"], failed=len(result["failed"]))
+            for email in result["failed"]:
+                joblog.log("Reminder failed", logging.ERROR, email=email)
+
+            print("Order reminders processed!")
+
+        except Exception as e:
+            joblog.log("Error processing reminders", logging.ERROR, error=str(e))
+            print(f"Failed: {str(e)}", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from graphql import parse, validate
+
+DEFAULTS = {
+    "MAX_ENTRIES": 1000,
+    # Bound on the summed length of cached query texts; parsed ASTs grow in
+    # proportion to the text, so this caps the cache's memory footprint.
+    "MAX_BYTES": 4 * 1024 * 1024,
+}
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class DocumentCache:
+    """Thread-safe LRU of parsed, validated documents keyed by query sha256.
+
+    The same keys are the Automatic Persisted Query hashes, so the cache also
+    serves queries that clients send by hash alone.
+    """
+
+    def __init__(self, max_entries=DEFAULTS["MAX_ENTRIES"], max_bytes=DEFAULTS["MAX_BYTES"]):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return ``(query, document)`` for ``key`` or ``None``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key):
+        """Like ``get`` but without touching the LRU order or the counters."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, query, document):
+        size = len(query)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (query, document)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def get_or_parse(self, schema, query, rules=None, max_errors=None):
+        """Return ``(document, errors)``, parsing and validating only on a miss.
+
+        Only documents that validate are cached; errors are returned as-is.
+        """
+        key = query_hash(query)
+        entry = self.get(key)
+        if entry is not None:
+            return entry[1], []
+        document = parse(query)
+        errors = validate(schema, document, rules, max_errors)
+        if not errors:
+            self.put(key, query, document)
+        return document, errors
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def resolve_persisted_query(cache, query, extensions):
+    """Apply the Automatic Persisted Query protocol to one request.
+
+    Returns the query text to run.  A hash alone is looked up in ``cache``;
+    a hash sent with its query is checked against it.
+    """
+    persisted = (extensions or {}).get("persistedQuery")
+    if not persisted:
+        return query
+    if persisted.get("version") != 1:
+        raise PersistedQueryError("Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED")
+    sha = persisted.get("sha256Hash")
+    if query:
+        if query_hash(query) != sha:
+            raise PersistedQueryError("provided sha does not match query", "INVALID_SHA256_HASH")
+        return query
+    entry = cache.peek(sha)
+    if entry is None:
+        raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+    return entry[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_document_cache():
+    """The process-wide cache, sized from ``settings.GRAPHQL_DOCUMENT_CACHE``."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                options = {**DEFAULTS, **getattr(settings, "GRAPHQL_DOCUMENT_CACHE", {})}
+                _cache = DocumentCache(options["MAX_ENTRIES"], options["MAX_BYTES"])
+    return _cache
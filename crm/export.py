@@ -0,0 +1,129 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .filters import CustomerFilter, OrderFilter, ProductFilter
+from .models import Customer, Product, Order
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def customer_rows(queryset):
+    for customer in queryset:
+        yield {"id": customer.pk, "name": customer.name, "email": customer.email, "phone": customer.phone}
+
+
+def product_rows(queryset):
+    for product in queryset:
+        yield {"id": product.pk, "name": product.name, "price": product.price, "stock": product.stock}
+
+
+def order_rows(queryset):
+    for order in queryset:
+        products = order.products.all()
+        yield {
+            "id": order.pk,
+            "customer_id": order.customer_id,
+            "customer_name": order.customer.name,
+            "customer_email": order.customer.email,
+            "total_amount": order.total_amount,
+            "order_date": order.order_date,
+            "product_ids": [product.pk for product in products],
+            "product_names": [product.name for product in products],
+        }
+
+
+def order_queryset(queryset):
+    # The customer rides along in the row; products come in one query per
+    # chunk, which iterator(chunk_size) runs for each batch it fetches.
+    return queryset.select_related("customer").only(
+        "customer", "total_amount", "order_date", "customer__name", "customer__email"
+    ).prefetch_related(Prefetch("products", queryset=Product.objects.only("name").order_by("pk")))
+
+
+# kind: (model, filterset, queryset shaper, row builder, CSV columns)
+EXPORTS = {
+    "customers": (Customer, CustomerFilter, None, customer_rows, ["id", "name", "email", "phone"]),
+    "products": (Product, ProductFilter, None, product_rows, ["id", "name", "price", "stock"]),
+    "orders": (Order, OrderFilter, order_queryset, order_rows, [
+        "id", "customer_id", "customer_name", "customer_email", "total_amount", "order_date",
+        "product_ids", "product_names",
+    ]),
+}
+
+# Model permissions a user needs to export each kind; order rows carry the
+# customer's name and email.
+PERMISSIONS = {
+    "customers": ("crm.view_customer",),
+    "products": ("crm.view_product",),
+    "orders": ("crm.view_order", "crm.view_customer"),
+}
+
+
+def rows(kind, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream ``kind`` as dicts, filtered like the GraphQL connection.
+
+    ``params`` are the filterset's query parameters, e.g. ``{"name":
+    "ali"}``.  Rows come from a server-side cursor ``chunk_size`` at a
+    time in pk order, so memory does not grow with the table.
+    """
+    model, filterset_class, shape, build, _ = EXPORTS[kind]
+    filterset = filterset_class(params or {}, queryset=model.objects.order_by("pk"))
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    queryset = filterset.qs
+    if shape:
+        queryset = shape(queryset)
+    return build(queryset.iterator(chunk_size=chunk_size))
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+class _Line:
+    """File-like target that hands back what ``csv.writer`` writes."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, columns):
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(
+            [";".join(map(str, value)) if isinstance(value, list) else value for value in (row[c] for c in columns)]
+        )
+
+
+def lines(kind, fmt, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Serialized ``kind`` rows in ``fmt`` (``ndjson`` or ``csv``), one string per line."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    stream = rows(kind, params, chunk_size)
+    if fmt == "csv":
+        return csv_lines(stream, EXPORTS[kind][4])
+    return ndjson_lines(stream)
+
+
+def batched(lines, size=64 * 1024):
+    """Join lines into chunks of about ``size`` characters.
+
+    Each chunk becomes one write to the client and one gzip compress call,
+    instead of one per row.
+    """
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,162 @@
+from functools import partial
+
+import graphene
+from django.db.models import QuerySet
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+from graphql_relay import get_offset_with_default, offset_to_cursor
+from promise import Promise
+
+from .counts import approximate_count, exact_count
+from .loaders import get_loaders
+from .optimizer import optimize
+from .pagination import is_keyset_cursor, keyset_connection, sort_keys
+
+
+class CRMConnection(graphene.relay.Connection):
+    """Relay connection whose counts are only computed when selected."""
+
+    total_count = graphene.Int(description="Exact number of matching rows; one COUNT query.")
+    approximate_total_count = graphene.Int(
+        description="Cached or planner-estimated number of matching rows; may be stale."
+    )
+
+    class Meta:
+        abstract = True
+
+    def resolve_total_count(root, info):
+        return exact_count(root.iterable)
+
+    def resolve_approximate_total_count(root, info):
+        return approximate_count(root.iterable)
+
+
+class CRMConnectionField(DjangoFilterConnectionField):
+    """Filter connection field whose page nodes feed the request loaders.
+
+    Querysets are shaped by ``crm.optimizer`` for the client's selection
+    before the page is sliced.
+    Pass ``loader`` (an attribute name on ``crm.loaders.Loaders``) for a
+    nested relation: unfiltered requests are then answered by that loader,
+    keyed on the parent's pk, so every parent on a page shares one query.
+    With ``keyset=True`` querysets are paged by seeking past the cursor's
+    sort keys (see ``crm.pagination``) rather than by OFFSET, so deep pages
+    cost the same as the first one.
+    """
+
+    def __init__(self, *args, loader=None, keyset=False, order_by=None, **kwargs):
+        if order_by is not None:
+            # DjangoFilterConnectionField consumes an ``order_by`` keyword of
+            # its own, so mount the argument explicitly.
+            kwargs["args"] = {**kwargs.get("args", {}), "order_by": order_by}
+        self.loader = loader
+        self.keyset = keyset
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, **kwargs):
+        # Loader results are already scoped to the parent; nothing to filter.
+        if isinstance(iterable, list):
+            return iterable
+        queryset = super().resolve_queryset(connection, iterable, info, args, **kwargs)
+        return optimize(queryset, info)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        """Slice an OFFSET page without counting the queryset.
+
+        ``hasNextPage`` comes from fetching one row past the page.  Paging
+        backwards with ``last`` needs the length, so that keeps the parent's
+        COUNT.
+        """
+        iterable = maybe_queryset(iterable)
+        if not isinstance(iterable, QuerySet) or args.get("last") is not None or args.get("before"):
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+        start = get_offset_with_default(args.get("after"), -1) + 1 + (args.get("offset") or 0)
+        first = args.get("first")
+        if first is None:
+            first = max_limit
+        rows = list(iterable[start:] if first is None else iterable[start:start + first + 1])
+        edges = [connection.Edge(node=node, cursor=offset_to_cursor(start + i)) for i, node in enumerate(rows[:first])]
+        page = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=start > 0,
+                has_next_page=first is not None and len(rows) > first,
+            ),
+        )
+        page.iterable = iterable
+        return page
+
+    @classmethod
+    def resolve_keyset_connection(cls, connection, args, iterable, max_limit=None):
+        keys = sort_keys(iterable) if isinstance(iterable, QuerySet) else None
+        cursors = [args.get(name) for name in ("after", "before") if args.get(name)]
+        offset = args.get("offset") is not None
+        if keys is None or not all(map(is_keyset_cursor, cursors)) or (offset and not cursors):
+            return cls.resolve_connection(connection, args, iterable, max_limit=max_limit)
+        if offset:
+            raise GraphQLError("`offset` cannot be combined with a keyset cursor.")
+        return keyset_connection(connection, iterable, keys, args, max_limit=max_limit)
+
+    @classmethod
+    def connection_resolver(
+        cls, resolver, connection, default_manager, queryset_resolver, max_limit, enforce_first_or_last, keyset,
+        root, info, **args,
+    ):
+        if not keyset:
+            page = super().connection_resolver(
+                resolver, connection, default_manager, queryset_resolver, max_limit, enforce_first_or_last,
+                root, info, **args,
+            )
+        else:
+            # Same checks as the parent, then a keyset page instead of an OFFSET slice.
+            first, last = args.get("first"), args.get("last")
+            if enforce_first_or_last and not (first or last):
+                raise GraphQLError(f"You must provide a `first` or `last` value to properly paginate the `{info.field_name}` connection.")
+            for name, value in (("first", first), ("last", last)):
+                if max_limit and value and value > max_limit:
+                    raise GraphQLError(
+                        f"Requesting {value} records on the `{info.field_name}` connection exceeds the `{name}` limit of {max_limit} records."
+                    )
+            if args.get("offset") is not None and args.get("before") is not None:
+                raise GraphQLError(f"You can't provide a `before` value at the same time as an `offset` value to properly paginate the `{info.field_name}` connection.")
+            iterable = resolver(root, info, **args)
+            if iterable is None:
+                iterable = default_manager
+            iterable = queryset_resolver(connection, iterable, info, args)
+            on_resolve = partial(cls.resolve_keyset_connection, connection, args, max_limit=max_limit)
+            page = Promise.resolve(iterable).then(on_resolve) if Promise.is_thenable(iterable) else on_resolve(iterable)
+        return cls.track(page, info)
+
+    @classmethod
+    def track(cls, page, info):
+        if Promise.is_thenable(page):
+            return Promise.resolve(page).then(partial(cls.track, info=info))
+        get_loaders(info).track(edge.node for edge in page.edges)
+        return page
+
+    @staticmethod
+    def batched_resolver(loader, resolver, filtering_args, root, info, **args):
+        if any(args.get(name) is not None for name in filtering_args):
+            return resolver(root, info, **args)
+        return getattr(get_loaders(info), loader).load(root.pk)
+
+    def wrap_resolve(self, parent_resolver):
+        resolver = self.resolver or parent_resolver
+        if self.loader:
+            resolver = partial(self.batched_resolver, self.loader, resolver, tuple(self.filtering_args))
+        return partial(
+            self.connection_resolver,
+            resolver,
+            self.connection_type,
+            self.get_manager(),
+            self.get_queryset_resolver(),
+            self.max_limit,
+            self.enforce_first_or_last,
+            self.keyset,
+        )
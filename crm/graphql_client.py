@@ -0,0 +1,164 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+DEFAULT_URL = "http://localhost:8000/graphql"
+# Remote clients keep the introspected schema here for SCHEMA_TTL seconds.
+SCHEMA_CACHE = os.path.join(tempfile.gettempdir(), "crm_graphql_schema.json")
+SCHEMA_TTL = 24 * 60 * 60
+
+
+class GraphQLClientError(Exception):
+    """An operation returned errors; ``errors`` are the formatted errors."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(error.get("message", str(error)) for error in errors))
+
+
+class LocalClient:
+    """Executes operations against ``alx_backend_graphql.schema.schema`` in this process.
+
+    No HTTP and no introspection: each operation goes through the same
+    steps as one posted to ``/graphql`` (``crm.views.CRMGraphQLView``):
+    the shared document cache, the ``crm.cost`` budget, the response cache
+    and tracing.  ``info.context`` is a bare POST request.
+    """
+
+    def __init__(self, schema=None):
+        from .views import CRMGraphQLView
+
+        self.view = CRMGraphQLView(schema=schema)
+
+    def execute(self, query, variables=None, operation_name=None):
+        from django.http import HttpRequest
+        from graphene_django.views import HttpError
+
+        request = HttpRequest()
+        request.method = "POST"
+        try:
+            result = self.view.execute_graphql_request(request, {}, query, variables, operation_name)
+        except HttpError as e:
+            raise GraphQLClientError([{"message": e.message}])
+        if result.errors:
+            raise GraphQLClientError([self.view.format_error(error) for error in result.errors])
+        return result.data
+
+    def close(self):
+        pass
+
+
+class RemoteClient:
+    """Executes operations over HTTP, for jobs running outside Django.
+
+    One keep-alive session is held open across operations, and the schema
+    is introspected once per ``SCHEMA_TTL`` and kept in ``schema_cache``
+    instead of on every run.
+    """
+
+    def __init__(self, url=DEFAULT_URL, schema_cache=SCHEMA_CACHE, timeout=30, retries=3):
+        self.url = url
+        self.schema_cache = schema_cache
+        self.timeout = timeout
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._session = None
+
+    def transport(self):
+        from gql.transport.requests import RequestsHTTPTransport
+
+        return RequestsHTTPTransport(url=self.url, timeout=self.timeout, retries=self.retries)
+
+    def load_schema(self):
+        """The cached introspection result, refreshed when stale or for another URL."""
+        try:
+            with open(self.schema_cache) as f:
+                cached = json.load(f)
+            if cached["url"] == self.url and time.time() - os.path.getmtime(self.schema_cache) < SCHEMA_TTL:
+                return cached["introspection"]
+        except (OSError, ValueError, KeyError):
+            pass
+        from gql import Client, GraphQLRequest
+        from graphql import get_introspection_query
+
+        with Client(transport=self.transport()) as session:
+            introspection = session.execute(GraphQLRequest(parse_document(get_introspection_query())))
+        with open(self.schema_cache, "w") as f:
+            json.dump({"url": self.url, "introspection": introspection}, f)
+        return introspection
+
+    def session(self):
+        if self._session is None:
+            from gql import Client
+
+            client = Client(transport=self.transport(), introspection=self.load_schema())
+            self._session = client.connect_sync()
+        return self._session
+
+    def execute(self, query, variables=None, operation_name=None):
+        from gql import GraphQLRequest
+        from gql.transport.exceptions import TransportQueryError
+        from graphql import GraphQLError
+
+        with self._lock:
+            try:
+                request = GraphQLRequest(parse_document(query), variable_values=variables, operation_name=operation_name)
+                return self.session().execute(request)
+            except TransportQueryError as e:
+                raise GraphQLClientError(e.errors or [{"message": str(e)}])
+            except GraphQLError as e:
+                # Rejected by the local schema before sending.
+                raise GraphQLClientError([e.formatted])
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.client.close_sync()
+                self._session = None
+
+
+@lru_cache(maxsize=64)
+def parse_document(query):
+    from graphql import parse
+
+    return parse(query)
+
+
+def in_django():
+    try:
+        from django.apps import apps
+    except ImportError:
+        return False
+    return apps.ready
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client for cron jobs, Celery tasks and scripts.
+
+    In-process when Django is set up (django-crontab, Celery workers),
+    otherwise over HTTP to ``$CRM_GRAPHQL_URL``.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if in_django():
+                    _client = LocalClient()
+                else:
+                    _client = RemoteClient(
+                        os.environ.get("CRM_GRAPHQL_URL", DEFAULT_URL),
+                        os.environ.get("CRM_GRAPHQL_SCHEMA_CACHE", SCHEMA_CACHE),
+                    )
+    return _client
+
+
+def execute(query, variables=None, operation_name=None):
+    """Run ``query`` with the shared client and return its ``data``."""
+    return get_client().execute(query, variables, operation_name)
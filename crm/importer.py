@@ -0,0 +1,372 @@
+import csv
+import datetime
+import gzip
+import json
+import random
+import time
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+from multiprocessing import get_context
+
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.core.validators import validate_email
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .bulk import LOOKUP_SIZE, _pk, batch_size_or_default, chunked, existing, to_decimal
+from .models import Customer, Product, Order
+from .rollups import order_day
+
+KINDS = ("customers", "products", "orders")
+ON_CONFLICT = ("update", "skip", "error")
+# Invalid rows reported individually; the rest are only counted.
+MAX_REPORTED_ERRORS = 20
+
+FIRST_NAMES = ["Ava", "Ben", "Chloe", "Daniel", "Emma", "Felix", "Grace", "Henry", "Isla", "Jack",
+               "Kai", "Lena", "Mia", "Noah", "Olivia", "Paul", "Quinn", "Ruby", "Sam", "Tara"]
+LAST_NAMES = ["Smith", "Jones", "Brown", "Taylor", "Wilson", "Davies", "Evans", "Thomas", "Johnson", "Roberts",
+              "Walker", "Wright", "Robinson", "Thompson", "White", "Hughes", "Edwards", "Green", "Hall", "Wood"]
+PRODUCT_ADJECTIVES = ["Blue", "Compact", "Deluxe", "Ergonomic", "Heavy-duty", "Portable", "Smart", "Wireless"]
+PRODUCT_WORDS = ["Widget", "Gadget", "Cable", "Adapter", "Charger", "Monitor", "Keyboard", "Mouse", "Stand", "Hub"]
+
+
+class ImportStats:
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = self.created = self.updated = self.skipped = self.invalid = 0
+        self.errors = []
+        self.days = set()
+        self.elapsed = 0.0
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"row {line}: {message}")
+
+    def merge(self, other):
+        for name in ("rows", "created", "updated", "skipped", "invalid"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.errors = (self.errors + other.errors)[:MAX_REPORTED_ERRORS]
+        self.days |= other.days
+        # Shards run side by side: the import took as long as the slowest.
+        self.elapsed = max(self.elapsed, other.elapsed)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.kind}: {self.rows} rows in {self.elapsed:.1f}s ({self.rows_per_second:.0f} rows/s): "
+            f"{self.created} created, {self.updated} updated, {self.skipped} skipped, {self.invalid} invalid"
+        )
+
+
+# ==============================
+# Sources
+# ==============================
+def read_rows(path):
+    """Stream the rows of a ``.csv`` or ``.ndjson`` file, optionally ``.gz``."""
+    name = path[:-3] if path.endswith(".gz") else path
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        if name.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {key: value if value != "" else None for key, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def email_for(index):
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last = LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)]
+    return f"{first}.{last}.{index}@example.com".lower()
+
+
+def generate_rows(kind, indexes, rng, customers=0, product_ids=(), days=730):
+    """Synthetic rows for the given row indexes, in the import file format.
+
+    Customer ``i`` always gets the same email, so generated orders can refer
+    to generated customers from any shard.  Order customers are skewed
+    towards low indexes, giving a realistic share of repeat buyers.
+    """
+    now = timezone.now()
+    for i in indexes:
+        if kind == "customers":
+            email = email_for(i)
+            first, last = email.split(".")[:2]
+            phone = f"+1-555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}" if rng.random() < 0.7 else None
+            yield {"name": f"{first.title()} {last.title()}", "email": email, "phone": phone}
+        elif kind == "products":
+            yield {
+                "name": f"{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_WORDS)} {i}",
+                "price": f"{min(rng.lognormvariate(3.5, 1.0), 99999):.2f}",
+                "stock": rng.randint(0, 500),
+            }
+        else:
+            yield {
+                "customer_email": email_for(int(customers * rng.random() ** 2)),
+                "product_ids": rng.sample(product_ids, min(len(product_ids), rng.choice((1, 1, 1, 2, 2, 3, 4)))),
+                "order_date": (now - datetime.timedelta(seconds=rng.randrange(days * 86400))).isoformat(),
+            }
+
+
+def numbered_rows(source, shard, shards):
+    """``(line, row)`` pairs of one shard: every ``shards``-th row from ``shard``."""
+    if "path" in source:
+        rows = enumerate(read_rows(source["path"]), 1)
+        return ((line, row) for line, row in rows if (line - 1) % shards == shard)
+    indexes = range(shard, source["count"], shards)
+    rng = random.Random(f"{source.get('seed', 0)}:{source['kind']}:{shard}")
+    rows = generate_rows(
+        source["kind"], indexes, rng, source.get("customers", 0), source.get("product_ids", ()),
+    )
+    return zip((i + 1 for i in indexes), rows)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+# ==============================
+# Importers
+# ==============================
+# Every batch reads first, in autocommit, and then writes in one short
+# transaction.  SQLite refuses to upgrade a transaction that has already
+# read, and an insert that fires the search index triggers reads before
+# it writes, so on SQLite the shards also take turns at writing: parsing,
+# validation and lookups still run in parallel.
+_write_lock = None
+
+
+def _init_worker(lock):
+    global _write_lock
+    _write_lock = lock
+
+
+@contextmanager
+def writing():
+    with _write_lock or nullcontext(), transaction.atomic():
+        yield
+
+
+def apply_conflicts(objects, found, on_conflict, stats, lines, label):
+    """Drop ``found`` keys from ``objects`` unless they are to be updated.
+
+    Returns how many of the remaining objects update an existing row.
+    """
+    if on_conflict == "update":
+        return len(found)
+    for key in [key for key in objects if key in found]:
+        del objects[key]
+        if on_conflict == "skip":
+            stats.skipped += 1
+        else:
+            stats.error(lines[key], f"{label} already exists: {key}.")
+    return 0
+
+
+def upsert(model, objects, unique_field, update_fields, on_conflict, batch_size):
+    with writing():
+        if on_conflict == "update":
+            model.objects.bulk_create(
+                objects, batch_size=batch_size,
+                update_conflicts=True, unique_fields=[unique_field], update_fields=update_fields,
+            )
+        else:
+            # A concurrent shard may insert the same key after our lookup.
+            model.objects.bulk_create(objects, batch_size=batch_size, ignore_conflicts=on_conflict == "skip")
+
+
+def import_customers(rows, stats, batch_size, on_conflict="update"):
+    """Upsert customers on ``email``; a later row for the same email wins."""
+    for batch in batches(rows, batch_size):
+        customers, lines = {}, {}
+        for line, row in batch:
+            stats.rows += 1
+            name = (row.get("name") or "").strip()
+            email = (row.get("email") or "").strip()
+            if not name:
+                stats.error(line, "Name is required.")
+                continue
+            try:
+                validate_email(email)
+            except ValidationError:
+                stats.error(line, f"Invalid email: {email!r}.")
+                continue
+            if email in customers:
+                stats.skipped += 1
+            customers[email] = Customer(name=name, email=email, phone=row.get("phone") or None)
+            lines[email] = line
+        found = existing(Customer, "email", customers)
+        updated = apply_conflicts(customers, found, on_conflict, stats, lines, "Customer")
+        stats.updated += updated
+        stats.created += len(customers) - updated
+        if customers:
+            upsert(Customer, list(customers.values()), "email", ["name", "phone"], on_conflict, batch_size)
+
+
+def import_products(rows, stats, batch_size, on_conflict="update"):
+    """Create products; rows with an ``id`` keep it and upsert on it."""
+    for batch in batches(rows, batch_size):
+        keyed, new, lines = {}, [], {}
+        for line, row in batch:
+            stats.rows += 1
+            name = (row.get("name") or "").strip()
+            price = to_decimal(row.get("price"))
+            stock = _pk(row.get("stock") if row.get("stock") is not None else 0)
+            if not name:
+                stats.error(line, "Name is required.")
+            elif price is None or price < 0:
+                stats.error(line, "Price must be a non-negative number.")
+            elif stock is None or stock < 0:
+                stats.error(line, "Stock must be a non-negative integer.")
+            else:
+                pk = _pk(row.get("id"))
+                product = Product(pk=pk, name=name, price=price, stock=stock)
+                if pk is None:
+                    new.append(product)
+                else:
+                    keyed[pk] = product
+                    lines[pk] = line
+        found = existing(Product, "pk", keyed)
+        updated = apply_conflicts(keyed, found, on_conflict, stats, lines, "Product")
+        stats.updated += updated
+        stats.created += len(new) + len(keyed) - updated
+        if keyed:
+            upsert(Product, list(keyed.values()), "id", ["name", "price", "stock"], on_conflict, batch_size)
+        if new:
+            with writing():
+                Product.objects.bulk_create(new, batch_size=batch_size)
+
+
+def as_list(value):
+    if isinstance(value, str):
+        return [item for item in value.split(";") if item.strip()]
+    return list(value or [])
+
+
+def parse_order_date(value):
+    if not value:
+        return timezone.now()
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def import_orders(rows, stats, batch_size, on_conflict=None):
+    """Create orders, then their product links in one deferred insert per batch.
+
+    The customer is looked up by ``customer_email`` (or ``customer_id``);
+    a missing ``total_amount`` is the sum of the products' prices, each
+    product counted once however often it is listed.
+    """
+    for batch in batches(rows, batch_size):
+        emails = {row["customer_email"] for _, row in batch if row.get("customer_email")}
+        customers = {}
+        for chunk in chunked(emails, LOOKUP_SIZE):
+            customers.update(Customer.objects.filter(email__in=chunk).values_list("email", "pk"))
+        customer_ids = existing(Customer, "pk", filter(None, (_pk(row.get("customer_id")) for _, row in batch)))
+        prices = {}
+        product_ids = {_pk(pid) for _, row in batch for pid in as_list(row.get("product_ids"))}
+        for chunk in chunked(filter(None, product_ids), LOOKUP_SIZE):
+            prices.update(Product.objects.filter(pk__in=chunk).values_list("pk", "price"))
+
+        orders, links = [], []
+        for line, row in batch:
+            stats.rows += 1
+            if row.get("customer_email"):
+                customer_id = customers.get(row["customer_email"])
+            else:
+                customer_id = _pk(row.get("customer_id"))
+                customer_id = customer_id if customer_id in customer_ids else None
+            product_ids = list(dict.fromkeys(_pk(pid) for pid in as_list(row.get("product_ids"))))
+            missing = [str(pid) for pid in product_ids if pid not in prices]
+            total = row.get("total_amount")
+            total = to_decimal(total) if total is not None else sum(prices.get(pid, 0) for pid in product_ids)
+            order_date = parse_order_date(row.get("order_date"))
+            if customer_id is None:
+                stats.error(line, f"Customer not found: {row.get('customer_email') or row.get('customer_id')}.")
+            elif not product_ids:
+                stats.error(line, "At least one product is required.")
+            elif missing:
+                stats.error(line, f"Products not found: {', '.join(missing)}.")
+            elif total is None or total < 0:
+                stats.error(line, "Total amount must be a non-negative number.")
+            elif order_date is None:
+                stats.error(line, f"Invalid order date: {row.get('order_date')!r}.")
+            else:
+                orders.append(Order(customer_id=customer_id, total_amount=total, order_date=order_date))
+                links.append(product_ids)
+        if not orders:
+            continue
+        with writing():
+            Order.objects.bulk_create(orders, batch_size=batch_size)
+            Order.products.through.objects.bulk_create(
+                [
+                    Order.products.through(order_id=order.pk, product_id=pid)
+                    for order, pids in zip(orders, links)
+                    for pid in pids
+                ],
+                batch_size=batch_size,
+            )
+        stats.created += len(orders)
+        stats.days.update(order_day(order.order_date) for order in orders)
+
+
+IMPORTERS = {"customers": import_customers, "products": import_products, "orders": import_orders}
+
+
+# ==============================
+# Running
+# ==============================
+def run_shard(kind, source, shard=0, shards=1, batch_size=None, on_conflict="update"):
+    """Import one shard of ``source``; the unit of work of a worker process."""
+    stats = ImportStats(kind)
+    started = time.perf_counter()
+    try:
+        IMPORTERS[kind](numbered_rows(source, shard, shards), stats, batch_size_or_default(batch_size), on_conflict)
+    finally:
+        stats.elapsed = time.perf_counter() - started
+        if shards > 1:
+            connections.close_all()
+    return stats
+
+
+def run(kind, source, workers=1, batch_size=None, on_conflict="update"):
+    """Import ``source`` (``{"path": ...}`` or a generator spec) with ``workers`` processes.
+
+    Each worker takes every ``workers``-th row, so shards are balanced for
+    any file without splitting it first.  Workers are forked, each with its
+    own database connection; on SQLite their writes take turns.
+    """
+    if workers <= 1:
+        return run_shard(kind, source, batch_size=batch_size, on_conflict=on_conflict)
+    # Forked children must not share the parent's connection.
+    connections.close_all()
+    context = get_context("fork")
+    lock = context.Lock() if connection.vendor == "sqlite" else None
+    with context.Pool(workers, initializer=_init_worker, initargs=(lock,)) as pool:
+        results = pool.starmap(
+            run_shard, [(kind, source, shard, workers, batch_size, on_conflict) for shard in range(workers)]
+        )
+    stats = ImportStats(kind)
+    for result in results:
+        stats.merge(result)
+    return stats
+
+
+def reset_sequences(models):
+    """Move pk sequences past explicitly imported ids (a no-op on SQLite)."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
@@ -0,0 +1,88 @@
+from array import array
+
+from django.db import connection, transaction
+from django.db.models import Case, Exists, F, IntegerField, Value, When
+
+from . import pubsub, response_cache, rollups
+from .bulk import LOOKUP_SIZE
+from .models import Customer, Product, Order
+
+
+def restock_low_stock(threshold=10, increment=10, product_ids=None, dry_run=False, limit=100):
+    """Add ``increment`` to every product with ``stock < threshold``.
+
+    All matching rows are changed by a single ``UPDATE ... SET stock = stock
+    + increment``.  Their keys are read first, under lock, into a compact
+    array; once the transaction commits ``publish_restocked`` re-reads them
+    in batches and publishes a stock event for each.  Up to ``limit`` of the
+    affected products are returned with their new stock.  Returns
+    ``(count, products)``.
+    """
+    low_stock = Product.objects.filter(stock__lt=threshold)
+    if product_ids is not None:
+        low_stock = low_stock.filter(pk__in=product_ids)
+    with transaction.atomic():
+        if dry_run:
+            count = low_stock.count()
+            sample = low_stock.order_by("pk").values_list("pk", flat=True)[:limit]
+            return count, list(Product.objects.filter(pk__in=list(sample)).order_by("pk"))
+        keys = low_stock.select_for_update().order_by("pk").values_list("pk", flat=True)
+        restocked = array("q", keys.iterator(chunk_size=LOOKUP_SIZE))
+        count = low_stock.update(stock=F("stock") + increment)
+        if count:
+            # QuerySet.update() sends no signals.
+            response_cache.invalidate()
+            transaction.on_commit(lambda: publish_restocked(restocked, increment))
+        products = list(Product.objects.filter(pk__in=restocked[:limit]).order_by("pk"))
+    return count, products
+
+
+def publish_restocked(product_ids, increment):
+    """Publish a stock event for each of ``product_ids``, reading ``LOOKUP_SIZE`` at a time."""
+    for start in range(0, len(product_ids), LOOKUP_SIZE):
+        batch = Product.objects.filter(pk__in=product_ids[start:start + LOOKUP_SIZE]).order_by("pk")
+        for pk, stock in batch.values_list("pk", "stock"):
+            pubsub.stock_changed(pk, stock - increment, stock)
+
+
+class OrderError(Exception):
+    """An order could not be placed; nothing was written."""
+
+
+def place_order(customer_id, quantities):
+    """Create an order for ``{product_id: quantity}`` and take it out of stock.
+
+    Stock is decremented with one ``UPDATE`` for all products, conditional
+    on none of them having less than its quantity, and the total is priced
+    from the database, all in one transaction, so concurrent orders can
+    never oversell.
+    """
+    ids = sorted(quantities)
+    need = Case(*[When(pk=pid, then=Value(qty)) for pid, qty in quantities.items()], output_field=IntegerField())
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # Lock in pk order so two orders for the same products cannot deadlock.
+            list(Product.objects.select_for_update().filter(pk__in=ids).order_by("pk").values_list("pk"))
+        # On SQLite the write has to come first: a transaction that reads
+        # before writing fails with "database is locked" instead of waiting.
+        # Either every row is decremented or none is, so on failure the
+        # stock read back is the stock that fell short.
+        short = Product.objects.filter(pk__in=ids, stock__lt=need)
+        decremented = Product.objects.filter(~Exists(short), pk__in=ids).update(stock=F("stock") - need)
+        products = Product.objects.in_bulk(ids)
+        missing = [str(pid) for pid in ids if pid not in products]
+        if missing:
+            raise OrderError(f"Products not found: {', '.join(missing)}")
+        if decremented != len(ids):
+            short = [products[pid].name for pid in ids if products[pid].stock < quantities[pid]]
+            raise OrderError(f"Insufficient stock for: {', '.join(short)}")
+        if not Customer.objects.filter(pk=customer_id).exists():
+            raise OrderError(f"Customer not found: {customer_id}")
+        total = sum(products[pid].price * qty for pid, qty in quantities.items())
+        # The rollup bucket changes on the save and the add; recompute it once.
+        with rollups.deferred():
+            order = Order.objects.create(customer_id=customer_id, total_amount=total)
+            order.products.add(*ids)
+        for pid in ids:
+            pubsub.stock_changed(pid, products[pid].stock + quantities[pid], products[pid].stock)
+    return order
@@ -0,0 +1,273 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock between processes.
+    fcntl = None
+
+DEFAULTS = {
+    # JSON-lines file shared by every cron job, Celery task and script.
+    "PATH": "/tmp/crm_jobs.jsonl",
+    # Rotate once the file would grow past this many bytes ...
+    "MAX_BYTES": 10 * 1024 * 1024,
+    # ... keeping this many gzipped generations, PATH.1.gz newest.
+    "BACKUP_COUNT": 5,
+    # Records buffered before a write; errors are written at once.
+    "CAPACITY": 100,
+    # Seconds a buffered record waits at most.
+    "FLUSH_INTERVAL": 5,
+}
+
+LOGGER = "crm.jobs"
+
+
+def get_options():
+    # Scripts talking to a remote endpoint run without Django settings.
+    from django.conf import settings
+
+    return {**DEFAULTS, **(getattr(settings, "CRM_JOB_LOG", {}) if settings.configured else {})}
+
+
+# Name of the job running in this context, set by ``crm.locks.single_flight``
+# and the chunked-job tasks, so ``log`` calls need not repeat it.
+_current_job = ContextVar("crm_current_job", default=None)
+
+
+@contextmanager
+def job(name):
+    token = _current_job.set(name)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """One JSON object per record: time, level, job, event, host, pid and the record's ``fields``."""
+
+    host = socket.gethostname()
+    encode = json.JSONEncoder(default=str).encode
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "job": getattr(record, "job", None),
+            "event": record.getMessage(),
+            "host": self.host,
+            "pid": record.process,
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return self.encode(entry)
+
+
+class BufferedJSONLinesHandler(logging.Handler):
+    """Appends formatted records to ``path`` in batches, rotating by size.
+
+    Records are buffered and written by one ``open``/``write`` per batch:
+    when ``capacity`` records are waiting, an ERROR arrives, a background
+    thread finds the oldest waiting ``flush_interval`` seconds, or on
+    close.  Batches hold whole lines and are written in append mode under
+    an exclusive ``flock`` on ``path.lock``, so writers in other processes
+    neither interleave lines nor race a rotation.  A batch that would take
+    the file past ``max_bytes`` first moves it to ``path.1.gz``.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULTS["MAX_BYTES"], backup_count=DEFAULTS["BACKUP_COUNT"],
+                 capacity=DEFAULTS["CAPACITY"], flush_interval=DEFAULTS["FLUSH_INTERVAL"]):
+        super().__init__()
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.setFormatter(JSONLinesFormatter())
+        self._stopped = threading.Event()
+        self._flusher = None
+        if hasattr(os, "register_at_fork"):
+            # Forked workers (Celery prefork) start empty, with no flusher.
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.buffer = []
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def emit(self, record):
+        # Called with the handler lock held.
+        try:
+            self.buffer.append(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.buffer) >= self.capacity or record.levelno >= logging.ERROR:
+            self._write()
+        elif self._flusher is None and self.flush_interval:
+            self._flusher = threading.Thread(target=self._flush_periodically, name="crm-job-log", daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self._write()
+
+    def _write(self):
+        if not self.buffer:
+            return
+        data = "".join(self.buffer).encode("utf-8")
+        self.buffer = []
+        with open(f"{self.path}.lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                size = 0
+            if size and size + len(data) > self.max_bytes:
+                self.rotate()
+            with open(self.path, "ab") as f:
+                f.write(data)
+
+    def rotate(self):
+        """Shift ``path.N.gz`` up one and compress ``path`` into ``path.1.gz``."""
+        if self.backup_count < 1:
+            os.remove(self.path)
+            return
+        for n in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{n}.gz"):
+                os.replace(f"{self.path}.{n}.gz", f"{self.path}.{n + 1}.gz")
+        with open(self.path, "rb") as source, gzip.open(f"{self.path}.1.gz", "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.remove(self.path)
+
+    def close(self):
+        self._stopped.set()
+        self.flush()
+        super().close()
+
+
+_logger_lock = threading.Lock()
+
+
+def get_logger():
+    """The ``crm.jobs`` logger, writing through a handler built from ``settings.CRM_JOB_LOG``."""
+    logger = logging.getLogger(LOGGER)
+    if not logger.handlers:
+        with _logger_lock:
+            if not logger.handlers:
+                options = get_options()
+                logger.addHandler(BufferedJSONLinesHandler(
+                    options["PATH"], options["MAX_BYTES"], options["BACKUP_COUNT"],
+                    options["CAPACITY"], options["FLUSH_INTERVAL"],
+                ))
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+    return logger
+
+
+def log(event, level=logging.INFO, job=None, **fields):
+    """Log ``event`` for ``job`` (default: the running job) with JSON ``fields``."""
+    get_logger().log(level, event, extra={"job": job or _current_job.get(), "fields": fields})
+
+
+def flush():
+    for handler in get_logger().handlers:
+        handler.flush()
+
+
+def reset():
+    """Close the ``crm.jobs`` handler; the next record builds one from the current settings."""
+    logger = logging.getLogger(LOGGER)
+    with _logger_lock:
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+
+
+# ==============================
+# Reading
+# ==============================
+def reversed_lines(f, block_size=64 * 1024):
+    """Yield the lines of binary file ``f`` last first, reading blocks from the end."""
+    f.seek(0, os.SEEK_END)
+    position, rest = f.tell(), b""
+    while position > 0:
+        step = min(block_size, position)
+        position -= step
+        f.seek(position)
+        lines = (f.read(step) + rest).split(b"\n")
+        # The first piece may continue in the block before.
+        rest = lines.pop(0)
+        for line in reversed(lines):
+            if line:
+                yield line
+    if rest:
+        yield rest
+
+
+def _newest_first(path, rotated):
+    try:
+        with open(path, "rb") as f:
+            yield from reversed_lines(f)
+    except FileNotFoundError:
+        pass
+    for n in range(1, rotated + 1):
+        try:
+            # Rotated files are bounded by MAX_BYTES; decompressed whole.
+            with gzip.open(f"{path}.{n}.gz", "rb") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        yield from (line for line in reversed(lines) if line)
+
+
+def recent(path=None, job=None, level=None, since=None, event=None, limit=50, rotated=None):
+    """The last ``limit`` records matching the filters, oldest first.
+
+    Reads from the end of the log backwards and stops at ``limit`` matches
+    or the first record older than ``since``, so the cost follows what is
+    asked for, not the size of the file.  ``rotated`` generations (all
+    kept ones by default) are searched when the current file runs out.
+    """
+    options = get_options()
+    path = path or options["PATH"]
+    rotated = options["BACKUP_COUNT"] if rotated is None else rotated
+    minimum = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    if minimum is not None and not isinstance(minimum, int):
+        raise ValueError(f"Unknown log level: {level!r}.")
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+
+    found = []
+    for line in _newest_first(path, rotated):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # A line cut by a crash.
+        if since is not None and datetime.datetime.fromisoformat(entry["time"]) < since:
+            break
+        if job is not None and entry.get("job") != job:
+            continue
+        if event is not None and entry.get("event") != event:
+            continue
+        if minimum is not None and logging.getLevelName(entry.get("level")) < minimum:
+            continue
+        found.append(entry)
+        if len(found) >= limit:
+            break
+    return found[::-1]
@@ -0,0 +1,126 @@
+import datetime
+from decimal import Decimal
+
+from django.db.models import Count, Max, Sum
+from graphql_relay import to_global_id
+
+from . import joblog, reminders, rollups
+from .analytics import date_range
+from .chunking import ChunkedJob, register
+from .inventory import restock_low_stock
+from .models import Customer, Product, Order
+
+CENTS = Decimal("0.01")
+
+
+@register
+class CRMReport(ChunkedJob):
+    """The weekly report: orders and revenue summed per range of order IDs."""
+
+    name = "crm_report"
+    model = Order
+
+    def process(self, start, end, params):
+        totals = Order.objects.filter(pk__gte=start, pk__lt=end).aggregate(
+            orders=Count("pk"), revenue=Sum("total_amount")
+        )
+        return {"orders": totals["orders"], "revenue": str(totals["revenue"] or 0)}
+
+    def aggregate(self, results, params):
+        report = {
+            "customers": Customer.objects.count(),
+            "orders": sum(result["orders"] for result in results),
+            "revenue": str(sum((Decimal(result["revenue"]) for result in results), Decimal(0)).quantize(CENTS)),
+        }
+        joblog.log("Report", **report)
+        return report
+
+
+@register
+class RestockLowStock(ChunkedJob):
+    """``crm.inventory.restock_low_stock`` per range of low-stock product IDs."""
+
+    name = "restock_low_stock"
+    model = Product
+
+    def prepare(self, params):
+        return {"threshold": 10, "increment": 10, **params}
+
+    def queryset(self, params):
+        return Product.objects.filter(stock__lt=params["threshold"])
+
+    def process(self, start, end, params):
+        products = Product.objects.filter(pk__gte=start, pk__lt=end).values("pk")
+        count, _ = restock_low_stock(params["threshold"], params["increment"], product_ids=products)
+        return {"updated": count}
+
+    def aggregate(self, results, params):
+        return {"updated": sum(result["updated"] for result in results)}
+
+
+@register
+class OrderReminders(ChunkedJob):
+    """``crm.reminders`` per range of customer IDs.
+
+    A customer's orders all fall in one chunk, so each still gets a single
+    reminder.  The run covers orders past the high-water mark up to the
+    newest order when it started, and moves the mark there when done.
+    Sending is not transactional: a chunk retried after a crash may send
+    some of its reminders again.
+    """
+
+    name = "order_reminders"
+    model = Customer
+
+    def prepare(self, params):
+        options = reminders.get_options()
+        days = params.get("days", options["DAYS"])
+        return {
+            "cutoff": (datetime.date.today() - datetime.timedelta(days=days)).isoformat(),
+            "after": reminders.cursor_order_id(reminders.DatabaseState(self.name).load()) or 0,
+            "until": Order.objects.aggregate(last=Max("pk"))["last"] or 0,
+        }
+
+    def process(self, start, end, params):
+        rows = (
+            Order.objects.filter(
+                customer_id__gte=start, customer_id__lt=end, pk__gt=params["after"], pk__lte=params["until"],
+                **date_range(datetime.date.fromisoformat(params["cutoff"])),
+            )
+            .order_by("customer__email", "pk")
+            .values_list("customer__email", "customer__name", "pk", "order_date", "total_amount")
+        )
+        rows = [
+            (email, name, to_global_id("OrderType", pk), date.isoformat(), str(total))
+            for email, name, pk, date, total in rows.iterator()
+        ]
+        options = reminders.get_options()
+        sender = reminders.get_sender(options)
+        try:
+            sent, failed = reminders.dispatch(reminders.group_sorted(rows), sender, options["WORKERS"])
+        finally:
+            sender.close()
+        return {"orders": len(rows), "sent": sent, "failed": failed}
+
+    def aggregate(self, results, params):
+        if params["until"] > params["after"]:
+            reminders.DatabaseState(self.name).save(reminders.order_cursor(params["until"]))
+        return {
+            "orders": sum(result["orders"] for result in results),
+            "sent": sum(result["sent"] for result in results),
+            "failed": [email for result in results for email in result["failed"]],
+        }
+
+
+@register
+class RebuildRollups(ChunkedJob):
+    """``crm.rollups.rebuild_customers`` per range of customer IDs."""
+
+    name = "rebuild_rollups"
+    model = Customer
+
+    def process(self, start, end, params):
+        return {"rows": rollups.rebuild_customers(start, end)}
+
+    def aggregate(self, results, params):
+        return {"rows": sum(result["rows"] for result in results)}
@@ -0,0 +1,143 @@
+from collections import defaultdict
+
+from .models import Customer, Product, Order
+
+
+class DataLoader:
+    """Per-request, synchronous batching loader.
+
+    Keys are queued with ``enqueue`` as soon as their parents are known (a
+    connection page, another loader's results).  The first ``load`` for any
+    queued key fetches the whole queue with one ``IN (...)`` query per
+    ``max_batch_size`` keys, and later loads are answered from the cache.
+    """
+
+    def __init__(self, batch_load_fn, default=None, max_batch_size=500):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self.max_batch_size = max_batch_size
+        self._cache = {}
+        self._queue = {}
+
+    def enqueue(self, key):
+        if key is not None and key not in self._cache:
+            self._queue[key] = None
+
+    def prime(self, key, value):
+        self._cache.setdefault(key, value)
+        self._queue.pop(key, None)
+
+    def clear(self):
+        self._cache.clear()
+        self._queue.clear()
+
+    def load(self, key):
+        if key not in self._cache:
+            self.enqueue(key)
+            self.dispatch()
+        return self._cache.get(key)
+
+    def load_many(self, keys):
+        return [self.load(key) for key in keys]
+
+    def dispatch(self):
+        while self._queue:
+            keys = list(self._queue)[: self.max_batch_size]
+            for key in keys:
+                del self._queue[key]
+            results = self.batch_load_fn(keys)
+            for key in keys:
+                value = results.get(key)
+                if value is None and self.default is not None:
+                    value = self.default()
+                self._cache[key] = value
+
+
+class Loaders:
+    """The set of relation loaders shared by one GraphQL request."""
+
+    def __init__(self):
+        self.customer = DataLoader(self.load_customers)
+        self.customer_orders = DataLoader(self.load_customer_orders, default=list)
+        self.order_products = DataLoader(self.load_order_products, default=list)
+        self.product_orders = DataLoader(self.load_product_orders, default=list)
+
+    def track(self, instances, seen=None):
+        """Queue the relations of freshly resolved instances for batching.
+
+        Relations the optimizer already joined or prefetched are primed into
+        the loaders instead, so they are never fetched a second time.
+        """
+        seen = set() if seen is None else seen
+        for obj in instances:
+            # Prefetching caches back-references, so the graph can loop.
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, Order):
+                if Order.customer.is_cached(obj):
+                    self.track([obj.customer], seen)
+                elif "customer_id" not in obj.get_deferred_fields():
+                    self.customer.enqueue(obj.customer_id)
+                self.enqueue_or_prime(self.order_products, obj, "products", seen)
+            elif isinstance(obj, Customer):
+                # Instances pruned with only() would reload deferred columns
+                # one row at a time if handed out to unrelated selections.
+                if not obj.get_deferred_fields():
+                    self.customer.prime(obj.pk, obj)
+                self.enqueue_or_prime(self.customer_orders, obj, "orders", seen)
+            elif isinstance(obj, Product):
+                self.enqueue_or_prime(self.product_orders, obj, "orders", seen)
+
+    def enqueue_or_prime(self, loader, obj, relation, seen):
+        prefetched = getattr(obj, "_prefetched_objects_cache", {}).get(relation)
+        if prefetched is None:
+            loader.enqueue(obj.pk)
+        else:
+            related = list(prefetched)
+            loader.prime(obj.pk, related)
+            self.track(related, seen)
+
+    def clear(self):
+        for loader in (self.customer, self.customer_orders, self.order_products, self.product_orders):
+            loader.clear()
+
+    def load_customers(self, keys):
+        customers = Customer.objects.in_bulk(keys)
+        self.track(customers.values())
+        return customers
+
+    def load_customer_orders(self, keys):
+        grouped = defaultdict(list)
+        orders = list(Order.objects.filter(customer_id__in=keys).order_by("pk"))
+        for order in orders:
+            grouped[order.customer_id].append(order)
+        self.track(orders)
+        return grouped
+
+    def load_order_products(self, keys):
+        grouped = defaultdict(list)
+        rows = Order.products.through.objects.filter(order_id__in=keys).select_related("product").order_by("pk")
+        for row in rows:
+            grouped[row.order_id].append(row.product)
+        self.track(product for products in grouped.values() for product in products)
+        return grouped
+
+    def load_product_orders(self, keys):
+        grouped = defaultdict(list)
+        rows = Order.products.through.objects.filter(product_id__in=keys).select_related("order").order_by("pk")
+        for row in rows:
+            grouped[row.product_id].append(row.order)
+        self.track(order for orders in grouped.values() for order in orders)
+        return grouped
+
+
+def get_loaders(info):
+    """Return the loaders bound to this request, creating them on first use."""
+    context = info.context
+    loaders = getattr(context, "crm_loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        if context is not None:
+            context.crm_loaders = loaders
+    return loaders
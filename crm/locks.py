@@ -0,0 +1,177 @@
+import datetime
+import functools
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, DateTimeField, ExpressionWrapper, Max, Q, Value
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from . import joblog
+from .models import JobLock, JobRun
+
+DEFAULTS = {
+    # Seconds a lease lasts without a heartbeat; a crashed holder's lease
+    # frees up after this long.
+    "TTL": 300,
+    # Seconds between heartbeats renewing a held lease.
+    "HEARTBEAT": 60,
+    # Days of run history kept per job.
+    "HISTORY_DAYS": 30,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "CRM_JOB_LOCKS", {})}
+
+
+def owner_token():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _expiry(ttl):
+    # The database clock decides expiry, so hosts need not agree on the time.
+    return ExpressionWrapper(Now() + Value(datetime.timedelta(seconds=ttl)), output_field=DateTimeField())
+
+
+class Lease:
+    """A held ``JobLock``.
+
+    Acquiring and renewing are single conditional ``UPDATE``s on the lock
+    row, so of any number of processes and hosts sharing the database at
+    most one holds a job's lease at a time.  As a context manager it sends
+    heartbeats from a background thread and releases the lease on exit.
+    """
+
+    def __init__(self, name, token, ttl=None, heartbeat=None):
+        options = get_options()
+        self.name = name
+        self.token = token
+        self.ttl = ttl or options["TTL"]
+        self.heartbeat = heartbeat or options["HEARTBEAT"]
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def acquire(cls, name, ttl=None, token=None):
+        """The lease on ``name``, or ``None`` while another holder's is live."""
+        lease = cls(name, token or owner_token(), ttl)
+        JobLock.objects.get_or_create(name=name, defaults={"expires_at": timezone.now() - datetime.timedelta(seconds=1)})
+        taken = JobLock.objects.filter(name=name, expires_at__lte=Now()).update(
+            owner=lease.token, acquired_at=Now(), expires_at=_expiry(lease.ttl)
+        )
+        return lease if taken else None
+
+    def renew(self):
+        """Extend the lease by ``ttl``; ``False`` once it expired and was taken over."""
+        if not JobLock.objects.filter(name=self.name, owner=self.token).update(expires_at=_expiry(self.ttl)):
+            self.lost = True
+        return not self.lost
+
+    def release(self):
+        JobLock.objects.filter(name=self.name, owner=self.token).update(owner="", expires_at=Now())
+
+    def _beat(self):
+        try:
+            while not self._stop.wait(self.heartbeat) and self.renew():
+                pass
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._beat, name=f"lease:{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.release()
+
+
+def record_run(job, started_at, outcome, error="", host=None):
+    """Add a ``JobRun`` ending now, log it, and drop the job's runs past ``HISTORY_DAYS``."""
+    finished_at = timezone.now()
+    duration = (finished_at - started_at).total_seconds()
+    level = logging.ERROR if outcome == JobRun.FAILURE else logging.INFO
+    joblog.log("run", level, job=job, outcome=outcome, duration=duration, **({"error": error} if error else {}))
+    JobRun.objects.filter(
+        job=job, started_at__lt=finished_at - datetime.timedelta(days=get_options()["HISTORY_DAYS"])
+    ).delete()
+    return JobRun.objects.create(
+        job=job, host=host or socket.gethostname(), started_at=started_at, finished_at=finished_at,
+        duration=duration, outcome=outcome, error=error[:2000],
+    )
+
+
+def single_flight(name=None, ttl=None):
+    """Run the decorated job only when no other process is running it.
+
+    A call finding the job's lease held returns ``None`` at once and is
+    recorded as skipped; otherwise the job runs under the lease and its
+    duration and outcome are recorded.  Exceptions still propagate.
+    """
+
+    def decorator(function):
+        job = name or f"{function.__module__}.{function.__qualname__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started_at = timezone.now()
+            lease = Lease.acquire(job, ttl)
+            if lease is None:
+                record_run(job, started_at, JobRun.SKIPPED)
+                return None
+            with lease, joblog.job(job):
+                try:
+                    result = function(*args, **kwargs)
+                except Exception as e:
+                    record_run(job, started_at, JobRun.FAILURE, repr(e))
+                    raise
+            record_run(job, started_at, JobRun.SUCCESS, "Lease lost before the job finished." if lease.lost else "")
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def job_status():
+    """Lease state and run stats of every job with a lock or a recorded run."""
+    stats = {
+        row["job"]: row
+        for row in JobRun.objects.values("job").annotate(
+            runs=Count("pk"),
+            failures=Count("pk", filter=Q(outcome=JobRun.FAILURE)),
+            skipped=Count("pk", filter=Q(outcome=JobRun.SKIPPED)),
+            average_duration=Avg("duration", filter=~Q(outcome=JobRun.SKIPPED)),
+            last_success_at=Max("finished_at", filter=Q(outcome=JobRun.SUCCESS)),
+            last=Max("pk"),
+        ).order_by()
+    }
+    last_runs = JobRun.objects.in_bulk([row["last"] for row in stats.values()])
+    locks = {lock.name: lock for lock in JobLock.objects.all()}
+    now = timezone.now()
+    status = []
+    for job in sorted(set(stats) | set(locks)):
+        lock, row = locks.get(job), stats.get(job, {})
+        held = lock is not None and lock.expires_at > now
+        status.append({
+            "name": job,
+            "running": held,
+            "lock_owner": lock.owner if held else None,
+            "lock_expires_at": lock.expires_at if held else None,
+            "last_run": last_runs.get(row.get("last")),
+            "last_success_at": row.get("last_success_at"),
+            "runs": row.get("runs", 0),
+            "failures": row.get("failures", 0),
+            "skipped": row.get("skipped", 0),
+            "average_duration": row.get("average_duration"),
+        })
+    return status
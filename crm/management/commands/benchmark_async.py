@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from crm import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent-request throughput of the WSGI GraphQL view and the async view over ASGI, "
+        "in-process against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=5_000, help="Customers to seed.")
+        parser.add_argument("--products", type=int, default=500, help="Products to seed.")
+        parser.add_argument("--orders", type=int, default=50_000, help="Orders to seed.")
+        parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrent client counts.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per mode and client count.")
+        parser.add_argument("--threads", type=int, default=8, help="Server threads of the WSGI worker.")
+        parser.add_argument("--keepdb", action="store_true", help="Keep (and reuse) the seeded test database.")
+
+    def handle(self, *args, **options):
+        concurrency = [int(value) for value in options["concurrency"].split(",")]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            benchmarks.populate(options["customers"], options["products"], options["orders"])
+            # Production-like: no query log, and the in-process host allowed.
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=["localhost"]):
+                self.stdout.write(f"{'mode':<22} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+                for mode, clients, throughput, p50, p95 in benchmarks.load(
+                    concurrency, options["requests"], options["threads"],
+                ):
+                    self.stdout.write(f"{mode:<22} {clients:>7} {throughput:>8.1f} {p50:>8.2f} {p95:>8.2f}")
+        finally:
+            connection.close()
+            if not options["keepdb"]:
+                connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
@@ -0,0 +1,38 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from crm import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare filter latency without (migration 0002) and with the indexes and search "
+        "structures of migrations 0003-0004, in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=1_000_000, help="Orders to seed.")
+        parser.add_argument("--customers", type=int, default=100_000, help="Customers to seed.")
+        parser.add_argument("--products", type=int, default=10_000, help="Products to seed.")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query; the median is reported.")
+        parser.add_argument("--keepdb", action="store_true", help="Keep (and reuse) the seeded test database.")
+
+    def handle(self, *args, **options):
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            benchmarks.seed(
+                options["orders"], customers=options["customers"], products=options["products"],
+                stdout=self.stdout if options["verbosity"] > 1 else None,
+            )
+            cases = benchmarks.filter_cases()
+            call_command("migrate", "crm", "0002", verbosity=0)
+            before = benchmarks.run_queries([(label, query) for label, query, _ in cases], options["repeat"])
+            call_command("migrate", "crm", verbosity=0)
+            after = benchmarks.run_queries([(label, new or old) for label, old, new in cases], options["repeat"])
+            self.stdout.write(f"{'case':<20} {'before ms':>10} {'after ms':>10}")
+            for label, _, _ in cases:
+                self.stdout.write(f"{label:<20} {before[label]:>10.2f} {after[label]:>10.2f}")
+        finally:
+            if not options["keepdb"]:
+                connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from crm import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Compare OFFSET and keyset page latency on allOrders, in a throwaway test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=1_000_000, help="Orders to seed.")
+        parser.add_argument("--page-size", type=int, default=20, help="Rows per page.")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per page; the median is reported.")
+        parser.add_argument("--keepdb", action="store_true", help="Keep (and reuse) the seeded test database.")
+
+    def handle(self, *args, **options):
+        orders, page_size = options["orders"], options["page_size"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            benchmarks.seed(orders, stdout=self.stdout if options["verbosity"] > 1 else None)
+            depths = sorted({0, orders // 100, orders // 10, orders // 2, max(orders - page_size, 0)})
+            self.stdout.write(f"{'depth':>10} {'offset ms':>10} {'keyset ms':>10}")
+            for depth, offset_ms, keyset_ms in benchmarks.pagination(depths, page_size, options["repeat"]):
+                self.stdout.write(f"{depth:>10} {offset_ms:>10.2f} {keyset_ms:>10.2f}")
+        finally:
+            if not options["keepdb"]:
+                connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
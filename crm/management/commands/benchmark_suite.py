@@ -0,0 +1,90 @@
+import json
+import platform
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from crm import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time representative queries and mutations through the schema in a throwaway test database "
+        "and compare them with a stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=5_000, help="Customers to seed.")
+        parser.add_argument("--products", type=int, default=500, help="Products to seed.")
+        parser.add_argument("--orders", type=int, default=50_000, help="Orders to seed.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the data.")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed runs per operation.")
+        parser.add_argument(
+            "--baseline", default=str(settings.BASE_DIR / "benchmark_baseline.json"), help="Baseline JSON file.",
+        )
+        parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline.")
+        parser.add_argument(
+            "--no-baseline", action="store_true", help="Only print the timings, without comparing them to a baseline.",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=0.25,
+            help="Fraction a median or peak memory may grow before the run fails.",
+        )
+        parser.add_argument(
+            "--min-delta-ms", type=float, default=1.0, help="Slowdowns smaller than this are never regressions.",
+        )
+        parser.add_argument("--keepdb", action="store_true", help="Keep (and reuse) the seeded test database.")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 2:
+            raise CommandError("--repeat must be at least 2.")
+        path = options["baseline"]
+        baseline = None
+        if not (options["save_baseline"] or options["no_baseline"]):
+            # Checked before the slow part, so a missing baseline fails fast.
+            try:
+                with open(path) as f:
+                    baseline = json.load(f)
+            except FileNotFoundError:
+                raise CommandError(
+                    f"No baseline at {path}; run with --save-baseline to create one, "
+                    "or --no-baseline to only print the timings."
+                )
+        volumes = {name: options[name] for name in ("customers", "products", "orders", "seed")}
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            benchmarks.populate(**volumes)
+            results = benchmarks.run_suite(benchmarks.suite_cases(), options["repeat"])
+        finally:
+            if not options["keepdb"]:
+                connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
+
+        self.stdout.write(f"{'operation':<26} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'queries':>8} {'peak KiB':>9}")
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<26} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['max']:>8.2f} {r['queries']:>8} {r['peak_kb']:>9.1f}"
+            )
+
+        environment = {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, **volumes}
+        if options["save_baseline"]:
+            with open(path, "w") as f:
+                json.dump({"environment": environment, "results": results}, f, indent=2, sort_keys=True)
+                f.write("\n")
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {path}"))
+            return
+        if baseline is None:
+            return
+        if baseline["environment"] != environment:
+            self.stderr.write(self.style.WARNING(
+                f"Baseline was recorded with {baseline['environment']}, this run used {environment}."
+            ))
+        regressions = benchmarks.compare(
+            results, baseline["results"], options["threshold"], options["min_delta_ms"],
+        )
+        if regressions:
+            for message in regressions:
+                self.stderr.write(message)
+            raise CommandError(f"{len(regressions)} regressions against {path}.")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}."))
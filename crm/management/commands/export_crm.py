@@ -0,0 +1,43 @@
+import gzip
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import export
+
+
+class Command(BaseCommand):
+    help = "Stream orders, customers or products to NDJSON or CSV without loading them all."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(export.EXPORTS))
+        parser.add_argument("--format", choices=sorted(export.FORMATS), default="ndjson")
+        parser.add_argument("--output", "-o", help="File to write; gzipped if it ends in .gz. Default: stdout.")
+        parser.add_argument(
+            "--filter", action="append", default=[], metavar="NAME=VALUE",
+            help="A filter the GraphQL connection takes, e.g. order_date__gte=2024-01-01. Repeatable.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=export.DEFAULT_CHUNK_SIZE, help="Rows per fetch.")
+
+    def handle(self, *args, **options):
+        params = {}
+        for item in options["filter"]:
+            name, sep, value = item.partition("=")
+            if not sep:
+                raise CommandError(f"Filters are NAME=VALUE, got {item!r}.")
+            params[name] = value
+        try:
+            content = export.batched(export.lines(options["kind"], options["format"], params, options["chunk_size"]))
+        except ValidationError as e:
+            raise CommandError(f"Invalid filters: {e.message_dict}")
+
+        path = options["output"]
+        if not path:
+            for chunk in content:
+                self.stdout.write(chunk, ending="")
+            return
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8", newline="") as output:
+            for chunk in content:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['kind']} to {path}"))
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import importer, response_cache, rollups
+from crm.models import Product
+
+
+class Command(BaseCommand):
+    help = "Bulk import customers, products or orders from CSV/NDJSON, or generate synthetic data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", nargs="?", choices=importer.KINDS)
+        parser.add_argument("path", nargs="?", help="A .csv or .ndjson file, optionally .gz.")
+        parser.add_argument(
+            "--generate", action="store_true",
+            help="Insert synthetic customers, then products, then orders instead of reading a file.",
+        )
+        parser.add_argument("--customers", type=int, default=0, help="Customers to generate.")
+        parser.add_argument("--products", type=int, default=0, help="Products to generate.")
+        parser.add_argument("--orders", type=int, default=0, help="Orders to generate.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for --generate.")
+        parser.add_argument("--workers", type=int, default=1, help="Parallel import processes.")
+        parser.add_argument("--batch-size", type=int, default=None, help="Rows per transaction and bulk insert.")
+        parser.add_argument(
+            "--on-conflict", choices=importer.ON_CONFLICT, default="update",
+            help="What to do with rows whose customer email or product id already exists.",
+        )
+
+    def handle(self, *args, **options):
+        if options["generate"]:
+            if options["orders"] and not options["customers"]:
+                raise CommandError("--orders needs --customers: generated orders refer to generated customers.")
+            jobs = []
+            for kind in importer.KINDS:
+                if options[kind]:
+                    jobs.append((kind, {"kind": kind, "count": options[kind], "seed": options["seed"],
+                                        "customers": options["customers"]}))
+        elif options["kind"] and options["path"]:
+            jobs = [(options["kind"], {"path": options["path"]})]
+        else:
+            raise CommandError("Give a kind and a file to import, or --generate.")
+
+        for kind, source in jobs:
+            if kind == "orders" and "path" not in source:
+                source["product_ids"] = list(Product.objects.values_list("pk", flat=True))
+                if not source["product_ids"]:
+                    raise CommandError("Generating orders needs products; pass --products.")
+            stats = importer.run(
+                kind, source,
+                workers=options["workers"], batch_size=options["batch_size"], on_conflict=options["on_conflict"],
+            )
+            if kind == "products":
+                importer.reset_sequences([Product])
+            if stats.days:
+                rollups.refresh_days(stats.days)
+            self.stdout.write(self.style.SUCCESS(str(stats)))
+            for error in stats.errors:
+                self.stderr.write(error)
+            if stats.invalid > len(stats.errors):
+                self.stderr.write(f"... and {stats.invalid - len(stats.errors)} more invalid rows")
+        response_cache.invalidate()
@@ -0,0 +1,38 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crm import joblog
+
+BASE_FIELDS = ("time", "level", "job", "event", "host", "pid")
+
+
+class Command(BaseCommand):
+    help = "Show recent job log records, read backwards from the end of the log."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--job", help="Only records of this job, e.g. crm.cron.update_low_stock.")
+        parser.add_argument("--event", help='Only this event, e.g. "run" for run outcomes.')
+        parser.add_argument("--level", help="Only records at or above this level, e.g. ERROR.")
+        parser.add_argument("--since", type=int, metavar="MINUTES", help="Only records of the last MINUTES.")
+        parser.add_argument("--limit", type=int, default=20, help="Most recent records shown.")
+        parser.add_argument("--json", action="store_true", help="Print the records as JSON lines.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"] is not None:
+            since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=options["since"])
+        try:
+            entries = joblog.recent(
+                job=options["job"], event=options["event"], level=options["level"], since=since,
+                limit=options["limit"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        for entry in entries:
+            if options["json"]:
+                self.stdout.write(json.dumps(entry))
+                continue
+            fields = " ".join(f"{key}={json.dumps(value)}" for key, value in entry.items() if key not in BASE_FIELDS)
+            self.stdout.write(f"{entry['time']} {entry['level']:<7} {entry['job'] or '-'} {entry['event']} {fields}".rstrip())
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from crm import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollup from the order table in chunks of days."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-days", type=int, default=31, help="Days aggregated per transaction.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per bulk insert.")
+
+    def handle(self, *args, **options):
+        total = rollups.rebuild(
+            chunk_days=options["chunk_days"],
+            batch_size=options["batch_size"],
+            stdout=self.stdout if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollup: {total} rows"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from crm.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Recreate the search structures (FTS5 tables and triggers, trigram indexes) and reindex."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database alias to rebuild.")
+
+    def handle(self, *args, **options):
+        backend = get_search_backend(options["database"])
+        with connections[options["database"]].schema_editor() as schema_editor:
+            backend.install(schema_editor)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index with {type(backend).__name__}"))
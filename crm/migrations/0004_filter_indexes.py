@@ -0,0 +1,114 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+# The search structures of crm.search as they stood at this migration, kept
+# here so later changes to the backends do not change what it creates.
+SEARCH_COLUMNS = {
+    "crm_customer": ("name", "email"),
+    "crm_product": ("name",),
+}
+
+
+def trigram_indexes():
+    forwards = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+    backwards = []
+    for table, columns in SEARCH_COLUMNS.items():
+        for column in columns:
+            index = f'"{table}_{column}_trgm"'
+            forwards.append(f'CREATE INDEX IF NOT EXISTS {index} ON "{table}" USING gin ("{column}" gin_trgm_ops)')
+            backwards.append(f"DROP INDEX IF EXISTS {index}")
+    return forwards, backwards
+
+
+def fts_tables():
+    forwards, backwards = [], []
+    for table, columns in SEARCH_COLUMNS.items():
+        fts = f"{table}_search"
+        names = ", ".join(f'"{column}"' for column in columns)
+        new = ", ".join(f'new."{column}"' for column in columns)
+        old = ", ".join(f'old."{column}"' for column in columns)
+        forwards += [
+            f'CREATE VIRTUAL TABLE "{fts}" USING fts5({names}, '
+            f"content='{table}', content_rowid='id', tokenize='trigram')",
+            f'CREATE TRIGGER "{fts}_insert" AFTER INSERT ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}" (rowid, {names}) VALUES (new."id", {new}); END',
+            f'CREATE TRIGGER "{fts}_delete" AFTER DELETE ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}" ("{fts}", rowid, {names}) VALUES (\'delete\', old."id", {old}); END',
+            f'CREATE TRIGGER "{fts}_update" AFTER UPDATE OF {names} ON "{table}" BEGIN '
+            f'INSERT INTO "{fts}" ("{fts}", rowid, {names}) VALUES (\'delete\', old."id", {old}); '
+            f'INSERT INTO "{fts}" (rowid, {names}) VALUES (new."id", {new}); END',
+            f'INSERT INTO "{fts}" ("{fts}") VALUES (\'rebuild\')',
+        ]
+        backwards += [f'DROP TRIGGER IF EXISTS "{fts}_{trigger}"' for trigger in ("insert", "delete", "update")]
+        backwards.append(f'DROP TABLE IF EXISTS "{fts}"')
+    return forwards, backwards
+
+
+def is_postgresql(connection):
+    return connection.vendor == "postgresql"
+
+
+def has_fts5(connection):
+    # The trigram tokenizer needs SQLite 3.34.
+    if connection.vendor != "sqlite" or connection.Database.sqlite_version_info < (3, 34):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return "ENABLE_FTS5" in {row[0] for row in cursor.fetchall()}
+
+
+class RunSQLWhere(migrations.RunSQL):
+    """``RunSQL`` that only runs on databases for which ``condition(connection)`` holds."""
+
+    def __init__(self, condition, sql, reverse_sql):
+        super().__init__(sql, reverse_sql)
+        self.condition = condition
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if self.condition(schema_editor.connection):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if self.condition(schema_editor.connection):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_order_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['name'], name='crm_custome_name_0c497a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['phone'], name='crm_custome_phone_eb81ab_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'order_date'], name='crm_order_custome_7bc05a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_amount'], name='crm_order_total_a_0e7df3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='crm_product_name_949c4d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='crm_product_price_d1c0be_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock'], name='crm_product_stock_c6084e_idx'),
+        ),
+        RunSQLWhere(is_postgresql, *trigram_indexes()),
+        RunSQLWhere(has_fts5, *fts_tables()),
+    ]
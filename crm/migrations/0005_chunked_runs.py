@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkedRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100)),
+                ('params', models.JSONField(default=dict)),
+                ('chunks', models.PositiveIntegerField(default=0)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['job', 'started_at'], name='crm_chunked_job_3f954b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChunkResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='crm.chunkedrun')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chunkresult',
+            constraint=models.UniqueConstraint(fields=('run', 'index'), name='crm_chunk_result_unique'),
+        ),
+    ]
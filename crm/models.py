@@ -6,6 +6,12 @@ class Customer(models.Model):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["name"]),
+            models.Index(fields=["phone"]),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -15,6 +21,13 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["name"]),
+            models.Index(fields=["price"]),
+            models.Index(fields=["stock"]),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -25,5 +38,110 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     order_date = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (order_date, id); see crm.pagination.
+            models.Index(fields=["order_date", "id"]),
+            models.Index(fields=["customer", "order_date"]),
+            models.Index(fields=["total_amount"]),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.customer.name}"
+
+
+class DailySalesRollup(models.Model):
+    """Order count and revenue per day x customer x product.
+
+    Rows without a product hold the customer's order totals for the day.
+    Product rows credit each order's full total to every product in it, the
+    same attribution ``crm.analytics.revenue_by_product`` uses.
+    """
+    day = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="daily_sales")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales", blank=True, null=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["day", "customer"]),
+            models.Index(fields=["product", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.customer_id}/{self.product_id}: {self.revenue}"
+
+
+class ChunkedRun(models.Model):
+    """One run of a ``crm.chunking`` job; its progress is the count of ``results``."""
+    job = models.CharField(max_length=100)
+    params = models.JSONField(default=dict)
+    # Token of the job's lease, held until the run is aggregated.
+    lock_token = models.CharField(max_length=200, blank=True)
+    chunks = models.PositiveIntegerField(default=0)
+    result = models.JSONField(blank=True, null=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["job", "started_at"])]
+
+    def __str__(self):
+        return f"{self.job} #{self.pk}"
+
+
+class ChunkResult(models.Model):
+    """The result of one chunk, saved in the transaction that did its work."""
+    run = models.ForeignKey(ChunkedRun, on_delete=models.CASCADE, related_name="results")
+    index = models.PositiveIntegerField()
+    result = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["run", "index"], name="crm_chunk_result_unique")]
+
+    def __str__(self):
+        return f"{self.run_id}[{self.index}]"
+
+
+class JobLock(models.Model):
+    """A lease on a scheduled job; free once ``expires_at`` has passed."""
+    name = models.CharField(max_length=100, primary_key=True)
+    owner = models.CharField(max_length=200, blank=True)
+    acquired_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.owner or '-'} until {self.expires_at}"
+
+
+class JobState(models.Model):
+    """What a scheduled job carries from one run to the next, e.g. a high-water mark."""
+    job = models.CharField(max_length=100, primary_key=True)
+    data = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.job}: {self.data}"
+
+
+class JobRun(models.Model):
+    """One execution of a scheduled job, or one skipped because it was running."""
+    SUCCESS = "success"
+    FAILURE = "failure"
+    SKIPPED = "skipped"
+    OUTCOMES = [(SUCCESS, "Success"), (FAILURE, "Failure"), (SKIPPED, "Skipped")]
+
+    job = models.CharField(max_length=100)
+    host = models.CharField(max_length=200, blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    duration = models.FloatField(blank=True, null=True, help_text="Seconds.")
+    outcome = models.CharField(max_length=10, choices=OUTCOMES)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["job", "started_at"])]
+
+    def __str__(self):
+        return f"{self.job} at {self.started_at}: {self.outcome}"
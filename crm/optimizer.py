@@ -0,0 +1,122 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+PAGINATION_ARGS = {"first", "last", "before", "after", "offset"}
+
+
+def optimize(queryset, info):
+    """Shape ``queryset`` for the connection field currently being resolved.
+
+    Walks the ``edges { node { ... } }`` selection of ``info`` and applies
+    ``select_related`` for forward relations, ``prefetch_related`` with nested
+    ``Prefetch`` querysets for reverse and many-to-many relations, and
+    ``only()`` so unselected columns are never read.
+    """
+    nodes = connection_nodes(info.field_nodes, info)
+    return optimize_queryset(queryset, nodes, info)
+
+
+def optimize_queryset(queryset, nodes, info, required=()):
+    """Optimize ``queryset`` for the object selections in ``nodes``.
+
+    ``required`` names extra columns that must be loaded, such as the foreign
+    key a reverse-relation prefetch joins back on.
+    """
+    plan = Plan()
+    plan.only.extend(required)
+    plan.collect(queryset.model, nodes, info)
+    return plan.apply(queryset)
+
+
+class Plan:
+    def __init__(self):
+        self.only = []
+        self.select = []
+        self.prefetch = []
+        self.prunable = True
+
+    def collect(self, model, nodes, info, prefix=""):
+        columns = []
+        prunable = True
+        for name, field_nodes in selected_fields(nodes, info).items():
+            name = to_snake_case(name)
+            if name == "id" or name.startswith("__"):
+                continue
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                prunable = False
+                continue
+            if field.many_to_many or field.one_to_many:
+                if any(has_filters(node) for node in field_nodes):
+                    continue
+                nested = optimize_queryset(
+                    field.related_model._default_manager.all(),
+                    connection_nodes(field_nodes, info),
+                    info,
+                    required=[field.field.name] if field.one_to_many else [],
+                )
+                self.prefetch.append(Prefetch(prefix + name, queryset=nested))
+            elif field.is_relation:
+                if field.auto_created:
+                    prunable = False
+                    continue
+                self.select.append(prefix + name)
+                columns.append(name)
+                self.collect(field.related_model, subselections(field_nodes), info, prefix + name + "__")
+            else:
+                columns.append(name)
+        if prunable:
+            self.only.extend(prefix + column for column in columns)
+            if not prefix:
+                # Keep the primary key even when only relations were selected.
+                self.only.append(model._meta.pk.name)
+        elif not prefix:
+            self.prunable = False
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*self.select)
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        if self.prunable and self.only:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+def has_filters(field_node):
+    return any(arg.name.value not in PAGINATION_ARGS for arg in field_node.arguments)
+
+
+def subselections(field_nodes):
+    return [
+        selection
+        for node in field_nodes
+        if node.selection_set
+        for selection in node.selection_set.selections
+    ]
+
+
+def selected_fields(selections, info):
+    """Group the fields in ``selections`` by name, expanding fragments."""
+    fields = {}
+    for selection in selections:
+        if isinstance(selection, FieldNode):
+            fields.setdefault(selection.name.value, []).append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            for name, nodes in selected_fields(selection.selection_set.selections, info).items():
+                fields.setdefault(name, []).extend(nodes)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            for name, nodes in selected_fields(fragment.selection_set.selections, info).items():
+                fields.setdefault(name, []).extend(nodes)
+    return fields
+
+
+def connection_nodes(field_nodes, info):
+    """Return the selections made under ``edges { node }`` of a connection."""
+    edges = selected_fields(subselections(field_nodes), info).get("edges", [])
+    nodes = selected_fields(subselections(edges), info).get("node", [])
+    return subselections(nodes)
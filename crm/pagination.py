@@ -0,0 +1,161 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from graphene.relay import PageInfo
+from graphql import GraphQLError
+
+CURSOR_PREFIX = "keyset:"
+
+
+class Row(Func):
+    """A SQL row value, ``(a, b, ...)``, compared lexicographically."""
+    function = ""
+    template = "(%(expressions)s)"
+    output_field = Field()
+
+
+def sort_keys(queryset):
+    """``[(field, descending), ...]`` for the queryset's ordering, ending in pk.
+
+    An appended pk tiebreaker runs in the leading key's direction so that a
+    single-key ordering stays uniform and seeks with a row comparison.
+
+    Returns ``None`` when keyset paging cannot serve the ordering: random or
+    expression ordering, related or nullable sort fields.
+    """
+    query = queryset.query
+    ordering = query.order_by or (queryset.model._meta.ordering if query.default_ordering else ())
+    meta = queryset.model._meta
+    keys = []
+    for item in ordering:
+        if not isinstance(item, str) or item == "?":
+            return None
+        name = item.lstrip("-")
+        try:
+            field = meta.pk if name == "pk" else meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.is_relation or field.null or not field.concrete:
+            return None
+        keys.append((field, item.startswith("-")))
+        if field.primary_key:
+            return keys
+    keys.append((meta.pk, keys[0][1] if keys else False))
+    return keys
+
+
+def ordering(keys, reverse=False):
+    return [("-" if descending != reverse else "") + field.name for field, descending in keys]
+
+
+def encode_cursor(obj, keys):
+    payload = {"o": ordering(keys), "v": [field.value_to_string(obj) for field, _ in keys]}
+    return base64.b64encode((CURSOR_PREFIX + json.dumps(payload)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, keys):
+    """The sort-key values in ``cursor``; ``None`` for a non-keyset cursor."""
+    if not cursor:
+        return None
+    try:
+        text = base64.b64decode(cursor.encode("ascii"), validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if not text.startswith(CURSOR_PREFIX):
+        return None
+    try:
+        payload = json.loads(text[len(CURSOR_PREFIX):])
+        if payload["o"] != ordering(keys) or len(payload["v"]) != len(keys):
+            raise GraphQLError("Cursor was issued for a different ordering.")
+        return [field.to_python(value) for (field, _), value in zip(keys, payload["v"])]
+    except (KeyError, TypeError, ValueError, ValidationError):
+        raise GraphQLError(f"Invalid cursor: {cursor!r}.")
+
+
+def is_keyset_cursor(cursor):
+    try:
+        return base64.b64decode(cursor.encode("ascii")).startswith(CURSOR_PREFIX.encode())
+    except (binascii.Error, UnicodeError, ValueError):
+        return False
+
+
+def seek(keys, values, reverse=False):
+    """Condition selecting the rows after ``values`` in ``keys`` order.
+
+    Uniform directions compile to one row comparison, ``(a, b) > (x, y)``,
+    which the database answers with a range scan on an ``(a, b)`` index.
+    Mixed directions expand to ``a > x OR (a = x AND b < y) ...``.
+    """
+    directions = {descending != reverse for _, descending in keys}
+    if len(directions) == 1:
+        lookup = LessThan if directions.pop() else GreaterThan
+        return lookup(
+            Row(*[F(field.name) for field, _ in keys]),
+            Row(*[Value(value, output_field=field) for (field, _), value in zip(keys, values)]),
+        )
+    condition, equal = Q(pk__in=[]), Q()
+    for (field, descending), value in zip(keys, values):
+        op = "lt" if descending != reverse else "gt"
+        condition |= equal & Q(**{f"{field.name}__{op}": value})
+        equal &= Q(**{field.name: value})
+    return condition
+
+
+def with_keys_loaded(queryset, keys):
+    """Undo any ``only()``/``defer()`` that would leave sort keys unloaded."""
+    names = {field.name for field, _ in keys}
+    deferred, defer = queryset.query.deferred_loading
+    if defer and deferred & names:
+        return queryset.defer(None).defer(*(deferred - names))
+    if not defer and deferred and not names <= deferred:
+        return queryset.only(*(deferred | names))
+    return queryset
+
+
+def keyset_connection(connection, queryset, keys, args, max_limit=None):
+    """Build one page of ``connection`` by seeking past the cursor's sort keys.
+
+    Each page costs one indexed query of ``first + 1`` rows however deep it
+    is; the extra row answers ``hasNextPage`` (``hasPreviousPage`` for
+    ``last``).  The opposite flag only reports whether a cursor was given.
+    """
+    first, last = args.get("first"), args.get("last")
+    after, before = decode_cursor(args.get("after"), keys), decode_cursor(args.get("before"), keys)
+    if first is None and last is None:
+        first = max_limit
+
+    iterable = queryset = with_keys_loaded(queryset, keys)
+    if after is not None:
+        queryset = queryset.filter(seek(keys, after))
+    if before is not None:
+        queryset = queryset.filter(seek(keys, before, reverse=True))
+
+    if first is None and last is not None:
+        rows = list(queryset.order_by(*ordering(keys, reverse=True))[:last + 1])
+        has_previous_page, has_next_page = len(rows) > last, before is not None
+        rows = rows[:last][::-1]
+    else:
+        queryset = queryset.order_by(*ordering(keys))
+        rows = list(queryset if first is None else queryset[:first + 1])
+        has_previous_page, has_next_page = after is not None, first is not None and len(rows) > first
+        rows = rows[:first]
+        if last is not None and len(rows) > last:
+            rows, has_previous_page = rows[-last:], True
+
+    edges = [connection.Edge(node=obj, cursor=encode_cursor(obj, keys)) for obj in rows]
+    page = connection(
+        edges=edges,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous_page,
+            has_next_page=has_next_page,
+        ),
+    )
+    # Counts cover every matching row, not just those past the cursor.
+    page.iterable = iterable
+    return page
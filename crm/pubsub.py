@@ -0,0 +1,230 @@
+import asyncio
+import json
+import logging
+import threading
+import weakref
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = "order_created"
+STOCK_CHANGED = "stock_changed"
+
+DEFAULTS = {
+    # Dotted path of the broker class carrying events between processes.
+    "BACKEND": "crm.pubsub.LocalBroker",
+    # Keyword arguments for the broker, e.g. {"url": "redis://localhost:6379/1"}.
+    "OPTIONS": {},
+    # Events queued per subscriber; a slow one loses its oldest events.
+    "QUEUE_SIZE": 100,
+    # lowStockAlert fires when a product's stock drops below this.
+    "LOW_STOCK_THRESHOLD": 10,
+    # Seconds a WebSocket client has to send connection_init.
+    "CONNECTION_INIT_TIMEOUT": 10,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "GRAPHQL_SUBSCRIPTIONS", {})}
+
+
+class LocalBroker:
+    """Delivers events to listeners in this process only.
+
+    Enough when the mutations and the WebSocket subscribers are served by
+    the same process; otherwise use a broker shared between processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.listeners = defaultdict(list)
+
+    def publish(self, channel, message):
+        with self._lock:
+            listeners = list(self.listeners.get(channel, ()))
+        for callback in listeners:
+            callback(message)
+
+    def listen(self, channel, callback):
+        with self._lock:
+            self.listeners[channel].append(callback)
+
+    def unlisten(self, channel, callback):
+        with self._lock:
+            self.listeners[channel].remove(callback)
+            if not self.listeners[channel]:
+                del self.listeners[channel]
+
+
+class RedisBroker(LocalBroker):
+    """Carries events between processes over Redis pub/sub.
+
+    Each process holds one Redis subscription per channel it has listeners
+    for, read by a background thread.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="crm:"):
+        import redis
+
+        super().__init__()
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.thread = None
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, json.dumps(message))
+
+    def listen(self, channel, callback):
+        with self._lock:
+            first = channel not in self.listeners
+            self.listeners[channel].append(callback)
+        if first:
+            self.pubsub.subscribe(**{self.prefix + channel: self.receive})
+            if self.thread is None:
+                self.thread = self.pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def unlisten(self, channel, callback):
+        super().unlisten(channel, callback)
+        with self._lock:
+            last = channel not in self.listeners
+        if last:
+            self.pubsub.unsubscribe(self.prefix + channel)
+
+    def receive(self, message):
+        channel = message["channel"].decode()[len(self.prefix):]
+        super().publish(channel, json.loads(message["data"]))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide broker, built from ``settings.GRAPHQL_SUBSCRIPTIONS``."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                options = get_options()
+                _broker = import_string(options["BACKEND"])(**options["OPTIONS"])
+    return _broker
+
+
+def publish(channel, message):
+    """Publish ``message`` once the current transaction commits.
+
+    Subscribers re-read the objects an event names, so it must not reach
+    them before the write is visible.
+    """
+    transaction.on_commit(lambda: get_broker().publish(channel, message))
+
+
+def order_created(order_id):
+    publish(ORDER_CREATED, {"id": order_id})
+
+
+def stock_changed(product_id, previous, stock):
+    """``previous`` is ``None`` for a new product."""
+    publish(STOCK_CHANGED, {"id": product_id, "previous": previous, "stock": stock})
+
+
+class Stream:
+    """One broker listener fanned out to the subscribers of one key.
+
+    ``accept`` filters broker messages and ``load`` turns an accepted one
+    into the event, once for all subscribers.  Events are handed out in
+    the order they were published.
+    """
+
+    def __init__(self, hub, channel, key, accept=None, load=None):
+        self.hub = hub
+        self.channel = channel
+        self.key = key
+        self.accept = accept
+        self.load = load
+        self.subscribers = []
+        self.inbox = asyncio.Queue()
+        self.pump = None
+
+    def start(self):
+        get_broker().listen(self.channel, self.receive)
+        self.pump = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        get_broker().unlisten(self.channel, self.receive)
+        self.pump.cancel()
+
+    def receive(self, message):
+        # Called in the publishing thread.  A loop closed without stopping
+        # its streams must not break the publisher: its listener goes.
+        try:
+            self.hub.loop.call_soon_threadsafe(self.inbox.put_nowait, message)
+        except RuntimeError:
+            try:
+                get_broker().unlisten(self.channel, self.receive)
+            except (KeyError, ValueError):
+                pass
+
+    async def run(self):
+        while True:
+            message = await self.inbox.get()
+            try:
+                if self.accept is not None and not self.accept(message):
+                    continue
+                event = message if self.load is None else await self.load(message)
+            except Exception:
+                # One bad message must not end the stream for every subscriber.
+                logger.exception("Dropped %s message %r for %r", self.channel, message, self.key)
+                continue
+            if event is None:
+                continue
+            for queue in self.subscribers:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+
+class Hub:
+    """The shared streams of one event loop, by ``(channel, key)``."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.streams = {}
+
+    async def subscribe(self, channel, key=None, accept=None, load=None):
+        """Yield the events of ``channel`` for ``key`` until the caller stops.
+
+        ``key`` must determine ``accept`` and ``load``: subscribers asking
+        for the same key share the stream the first one opened.
+        """
+        stream = self.streams.get((channel, key))
+        if stream is None:
+            stream = self.streams[channel, key] = Stream(self, channel, key, accept, load)
+            stream.start()
+        queue = asyncio.Queue(get_options()["QUEUE_SIZE"])
+        stream.subscribers.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            stream.subscribers.remove(queue)
+            if not stream.subscribers:
+                del self.streams[channel, key]
+                stream.stop()
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """The hub of the running event loop."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = Hub(loop)
+    return hub
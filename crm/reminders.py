@@ -0,0 +1,305 @@
+import datetime
+import heapq
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import groupby
+from operator import itemgetter
+
+from django.utils.module_loading import import_string
+
+from . import graphql_client, joblog
+
+JOB = "order_reminders"
+
+DEFAULTS = {
+    # Orders placed this many days back get a reminder.
+    "DAYS": 7,
+    # Orders per GraphQL page; at most graphene's RELAY_CONNECTION_MAX_LIMIT.
+    "PAGE_SIZE": 100,
+    # Orders sorted in memory at a time; more are sorted in runs on disk.
+    "RUN_SIZE": 50000,
+    # Dotted path of the sender class and its keyword arguments.
+    "SENDER": "crm.reminders.LogSender",
+    "OPTIONS": {},
+    # Threads sending reminders.
+    "WORKERS": 4,
+    # Where scripts run against a remote CRM_GRAPHQL_URL, with no database,
+    # keep the cursor of the last order reminded between runs.
+    "STATE_FILE": os.path.join(tempfile.gettempdir(), "crm_order_reminders.json"),
+}
+
+ORDERS_QUERY = """
+query ReminderOrders($cutoff: Date!, $after: String, $first: Int) {
+    allOrders(orderDate_Gte: $cutoff, orderBy: ["id"], first: $first, after: $after) {
+        edges {
+            cursor
+            node { id orderDate totalAmount customer { name email } }
+        }
+        pageInfo { hasNextPage endCursor }
+    }
+}
+"""
+
+
+def get_options():
+    # Scripts talking to a remote endpoint run without Django settings.
+    from django.conf import settings
+
+    return {**DEFAULTS, **(getattr(settings, "CRM_ORDER_REMINDERS", {}) if settings.configured else {})}
+
+
+class Reminder:
+    """One customer's reminder; ``orders`` are ``(id, order date, total)`` tuples."""
+
+    __slots__ = ("email", "name", "orders")
+
+    def __init__(self, email, name, orders):
+        self.email = email
+        self.name = name
+        self.orders = orders
+
+    def __repr__(self):
+        return f"<Reminder {self.email}: {len(self.orders)} orders>"
+
+    def body(self):
+        lines = [f"Hello {self.name},", "", "A reminder about your recent orders:"]
+        lines += [f"  Order {id} placed {date[:10]}, total {total}" for id, date, total in self.orders]
+        return "\n".join(lines) + "\n"
+
+
+class LogSender:
+    """Logs one ``reminder`` record per customer to the job log (``crm.joblog``)."""
+
+    def send(self, reminder):
+        joblog.log("reminder", email=reminder.email, order_ids=[id for id, _, _ in reminder.orders])
+
+    def close(self):
+        joblog.flush()
+
+
+class LocMemSender:
+    """Keeps reminders in ``outbox``; for tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outbox = []
+
+    def send(self, reminder):
+        with self._lock:
+            self.outbox.append(reminder)
+
+    def close(self):
+        pass
+
+
+class EmailSender:
+    """Emails reminders through Django's ``EMAIL_BACKEND`` over one connection.
+
+    The file and locmem mail backends make it testable without SMTP.
+    """
+
+    def __init__(self, subject="Your recent orders", from_email=None, backend=None):
+        from django.core.mail import get_connection
+
+        self.subject = subject
+        self.from_email = from_email
+        self.connection = get_connection(backend)
+
+    def send(self, reminder):
+        from django.core.mail import EmailMessage
+
+        EmailMessage(self.subject, reminder.body(), self.from_email, [reminder.email],
+                     connection=self.connection).send()
+
+    def close(self):
+        self.connection.close()
+
+
+def get_sender(options=None):
+    options = options or get_options()
+    return import_string(options["SENDER"])(**options["OPTIONS"])
+
+
+class DatabaseState:
+    """The high-water mark, cursor of the last order a run reached, in ``JobState``.
+
+    Every host sees the same mark, as the ``order_reminders`` lease that
+    guards it spans hosts too.
+    """
+
+    def __init__(self, job=JOB):
+        self.job = job
+
+    def load(self):
+        from .models import JobState
+
+        data = JobState.objects.filter(job=self.job).values_list("data", flat=True).first()
+        return (data or {}).get("cursor")
+
+    def save(self, cursor):
+        from .models import JobState
+
+        JobState.objects.update_or_create(job=self.job, defaults={"data": {"cursor": cursor}})
+
+
+class StateFile:
+    """The high-water mark in a local file, for runs without database access."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)["cursor"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, cursor):
+        # Written aside and renamed, so a crash never leaves half a mark.
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"cursor": cursor, "saved": datetime.datetime.now().isoformat()}, f)
+        os.replace(temporary, self.path)
+
+
+def get_state(options=None):
+    if graphql_client.in_django():
+        return DatabaseState()
+    return StateFile((options or get_options())["STATE_FILE"])
+
+
+def order_cursor(order_id):
+    """The high-water mark for ``order_id``: its ``allOrders(orderBy: ["id"])`` cursor."""
+    from .models import Order
+    from .pagination import encode_cursor, sort_keys
+
+    return encode_cursor(Order(pk=order_id), sort_keys(Order.objects.order_by("id")))
+
+
+def cursor_order_id(cursor):
+    from .models import Order
+    from .pagination import decode_cursor, sort_keys
+
+    values = decode_cursor(cursor, sort_keys(Order.objects.order_by("id")))
+    return values[0] if values else None
+
+
+def fetch_orders(execute, cutoff, after=None, page_size=DEFAULTS["PAGE_SIZE"]):
+    """Yield ``(cursor, order)`` for orders since ``cutoff`` past ``after``, by id.
+
+    Keyset cursors make every page one indexed seek, however far in.
+    """
+    while True:
+        variables = {"cutoff": cutoff.isoformat(), "after": after, "first": page_size}
+        connection = execute(ORDERS_QUERY, variables)["allOrders"]
+        for edge in connection["edges"]:
+            yield edge["cursor"], edge["node"]
+        if not connection["pageInfo"]["hasNextPage"]:
+            return
+        after = connection["pageInfo"]["endCursor"]
+
+
+def _spill(rows):
+    run = tempfile.TemporaryFile("w+")
+    run.writelines(json.dumps(row) + "\n" for row in rows)
+    run.seek(0)
+    return run
+
+
+def _read(run):
+    for line in run:
+        yield tuple(json.loads(line))
+
+
+def group_sorted(rows):
+    """Yield one ``Reminder`` per email from rows already sorted by email."""
+    for email, group in groupby(rows, key=itemgetter(0)):
+        group = list(group)
+        yield Reminder(email, group[0][1], [row[2:] for row in group])
+
+
+def group_by_email(rows, run_size=DEFAULTS["RUN_SIZE"]):
+    """Yield one ``Reminder`` per email from ``(email, name, id, date, total)`` rows.
+
+    An external merge sort: rows are sorted ``run_size`` at a time, full
+    runs are spilled to temporary files, and the runs are merged.  Memory
+    holds one run and one customer's orders, whatever the row count.
+    """
+    runs, rows_in_memory = [], []
+    try:
+        for row in rows:
+            rows_in_memory.append(row)
+            if len(rows_in_memory) >= run_size:
+                runs.append(_spill(sorted(rows_in_memory)))
+                rows_in_memory = []
+        rows_in_memory.sort()
+        yield from group_sorted(heapq.merge(*map(_read, runs), rows_in_memory))
+    finally:
+        for run in runs:
+            run.close()
+
+
+def dispatch(reminders, sender, workers=DEFAULTS["WORKERS"]):
+    """Send ``reminders`` on ``workers`` threads; ``(sent, failed emails)``.
+
+    At most ``2 * workers`` reminders are queued, so the pool pulls from
+    ``reminders`` only as fast as the sender keeps up.
+    """
+    sent, failed, pending = 0, [], {}
+
+    def collect(done):
+        nonlocal sent
+        for future in done:
+            reminder = pending.pop(future)
+            if future.exception() is None:
+                sent += 1
+            else:
+                failed.append(reminder.email)
+
+    with ThreadPoolExecutor(workers) as pool:
+        for reminder in reminders:
+            if len(pending) >= 2 * workers:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[pool.submit(sender.send, reminder)] = reminder
+        collect(wait(pending).done)
+    return sent, failed
+
+
+def send_order_reminders(days=None, execute=None, sender=None, state=None):
+    """Remind each customer once about their orders of the last ``days`` days.
+
+    Only orders past the stored high-water mark are read, so a rerun
+    reminds about new orders only.  The mark moves past every order read,
+    including those of failed sends, which are returned for a retry.
+    Defaults come from ``settings.CRM_ORDER_REMINDERS``.
+    """
+    options = get_options()
+    days = options["DAYS"] if days is None else days
+    execute = execute or graphql_client.execute
+    own_sender = sender is None
+    sender = get_sender(options) if own_sender else sender
+    state = state or get_state(options)
+
+    cutoff = datetime.date.today() - datetime.timedelta(days=days)
+    start = last = state.load()
+    orders = 0
+
+    def rows():
+        nonlocal last, orders
+        for cursor, order in fetch_orders(execute, cutoff, start, options["PAGE_SIZE"]):
+            last, orders = cursor, orders + 1
+            customer = order["customer"]
+            yield customer["email"], customer["name"], order["id"], order["orderDate"], str(order["totalAmount"])
+
+    try:
+        sent, failed = dispatch(group_by_email(rows(), options["RUN_SIZE"]), sender, options["WORKERS"])
+    finally:
+        if own_sender:
+            sender.close()
+    if last != start:
+        state.save(last)
+    return {"orders": orders, "sent": sent, "failed": failed}
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql import FieldNode, FragmentDefinitionNode, FragmentSpreadNode, InlineFragmentNode, print_ast
+
+DEFAULTS = {
+    "ENABLED": False,
+    "CACHE": "default",
+    "TIMEOUT": 60,
+    "KEY_PREFIX": "graphql-response",
+    # Root query fields never cached: they read rows whose writes do not
+    # bump the generation, like the job leases and run history.
+    "UNCACHED_FIELDS": ("jobStatus", "jobRuns"),
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "GRAPHQL_RESPONSE_CACHE", {})}
+
+
+class ResponseCache:
+    """Results of read-only GraphQL operations, stored in a Django cache.
+
+    Keys combine the normalized document, operation name and variables with
+    a generation number.  Any write to the CRM models bumps the generation
+    (see ``crm.signals``), which orphans every stored result at once.
+    """
+
+    def __init__(self, alias="default", timeout=60, key_prefix="graphql-response",
+                 uncached_fields=DEFAULTS["UNCACHED_FIELDS"]):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.uncached_fields = frozenset(uncached_fields)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def generation_key(self):
+        return f"{self.key_prefix}:generation"
+
+    def cacheable(self, document, operation_ast):
+        """Whether ``operation_ast`` selects none of the ``uncached_fields`` at its root."""
+        fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+
+        def root_fields(selection_set):
+            for selection in selection_set.selections:
+                if isinstance(selection, FieldNode):
+                    yield selection.name.value
+                elif isinstance(selection, InlineFragmentNode):
+                    yield from root_fields(selection.selection_set)
+                elif isinstance(selection, FragmentSpreadNode) and selection.name.value in fragments:
+                    yield from root_fields(fragments[selection.name.value].selection_set)
+
+        return self.uncached_fields.isdisjoint(root_fields(operation_ast.selection_set))
+
+    def key(self, document, operation_name=None, variables=None):
+        generation = self.cache.get(self.generation_key, 0)
+        payload = json.dumps([print_ast(document), operation_name, variables or {}], sort_keys=True, default=str)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:{generation}:{digest}"
+
+    def get(self, key):
+        data = self.cache.get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, self.timeout)
+
+    def invalidate(self):
+        try:
+            self.cache.incr(self.generation_key)
+        except ValueError:
+            # First write since the cache started: no generation stored yet.
+            self.cache.add(self.generation_key, 0, None)
+            self.cache.incr(self.generation_key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """The configured cache, or ``None`` when ``GRAPHQL_RESPONSE_CACHE`` is off."""
+    global _response_cache
+    options = get_options()
+    if not options["ENABLED"]:
+        return None
+    if _response_cache is None or _response_cache.alias != options["CACHE"]:
+        _response_cache = ResponseCache(options["CACHE"], options["TIMEOUT"], options["KEY_PREFIX"])
+    _response_cache.timeout = options["TIMEOUT"]
+    _response_cache.uncached_fields = frozenset(options["UNCACHED_FIELDS"])
+    return _response_cache
+
+
+def invalidate():
+    """Drop every cached response once the current transaction commits."""
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        transaction.on_commit(response_cache.invalidate)
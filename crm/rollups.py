@@ -0,0 +1,200 @@
+import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Count, DateField, F, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .analytics import attach, date_range
+from .models import Customer, Product, Order, DailySalesRollup
+
+PERIOD = {
+    "day": lambda: F("day"),
+    "week": lambda: TruncWeek("day", output_field=DateField()),
+    "month": lambda: TruncMonth("day", output_field=DateField()),
+}
+
+
+# Buckets collected inside ``deferred``, refreshed together at its end.
+_pending = ContextVar("crm_rollup_pending", default=None)
+
+
+def order_day(value):
+    """The rollup day an ``order_date`` value falls on."""
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return timezone.localdate(value)
+
+
+def build_rows(orders):
+    """Rollup rows for ``orders``, aggregated by the database."""
+    day = TruncDate("order_date")
+    rows = [
+        DailySalesRollup(day=row["day"], customer_id=row["customer"], order_count=row["orders"], revenue=row["revenue"])
+        for row in orders.annotate(day=day)
+        .values("day", "customer")
+        .annotate(orders=Count("pk"), revenue=Sum("total_amount"))
+        .order_by()
+    ]
+    items = Order.products.through.objects.filter(order__in=orders.values("pk"))
+    rows.extend(
+        DailySalesRollup(
+            day=row["day"],
+            customer_id=row["order__customer"],
+            product_id=row["product"],
+            order_count=row["orders"],
+            revenue=row["revenue"],
+        )
+        for row in items.annotate(day=TruncDate("order__order_date"))
+        .values("day", "order__customer", "product")
+        .annotate(orders=Count("order"), revenue=Sum("order__total_amount"))
+        .order_by()
+    )
+    return rows
+
+
+def refresh(keys, batch_size=500):
+    """Recompute the rollup buckets for an iterable of ``(day, customer_id)``.
+
+    A bucket only covers one customer's orders on one day, so keeping the
+    rollup current costs a few small indexed queries per changed day, with
+    the customers of that day handled ``batch_size`` at a time.
+    """
+    pending = _pending.get()
+    if pending is not None:
+        pending.update(keys)
+        return
+    by_day = {}
+    for day, customer_id in keys:
+        if customer_id is not None:
+            by_day.setdefault(day, set()).add(customer_id)
+    with transaction.atomic():
+        for day, customer_ids in by_day.items():
+            customer_ids = sorted(customer_ids)
+            for start in range(0, len(customer_ids), batch_size):
+                chunk = customer_ids[start:start + batch_size]
+                DailySalesRollup.objects.filter(day=day, customer_id__in=chunk).delete()
+                orders = Order.objects.filter(customer_id__in=chunk, **date_range(day, day))
+                DailySalesRollup.objects.bulk_create(build_rows(orders))
+
+
+@contextmanager
+def deferred():
+    """Refresh the buckets touched inside the block once, when it ends.
+
+    An order saved and then given its products changes its bucket twice;
+    ``place_order`` wraps both so the bucket is recomputed once.  Nothing
+    is refreshed when the block raises, as its transaction rolls back.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    keys = set()
+    token = _pending.set(keys)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    refresh(keys)
+
+
+def refresh_orders(orders):
+    """Refresh the buckets touched by ``orders``, e.g. after a bulk insert."""
+    refresh({(order_day(order.order_date), order.customer_id) for order in orders})
+
+
+def refresh_days(days, chunk_days=31, batch_size=1000):
+    """Recompute every bucket on ``days``, e.g. after a bulk import.
+
+    Cheaper than ``refresh`` when most customers of a day changed, and
+    needs only the set of days.  Runs of consecutive days are aggregated
+    together, up to ``chunk_days`` per transaction.
+    """
+    days = sorted(days)
+    while days:
+        run = 1
+        while run < min(len(days), chunk_days) and days[run] == days[run - 1] + datetime.timedelta(days=1):
+            run += 1
+        start, end, days = days[0], days[run - 1], days[run:]
+        with transaction.atomic():
+            DailySalesRollup.objects.filter(day__gte=start, day__lte=end).delete()
+            rows = build_rows(Order.objects.filter(**date_range(start, end)))
+            DailySalesRollup.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def rebuild(chunk_days=31, batch_size=1000, stdout=None):
+    """Rebuild the whole rollup from ``Order`` one window of days at a time."""
+    DailySalesRollup.objects.all().delete()
+    bounds = Order.objects.aggregate(first=Min("order_date"), last=Max("order_date"))
+    if bounds["first"] is None:
+        return 0
+    total = 0
+    start, last = order_day(bounds["first"]), order_day(bounds["last"])
+    while start <= last:
+        end = start + datetime.timedelta(days=chunk_days - 1)
+        with transaction.atomic():
+            rows = build_rows(Order.objects.filter(**date_range(start, end)))
+            DailySalesRollup.objects.bulk_create(rows, batch_size=batch_size)
+        total += len(rows)
+        if stdout:
+            stdout.write(f"{start} .. {end}: {len(rows)} rows")
+        start = end + datetime.timedelta(days=1)
+    return total
+
+
+def rebuild_customers(start, end, batch_size=1000):
+    """Rebuild the rollup rows of customers with ``start <= pk < end``.
+
+    Customers' buckets are disjoint, so ranges of customers can be rebuilt
+    independently and in parallel (``crm.jobs.RebuildRollups``).
+    """
+    customers = {"customer_id__gte": start, "customer_id__lt": end}
+    with transaction.atomic():
+        DailySalesRollup.objects.filter(**customers).delete()
+        rows = build_rows(Order.objects.filter(**customers))
+        DailySalesRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def _rollup(start=None, end=None, **filters):
+    if start:
+        filters["day__gte"] = start
+    if end:
+        filters["day__lte"] = end
+    return DailySalesRollup.objects.filter(**filters)
+
+
+def sales_trend(period="day", start=None, end=None):
+    """Order count and revenue per period, read from the rollup."""
+    return (
+        _rollup(start, end, product=None)
+        .annotate(period=PERIOD[period]())
+        .values("period")
+        .annotate(orders=Sum("order_count"), revenue=Sum("revenue"))
+        .order_by("period")
+    )
+
+
+def top_customers(start=None, end=None, limit=None):
+    rows = (
+        _rollup(start, end, product=None)
+        .values("customer")
+        .annotate(orders=Sum("order_count"), revenue=Sum("revenue"))
+        .order_by("-revenue", "customer")
+    )
+    return attach(rows[:limit] if limit else rows, Customer, "customer")
+
+
+def top_products(start=None, end=None, limit=None):
+    rows = (
+        _rollup(start, end, product__isnull=False)
+        .values("product")
+        .annotate(orders=Sum("order_count"), revenue=Sum("revenue"))
+        .order_by("-revenue", "product")
+    )
+    return attach(rows[:limit] if limit else rows, Product, "product")
@@ -1,48 +1,160 @@
 import graphene
+from django.db.models import Sum
 from graphene_django.types import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
-from .models import Customer, Product, Order
+from graphql import GraphQLError
+from .models import Customer, Product, Order, JobRun
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from . import analytics, bulk, locks, pubsub, rollups
+from .asynchronous import async_resolver
+from .fields import CRMConnection, CRMConnectionField
+from .inventory import OrderError, place_order, restock_low_stock
+from .loaders import get_loaders
+from .search import search as crm_search
 from crm.models import Product
 
 
 class CustomerType(DjangoObjectType):
+    orders = CRMConnectionField(lambda: OrderType, loader="customer_orders", required=True)
+
     class Meta:
         model = Customer
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CRMConnection
 
 
 class ProductType(DjangoObjectType):
+    orders = CRMConnectionField(lambda: OrderType, loader="product_orders", required=True)
+
     class Meta:
         model = Product
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CRMConnection
 
 
 class OrderType(DjangoObjectType):
+    products = CRMConnectionField(ProductType, loader="order_products", required=True)
+
     class Meta:
         model = Order
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CRMConnection
+
+    def resolve_customer(root, info):
+        if Order.customer.is_cached(root):
+            return root.customer
+        return get_loaders(info).customer.load(root.customer_id)
+
+
+# ==============================
+# Analytics
+# ==============================
+class SalesPeriod(graphene.Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+class SalesSummary(graphene.ObjectType):
+    total_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Float()
+
+
+class PeriodRevenue(graphene.ObjectType):
+    period = graphene.Date()
+    orders = graphene.Int()
+    revenue = graphene.Float()
+
+
+class CustomerRevenue(graphene.ObjectType):
+    customer = graphene.Field(CustomerType)
+    orders = graphene.Int()
+    revenue = graphene.Float()
+
+
+class ProductRevenue(graphene.ObjectType):
+    product = graphene.Field(ProductType)
+    orders = graphene.Int()
+    revenue = graphene.Float()
+
+
+class JobRunType(DjangoObjectType):
+    class Meta:
+        model = JobRun
+        fields = ("job", "host", "started_at", "finished_at", "duration", "outcome", "error")
+
+
+class JobStatus(graphene.ObjectType):
+    name = graphene.String(required=True)
+    running = graphene.Boolean(required=True, description="Whether a live lease is held on the job.")
+    lock_owner = graphene.String(description="host:pid:token of the lease holder while running.")
+    lock_expires_at = graphene.DateTime()
+    last_run = graphene.Field(JobRunType)
+    last_success_at = graphene.DateTime()
+    runs = graphene.Int(required=True, description="Runs recorded in the kept history, skipped ones included.")
+    failures = graphene.Int(required=True)
+    skipped = graphene.Int(required=True)
+    average_duration = graphene.Float(description="Seconds, over runs that were not skipped.")
 
 
 # ==============================
 # Queries
 # ==============================
 class Query(graphene.ObjectType):
-    all_customers = DjangoFilterConnectionField(CustomerType, order_by=graphene.List(of_type=graphene.String))
-    all_products = DjangoFilterConnectionField(ProductType, order_by=graphene.List(of_type=graphene.String))
-    all_orders = DjangoFilterConnectionField(OrderType, order_by=graphene.List(of_type=graphene.String))
+    hello = graphene.String(default_value="Hello World")
+    total_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Float()
 
-    def resolve_all_customers(self, info, order_by=None, **kwargs):
+    sales_summary = graphene.Field(SalesSummary, start=graphene.Date(), end=graphene.Date())
+    revenue_by_period = graphene.List(
+        PeriodRevenue,
+        period=SalesPeriod(default_value=SalesPeriod.DAY.value),
+        start=graphene.Date(),
+        end=graphene.Date(),
+    )
+    revenue_by_customer = graphene.List(CustomerRevenue, start=graphene.Date(), end=graphene.Date(), limit=graphene.Int())
+    revenue_by_product = graphene.List(ProductRevenue, start=graphene.Date(), end=graphene.Date(), limit=graphene.Int())
+
+    # Served from the daily sales rollup, so cost does not grow with history.
+    sales_trend = graphene.List(
+        PeriodRevenue,
+        period=SalesPeriod(default_value=SalesPeriod.DAY.value),
+        start=graphene.Date(),
+        end=graphene.Date(),
+    )
+    top_customers = graphene.List(CustomerRevenue, start=graphene.Date(), end=graphene.Date(), limit=graphene.Int())
+    top_products = graphene.List(ProductRevenue, start=graphene.Date(), end=graphene.Date(), limit=graphene.Int())
+
+    all_customers = CRMConnectionField(
+        CustomerType, keyset=True, order_by=graphene.List(of_type=graphene.String),
+        search=graphene.String(description="Match name or email, best match first."),
+    )
+    all_products = CRMConnectionField(
+        ProductType, keyset=True, order_by=graphene.List(of_type=graphene.String),
+        search=graphene.String(description="Match name, best match first."),
+    )
+    all_orders = CRMConnectionField(OrderType, keyset=True, order_by=graphene.List(of_type=graphene.String))
+
+    # Scheduled jobs (crm.locks): lease state and run history.
+    job_status = graphene.List(graphene.NonNull(JobStatus), required=True)
+    job_runs = graphene.List(graphene.NonNull(JobRunType), required=True, job=graphene.String(), limit=graphene.Int())
+
+    def resolve_all_customers(self, info, order_by=None, search=None, **kwargs):
         qs = Customer.objects.all()
+        if search:
+            qs = crm_search(qs, search)
         if order_by:
             qs = qs.order_by(*order_by)
         return qs
 
-    def resolve_all_products(self, info, order_by=None, **kwargs):
+    def resolve_all_products(self, info, order_by=None, search=None, **kwargs):
         qs = Product.objects.all()
+        if search:
+            qs = crm_search(qs, search)
         if order_by:
             qs = qs.order_by(*order_by)
         return qs
@@ -53,6 +165,55 @@ class Query(graphene.ObjectType):
             qs = qs.order_by(*order_by)
         return qs
 
+    # Async, so the async view runs these on the event loop, concurrently
+    # with the other root fields; the WSGI view runs them to completion.
+    @async_resolver
+    async def resolve_total_customers(root, info):
+        return await Customer.objects.acount()
+
+    @async_resolver
+    async def resolve_total_orders(root, info):
+        return await Order.objects.acount()
+
+    @async_resolver
+    async def resolve_total_revenue(root, info):
+        totals = await Order.objects.aaggregate(revenue=Sum("total_amount"))
+        return totals["revenue"] or 0
+
+    @async_resolver
+    async def resolve_sales_summary(root, info, start=None, end=None):
+        return await analytics.asales_summary(start, end)
+
+    @async_resolver
+    async def resolve_revenue_by_period(root, info, period, start=None, end=None):
+        return [row async for row in analytics.revenue_by_period(getattr(period, "value", period), start, end)]
+
+    def resolve_revenue_by_customer(root, info, start=None, end=None, limit=None):
+        return analytics.revenue_by_customer(start, end, limit)
+
+    def resolve_revenue_by_product(root, info, start=None, end=None, limit=None):
+        return analytics.revenue_by_product(start, end, limit)
+
+    @async_resolver
+    async def resolve_sales_trend(root, info, period, start=None, end=None):
+        return [row async for row in rollups.sales_trend(getattr(period, "value", period), start, end)]
+
+    def resolve_top_customers(root, info, start=None, end=None, limit=None):
+        return rollups.top_customers(start, end, limit)
+
+    def resolve_top_products(root, info, start=None, end=None, limit=None):
+        return rollups.top_products(start, end, limit)
+
+    def resolve_job_status(root, info):
+        return locks.job_status()
+
+    def resolve_job_runs(root, info, job=None, limit=20):
+        runs = JobRun.objects.order_by("-started_at", "-pk")
+        if job:
+            runs = runs.filter(job=job)
+        # An explicit null means the default; the page is 0 to 100 runs.
+        return runs[:max(0, min(20 if limit is None else limit, 100))]
+
 
 # ==============================
 # Mutations
@@ -85,42 +246,169 @@ class CreateProduct(graphene.Mutation):
         return CreateProduct(product=product)
 
 
+class OrderItemInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(default_value=1)
+
+
 class CreateOrder(graphene.Mutation):
     class Arguments:
         customer_id = graphene.ID(required=True)
-        product_id = graphene.ID(required=True)
-        total_amount = graphene.Float(required=True)
+        items = graphene.List(graphene.NonNull(OrderItemInput))
+        product_ids = graphene.List(graphene.NonNull(graphene.ID), description="Shorthand for items of quantity 1.")
 
     order = graphene.Field(OrderType)
 
-    def mutate(self, info, customer_id, product_id, total_amount):
-        customer = Customer.objects.get(pk=customer_id)
-        product = Product.objects.get(pk=product_id)
-        order = Order(customer=customer, product=product, total_amount=total_amount)
-        order.save()
+    def mutate(self, info, customer_id, items=None, product_ids=None):
+        quantities = {}
+        items = list(items or []) + [{"product_id": pid, "quantity": 1} for pid in product_ids or []]
+        for item in items:
+            if item["quantity"] is None or item["quantity"] < 1:
+                raise GraphQLError("Quantity must be a positive integer")
+            try:
+                pid = int(item["product_id"])
+            except ValueError:
+                raise GraphQLError(f"Invalid product id: {item['product_id']}")
+            quantities[pid] = quantities.get(pid, 0) + item["quantity"]
+        if not quantities:
+            raise GraphQLError("An order needs at least one product")
+        try:
+            order = place_order(customer_id, quantities)
+        except OrderError as e:
+            raise GraphQLError(str(e))
         return CreateOrder(order=order)
 
 
+# ==============================
+# Bulk Mutations
+# ==============================
+class CustomerInput(graphene.InputObjectType):
+    name = graphene.String(required=True)
+    email = graphene.String(required=True)
+    phone = graphene.String()
+
+
+class ProductInput(graphene.InputObjectType):
+    name = graphene.String(required=True)
+    price = graphene.Float(required=True)
+    stock = graphene.Int(default_value=0)
+
+
+class OrderInput(graphene.InputObjectType):
+    customer_id = graphene.ID(required=True)
+    product_ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+    total_amount = graphene.Float(description="Defaults to the sum of the products' prices.")
+    order_date = graphene.DateTime()
+
+
+class BulkCustomerResult(graphene.ObjectType):
+    index = graphene.Int()
+    success = graphene.Boolean()
+    customer = graphene.Field(CustomerType)
+    errors = graphene.List(graphene.String)
+
+
+class BulkProductResult(graphene.ObjectType):
+    index = graphene.Int()
+    success = graphene.Boolean()
+    product = graphene.Field(ProductType)
+    errors = graphene.List(graphene.String)
+
+
+class BulkOrderResult(graphene.ObjectType):
+    index = graphene.Int()
+    success = graphene.Boolean()
+    order = graphene.Field(OrderType)
+    errors = graphene.List(graphene.String)
+
+
+class BulkArguments:
+    batch_size = graphene.Int(description="Rows per INSERT; defaults to settings.CRM_BULK_BATCH_SIZE.")
+    all_or_nothing = graphene.Boolean(default_value=False, description="Create nothing if any item is invalid.")
+
+
+def bulk_results(result_type, name, entries):
+    return [
+        result_type(index=entry["index"], success=entry["success"], errors=entry["errors"], **{name: entry["instance"]})
+        for entry in entries
+    ]
+
+
+class BulkCreateCustomers(graphene.Mutation):
+    class Arguments(BulkArguments):
+        input = graphene.List(graphene.NonNull(CustomerInput), required=True)
+
+    results = graphene.List(BulkCustomerResult)
+    created_count = graphene.Int()
+
+    def mutate(self, info, input, batch_size=None, all_or_nothing=False):
+        entries = bulk.create_customers(input, batch_size, all_or_nothing)
+        return BulkCreateCustomers(
+            results=bulk_results(BulkCustomerResult, "customer", entries),
+            created_count=sum(entry["success"] for entry in entries),
+        )
+
+
+class BulkCreateProducts(graphene.Mutation):
+    class Arguments(BulkArguments):
+        input = graphene.List(graphene.NonNull(ProductInput), required=True)
+
+    results = graphene.List(BulkProductResult)
+    created_count = graphene.Int()
+
+    def mutate(self, info, input, batch_size=None, all_or_nothing=False):
+        entries = bulk.create_products(input, batch_size, all_or_nothing)
+        return BulkCreateProducts(
+            results=bulk_results(BulkProductResult, "product", entries),
+            created_count=sum(entry["success"] for entry in entries),
+        )
+
+
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments(BulkArguments):
+        input = graphene.List(graphene.NonNull(OrderInput), required=True)
+
+    results = graphene.List(BulkOrderResult)
+    created_count = graphene.Int()
+
+    def mutate(self, info, input, batch_size=None, all_or_nothing=False):
+        entries = bulk.create_orders(input, batch_size, all_or_nothing)
+        return BulkCreateOrders(
+            results=bulk_results(BulkOrderResult, "order", entries),
+            created_count=sum(entry["success"] for entry in entries),
+        )
+
+
 # ==============================
 # New Mutation: Update Low Stock
 # ==============================
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
         increment = graphene.Int(required=False, default_value=10)
+        threshold = graphene.Int(required=False, default_value=10)
+        product_ids = graphene.List(graphene.NonNull(graphene.ID), description="Only restock these products.")
+        dry_run = graphene.Boolean(required=False, default_value=False)
+        limit = graphene.Int(required=False, default_value=100, description="Maximum updated products returned.")
 
+    success = graphene.Boolean()
+    updated_count = graphene.Int()
     updated_products = graphene.List(ProductType)
     message = graphene.String()
 
-    def mutate(self, info, increment):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated = []
-        for product in low_stock_products:
-            product.stock += increment
-            product.save()
-            updated.append(product)
-
-        message = f"Updated {len(updated)} products with stock < 10"
-        return UpdateLowStockProducts(updated_products=updated, message=message)
+    def mutate(self, info, increment, threshold, product_ids=None, dry_run=False, limit=100):
+        if increment <= 0:
+            return UpdateLowStockProducts(success=False, updated_count=0, updated_products=[],
+                                          message="Increment must be a positive integer")
+        if product_ids is not None:
+            invalid = [pid for pid in product_ids if not pid.isdigit()]
+            if invalid:
+                return UpdateLowStockProducts(success=False, updated_count=0, updated_products=[],
+                                              message=f"Invalid product ids: {', '.join(invalid)}")
+            product_ids = [int(pid) for pid in product_ids]
+        count, updated = restock_low_stock(threshold, increment, product_ids, dry_run, limit)
+        verb = "Would update" if dry_run else "Updated"
+        message = f"{verb} {count} products with stock < {threshold}"
+        return UpdateLowStockProducts(success=True, updated_count=count, updated_products=updated, message=message)
 
 
 # ==============================
@@ -131,26 +419,70 @@ class Mutation(graphene.ObjectType):
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
+    bulk_create_customers = BulkCreateCustomers.Field()
+    bulk_create_products = BulkCreateProducts.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
 
 
-class Query(graphene.ObjectType):
-    hello = graphene.String(default_value="Hello World")
-    total_customers = graphene.Int()
-    total_orders = graphene.Int()
-    total_revenue = graphene.Float()
+# ==============================
+# Subscriptions
+# ==============================
+class StockChange(graphene.ObjectType):
+    product = graphene.Field(ProductType, required=True)
+    previous = graphene.Int(description="Stock before the change; null for a new product.")
+    stock = graphene.Int(required=True)
+
+
+async def load_order(message):
+    return await Order.objects.select_related("customer").filter(pk=message["id"]).afirst()
+
+
+async def load_stock_change(message):
+    product = await Product.objects.filter(pk=message["id"]).afirst()
+    if product is not None:
+        return StockChange(product=product, previous=message["previous"], stock=message["stock"])
+
+
+def stock_below(threshold):
+    return lambda message: message["stock"] < threshold
+
+
+def stock_drops_below(threshold):
+    def accept(message):
+        previous = message["previous"]
+        return message["stock"] < threshold and (previous is None or previous >= threshold)
+    return accept
+
+
+class Subscription(graphene.ObjectType):
+    """Served over WebSocket by ``crm.websocket``.
+
+    Events come from ``crm.pubsub``; subscribers with the same arguments
+    share one stream, so each event is filtered and loaded once.
+    """
 
-    def resolve_total_customers(root, info):
-        from crm.models import Customer
-        return Customer.objects.count()
+    order_created = graphene.Field(OrderType, required=True)
+    product_stock_changed = graphene.Field(
+        StockChange, required=True,
+        threshold=graphene.Int(description="Only changes that leave the stock below this."),
+    )
+    low_stock_alert = graphene.Field(
+        StockChange, required=True,
+        description="A product's stock dropped below GRAPHQL_SUBSCRIPTIONS['LOW_STOCK_THRESHOLD'].",
+    )
 
-    def resolve_total_orders(root, info):
-        from crm.models import Order
-        return Order.objects.count()
+    def subscribe_order_created(root, info):
+        return pubsub.get_hub().subscribe(pubsub.ORDER_CREATED, load=load_order)
 
-    def resolve_total_revenue(root, info):
-        from crm.models import Order
-        return sum(order.totalamount for order in Order.objects.all())
+    def subscribe_product_stock_changed(root, info, threshold=None):
+        accept = None if threshold is None else stock_below(threshold)
+        return pubsub.get_hub().subscribe(pubsub.STOCK_CHANGED, ("below", threshold), accept, load_stock_change)
 
+    def subscribe_low_stock_alert(root, info):
+        threshold = pubsub.get_options()["LOW_STOCK_THRESHOLD"]
+        return pubsub.get_hub().subscribe(
+            pubsub.STOCK_CHANGED, ("drops below", threshold), stock_drops_below(threshold), load_stock_change,
+        )
 
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+schema = graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
@@ -0,0 +1,197 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+
+from .models import Customer, Product
+
+# Fields matched by the ``search`` argument, per model.
+SEARCH_FIELDS = {
+    Customer: ("name", "email"),
+    Product: ("name",),
+}
+
+
+class SearchBackend:
+    """Filters a queryset to rows matching a search term, best match first.
+
+    ``search`` annotates each row with ``search_rank`` (higher is better)
+    and orders by it.  ``install`` and ``uninstall`` create and drop any
+    database structures the backend relies on; ``manage.py
+    rebuild_search_index`` calls them, and ``restore`` puts back what a
+    migration lost after every ``migrate``.  The ``0004`` migration keeps
+    its own copy of the structures as they were created then.
+    """
+
+    def search(self, queryset, term):
+        fields = SEARCH_FIELDS[queryset.model]
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f"{field}__icontains": term})
+        rank = self.rank(fields, term)
+        return queryset.filter(condition).annotate(search_rank=rank).order_by("-search_rank", "pk")
+
+    def rank(self, fields, term):
+        return Case(When(**{f"{fields[0]}__istartswith": term}, then=Value(1.0)), default=Value(0.0))
+
+    def install(self, schema_editor):
+        pass
+
+    def uninstall(self, schema_editor):
+        pass
+
+    def restore(self, schema_editor):
+        pass
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Trigram matching through ``pg_trgm`` GIN indexes.
+
+    ``icontains`` compiles to ``ILIKE``, which the trigram indexes serve, and
+    rows are ranked by their best word similarity to the term.
+    """
+
+    def rank(self, fields, term):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        similarities = [TrigramWordSimilarity(term, field) for field in fields]
+        return Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+
+    def install(self, schema_editor):
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for model, fields in SEARCH_FIELDS.items():
+            table = model._meta.db_table
+            for field in fields:
+                column = model._meta.get_field(field).column
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table}_{column}_trgm" ON "{table}" USING gin ("{column}" gin_trgm_ops)'
+                )
+
+    def uninstall(self, schema_editor):
+        for model, fields in SEARCH_FIELDS.items():
+            for field in fields:
+                schema_editor.execute(f'DROP INDEX IF EXISTS "{model._meta.db_table}_{model._meta.get_field(field).column}_trgm"')
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """An FTS5 shadow table per model, kept in sync by triggers.
+
+    The ``trigram`` tokenizer gives substring matches, like ``icontains``,
+    for words of three or more characters; shorter terms fall back to
+    ``icontains``.  Rows are ranked by bm25.
+
+    SQLite rebuilds a table when a migration alters it, which drops its
+    triggers; ``restore`` recreates them and reindexes after ``migrate``.
+    """
+
+    MIN_WORD = 3
+
+    @staticmethod
+    def shadow_table(model):
+        return f"{model._meta.db_table}_search"
+
+    def match(self, term):
+        words = term.split()
+        if not words or any(len(word) < self.MIN_WORD for word in words):
+            return None
+        return " ".join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+    def search(self, queryset, term):
+        match = self.match(term)
+        if match is None:
+            return super().search(queryset, term)
+        model = queryset.model
+        table, pk, fts = model._meta.db_table, model._meta.pk.column, self.shadow_table(model)
+        # The shadow table is joined once, so MATCH and bm25 run in a single
+        # FTS query; extra() is the only way to put a virtual table in FROM.
+        return queryset.extra(
+            tables=[fts],
+            where=[f'"{fts}".rowid = "{table}"."{pk}"', f'"{fts}" MATCH %s'],
+            params=[match],
+            select={"search_rank": f'-bm25("{fts}")'},
+        ).order_by("-search_rank", "pk")
+
+    def install(self, schema_editor):
+        for model, fields in SEARCH_FIELDS.items():
+            table, pk, fts = model._meta.db_table, model._meta.pk.column, self.shadow_table(model)
+            columns = [model._meta.get_field(field).column for field in fields]
+            names = ", ".join(f'"{column}"' for column in columns)
+            new = ", ".join(f'new."{column}"' for column in columns)
+            old = ", ".join(f'old."{column}"' for column in columns)
+            self.uninstall_table(schema_editor, model)
+            schema_editor.execute(
+                f'CREATE VIRTUAL TABLE "{fts}" USING fts5({names}, '
+                f"content='{table}', content_rowid='{pk}', tokenize='trigram')"
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER "{fts}_insert" AFTER INSERT ON "{table}" BEGIN '
+                f'INSERT INTO "{fts}" (rowid, {names}) VALUES (new."{pk}", {new}); END'
+            )
+            schema_editor.execute(
+                f'CREATE TRIGGER "{fts}_delete" AFTER DELETE ON "{table}" BEGIN '
+                f'INSERT INTO "{fts}" ("{fts}", rowid, {names}) VALUES (\'delete\', old."{pk}", {old}); END'
+            )
+            # Only on searched columns, so stock and price updates skip the index.
+            schema_editor.execute(
+                f'CREATE TRIGGER "{fts}_update" AFTER UPDATE OF {names} ON "{table}" BEGIN '
+                f'INSERT INTO "{fts}" ("{fts}", rowid, {names}) VALUES (\'delete\', old."{pk}", {old}); '
+                f'INSERT INTO "{fts}" (rowid, {names}) VALUES (new."{pk}", {new}); END'
+            )
+            schema_editor.execute(f'INSERT INTO "{fts}" ("{fts}") VALUES (\'rebuild\')')
+
+    def uninstall(self, schema_editor):
+        for model in SEARCH_FIELDS:
+            self.uninstall_table(schema_editor, model)
+
+    def restore(self, schema_editor):
+        """Reinstall when a shadow table is there but some of its triggers are not."""
+        names = [self.shadow_table(model) for model in SEARCH_FIELDS]
+        triggers = [f"{fts}_{trigger}" for fts in names for trigger in ("insert", "delete", "update")]
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+            present = {row[0] for row in cursor.fetchall()}
+        if set(names) <= present and not set(triggers) <= present:
+            self.install(schema_editor)
+
+    def uninstall_table(self, schema_editor, model):
+        fts = self.shadow_table(model)
+        for trigger in ("insert", "delete", "update"):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS "{fts}_{trigger}"')
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{fts}"')
+
+    @staticmethod
+    def is_supported(connection):
+        if connection.Database.sqlite_version_info < (3, 34):
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            return "ENABLE_FTS5" in {row[0] for row in cursor.fetchall()}
+
+
+_backends = {}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    """The backend for database ``using``.
+
+    ``settings.CRM_SEARCH_BACKEND`` (a dotted path) overrides the choice by
+    database vendor.
+    """
+    if using not in _backends:
+        connection = connections[using]
+        path = getattr(settings, "CRM_SEARCH_BACKEND", None)
+        if path:
+            backend = import_string(path)()
+        elif connection.vendor == "postgresql":
+            backend = PostgresSearchBackend()
+        elif connection.vendor == "sqlite" and SQLiteSearchBackend.is_supported(connection):
+            backend = SQLiteSearchBackend()
+        else:
+            backend = SearchBackend()
+        _backends[using] = backend
+    return _backends[using]
+
+
+def search(queryset, term):
+    return get_search_backend(queryset.db).search(queryset, term)
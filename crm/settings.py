@@ -149,3 +149,13 @@ CELERY_BEAT_SCHEDULE = {
         "schedule": crontab(day_of_week="mon", hour=6, minute=0),
     },
 }
+
+# The CRM_* options come from the project settings, so the Celery worker and
+# the web and cron processes share one copy of them.
+from alx_backend_graphql.settings import (  # noqa: E402
+    CRM_BULK_BATCH_SIZE,
+    CRM_CHUNKED_JOBS,
+    CRM_JOB_LOCKS,
+    CRM_JOB_LOG,
+    CRM_ORDER_REMINDERS,
+)
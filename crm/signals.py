@@ -0,0 +1,113 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import pubsub, response_cache, rollups, search
+from .models import Customer, Product, Order
+
+
+def rollup_bucket(order):
+    return (rollups.order_day(order.order_date), order.customer_id)
+
+
+# ==============================
+# Sales rollup maintenance
+# ==============================
+@receiver(pre_save, sender=Order)
+def remember_rollup_bucket(sender, instance, raw=False, **kwargs):
+    """Note the bucket an existing order is leaving before it is updated."""
+    instance._rollup_bucket = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    old = Order.objects.filter(pk=instance.pk).only("order_date", "customer_id").first()
+    if old is not None:
+        instance._rollup_bucket = rollup_bucket(old)
+
+
+@receiver(post_save, sender=Order)
+def refresh_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = {rollup_bucket(instance)}
+    if getattr(instance, "_rollup_bucket", None):
+        keys.add(instance._rollup_bucket)
+    rollups.refresh(keys)
+
+
+@receiver(post_delete, sender=Order)
+def refresh_rollup_on_delete(sender, instance, **kwargs):
+    rollups.refresh({rollup_bucket(instance)})
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def refresh_rollup_on_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            rollups.refresh({rollup_bucket(instance)})
+        return
+    # product.orders.add/remove/clear: the touched orders are in pk_set,
+    # except for clear where they must be read before the rows go away.
+    if action == "pre_clear":
+        instance._rollup_orders = list(instance.orders.only("order_date", "customer_id"))
+    elif action in ("post_add", "post_remove"):
+        rollups.refresh_orders(Order.objects.filter(pk__in=pk_set).only("order_date", "customer_id"))
+    elif action == "post_clear":
+        rollups.refresh_orders(getattr(instance, "_rollup_orders", []))
+
+
+# ==============================
+# Response cache invalidation
+# ==============================
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def invalidate_responses(sender, **kwargs):
+    response_cache.invalidate()
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_responses_on_products(sender, action, **kwargs):
+    if action.startswith("post_"):
+        response_cache.invalidate()
+
+
+# ==============================
+# Subscription events
+# ==============================
+@receiver(pre_save, sender=Product)
+def remember_stock(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_stock = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is None or "stock" in update_fields:
+        instance._previous_stock = Product.objects.filter(pk=instance.pk).values_list("stock", flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def publish_stock_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and "stock" not in update_fields):
+        return
+    previous = getattr(instance, "_previous_stock", None)
+    if created or previous != instance.stock:
+        pubsub.stock_changed(instance.pk, previous, instance.stock)
+
+
+@receiver(post_save, sender=Order)
+def publish_order_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        pubsub.order_created(instance.pk)
+
+
+# ==============================
+# Search index maintenance
+# ==============================
+@receiver(post_migrate)
+def restore_search_index(sender, app_config, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Recreate search structures a table rebuild in a migration dropped."""
+    if app_config.label != "crm":
+        return
+    with connections[using].schema_editor() as schema_editor:
+        search.get_search_backend(using).restore(schema_editor)
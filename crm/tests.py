@@ -1,3 +1,1554 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Permission, User
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from gql.transport.transport import Transport
+from graphql import ExecutionResult, print_ast
+
+from alx_backend_graphql.schema import schema
+from . import benchmarks, chunking, export, graphql_client, importer, joblog, locks, pubsub, reminders, rollups, search, tasks
+from .celery import app as celery_app
+from .documents import DocumentCache, get_document_cache, query_hash
+from .inventory import OrderError, place_order, restock_low_stock
+from .loaders import Loaders
+from .models import Customer, Product, Order, ChunkResult, DailySalesRollup, JobLock, JobRun, JobState
+from .response_cache import get_response_cache
+from .tracing import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def execute(query, variables=None):
+    """Run ``query`` against the project schema with a fresh request context."""
+    request = RequestFactory().post("/graphql")
+    result = schema.execute(query, variables=variables, context_value=request)
+    assert result.errors is None, result.errors
+    return result.data
+
+
+def seed_orders(count, products_per_order=2):
+    products = [
+        Product.objects.create(name=f"Product {i}", price=10 + i, stock=100)
+        for i in range(products_per_order + 1)
+    ]
+    for i in range(count):
+        customer = Customer.objects.create(name=f"Customer {i}", email=f"customer{i}@example.com")
+        order = Order.objects.create(customer=customer, total_amount=20)
+        order.products.set(products[i % 2:i % 2 + products_per_order])
+
+
+def use_job_log(test):
+    """Send ``crm.joblog`` records to a temporary file for ``test``; returns its path."""
+    tmp = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, tmp)
+    path = os.path.join(tmp, "crm_jobs.jsonl")
+    overridden = override_settings(CRM_JOB_LOG={"PATH": path})
+    overridden.enable()
+    test.addCleanup(overridden.disable)
+    # The handler is cached; closing it makes the next record use ``path``.
+    joblog.reset()
+    test.addCleanup(joblog.reset)
+    return path
+
+
+ORDERS_QUERY = """
+query ($first: Int) {
+    allOrders(first: $first) {
+        edges {
+            node {
+                id
+                customer {
+                    name
+                    orders { edges { node { id } } }
+                }
+                products {
+                    edges { node { name orders { edges { node { id } } } } }
+                }
+            }
+        }
+    }
+}
+"""
+
+
+class DataLoaderTests(TestCase):
+    def query_count(self, first):
+        with CaptureQueriesContext(connection) as ctx:
+            data = execute(ORDERS_QUERY, {"first": first})
+        self.assertEqual(len(data["allOrders"]["edges"]), first)
+        return len(ctx.captured_queries)
+
+    def test_nested_relations_use_constant_queries(self):
+        seed_orders(20)
+        # The page with the customer joined, then one prefetch per to-many
+        # relation: customer orders, order products, product orders.
+        self.assertEqual(self.query_count(5), 4)
+        self.assertEqual(self.query_count(20), 4)
+
+    def test_loaders_batch_tracked_instances(self):
+        seed_orders(10)
+        loaders = Loaders()
+        orders = list(Order.objects.all())
+        loaders.track(orders)
+        with self.assertNumQueries(2):
+            customers = [loaders.customer.load(order.customer_id) for order in orders]
+            products = [loaders.order_products.load(order.pk) for order in orders]
+        self.assertEqual([c.pk for c in customers], [o.customer_id for o in orders])
+        self.assertEqual(len(products[0]), 2)
+
+    def test_nested_relations_resolve_correct_rows(self):
+        seed_orders(3)
+        edges = execute(ORDERS_QUERY, {"first": 3})["allOrders"]["edges"]
+        for edge, order in zip(edges, Order.objects.order_by("pk")):
+            node = edge["node"]
+            self.assertEqual(node["customer"]["name"], order.customer.name)
+            self.assertEqual(
+                [p["node"]["name"] for p in node["products"]["edges"]],
+                [p.name for p in order.products.order_by("pk")],
+            )
+            self.assertEqual(len(node["customer"]["orders"]["edges"]), 1)
+
+
+class QueryOptimizerTests(TestCase):
+    def capture(self, query):
+        with CaptureQueriesContext(connection) as ctx:
+            execute(query)
+        return [q["sql"] for q in ctx.captured_queries]
+
+    def test_only_selected_columns_are_read(self):
+        seed_orders(3)
+        page = self.capture("{ allCustomers(first: 2) { edges { node { name } } } }")[-1]
+        self.assertIn('"crm_customer"."name"', page)
+        self.assertNotIn('"crm_customer"."email"', page)
+
+    def test_fragments_select_related_and_prefetch(self):
+        seed_orders(3)
+        queries = self.capture("""
+            fragment OrderFields on OrderType {
+                totalAmount
+                customer { email }
+                products { edges { node { price } } }
+            }
+            { allOrders { edges { node { ...OrderFields } } } }
+        """)
+        self.assertEqual(len(queries), 2)
+        self.assertIn('INNER JOIN "crm_customer"', queries[0])
+        self.assertNotIn('"crm_customer"."phone"', queries[0])
+        self.assertIn('"crm_product"."price"', queries[1])
+
+    def test_filtered_nested_connections_are_not_prefetched(self):
+        seed_orders(2)
+        data = execute("""{
+            allCustomers {
+                edges { node { name orders(totalAmount_Gte: 100) { edges { node { id } } } } }
+            }
+        }""")
+        self.assertEqual([e["node"]["orders"]["edges"] for e in data["allCustomers"]["edges"]], [[], []])
+
+
+class KeysetPaginationTests(TestCase):
+    QUERY = """
+        query ($orderBy: [String], $first: Int, $after: String, $last: Int, $before: String) {
+            allOrders(orderBy: $orderBy, first: $first, after: $after, last: $last, before: $before) {
+                edges { node { totalAmount } }
+                pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+            }
+        }
+    """
+
+    def setUp(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        day = timezone.now().replace(microsecond=0)
+        # Pairs of orders share an order_date, so the id tiebreaker matters.
+        for i in range(7):
+            Order.objects.create(customer=customer, total_amount=i, order_date=day - datetime.timedelta(days=i // 2))
+
+    def walk(self, order_by, **page):
+        amounts, variables = [], {"orderBy": order_by, **page}
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                connection_data = execute(self.QUERY, variables)["allOrders"]
+            self.assertEqual(len(ctx.captured_queries), 1)
+            self.assertNotIn("OFFSET", ctx.captured_queries[0]["sql"])
+            edges = [int(float(edge["node"]["totalAmount"])) for edge in connection_data["edges"]]
+            info = connection_data["pageInfo"]
+            if "last" in page:
+                amounts[:0] = edges
+                if not info["hasPreviousPage"]:
+                    return amounts
+                variables["before"] = info["startCursor"]
+            else:
+                amounts.extend(edges)
+                if not info["hasNextPage"]:
+                    return amounts
+                variables["after"] = info["endCursor"]
+
+    def expected(self, *ordering):
+        return [int(amount) for amount in Order.objects.order_by(*ordering).values_list("total_amount", flat=True)]
+
+    def test_pages_follow_order_by_with_id_tiebreaker(self):
+        self.assertEqual(self.walk(["-order_date"], first=2), self.expected("-order_date", "-id"))
+        self.assertEqual(self.walk(["order_date"], first=3), self.expected("order_date", "id"))
+        self.assertEqual(self.walk(None, first=2), self.expected("id"))
+
+    def test_backward_pages_and_mixed_directions(self):
+        self.assertEqual(self.walk(["-order_date"], last=2), self.expected("-order_date", "-id"))
+        self.assertEqual(self.walk(["order_date", "-total_amount"], first=2), self.expected("order_date", "-total_amount", "id"))
+
+    def test_uniform_ordering_seeks_with_a_row_comparison(self):
+        cursor = execute(self.QUERY, {"orderBy": ["-order_date"], "first": 2})["allOrders"]["pageInfo"]["endCursor"]
+        with CaptureQueriesContext(connection) as ctx:
+            execute(self.QUERY, {"orderBy": ["-order_date"], "first": 2, "after": cursor})
+        self.assertIn('("crm_order"."order_date", "crm_order"."id") < (', ctx.captured_queries[0]["sql"])
+
+    def test_cursor_must_match_ordering(self):
+        cursor = execute(self.QUERY, {"orderBy": ["-order_date"], "first": 2})["allOrders"]["pageInfo"]["endCursor"]
+        result = schema.execute(
+            self.QUERY, variables={"orderBy": ["order_date"], "first": 2, "after": cursor},
+            context_value=RequestFactory().post("/graphql"),
+        )
+        self.assertIn("different ordering", result.errors[0].message)
+
+    def test_offset_pagination_still_works(self):
+        data = execute("{ allOrders(orderBy: [\"id\"], first: 2, offset: 3) { edges { node { totalAmount } } } }")
+        self.assertEqual([float(e["node"]["totalAmount"]) for e in data["allOrders"]["edges"]], [3, 4])
+
+
+class ConnectionCountTests(TestCase):
+    def setUp(self):
+        seed_orders(5)
+        caches["default"].clear()
+
+    def capture(self, query, variables=None):
+        with CaptureQueriesContext(connection) as ctx:
+            data = execute(query, variables)
+        return data, [q["sql"] for q in ctx.captured_queries]
+
+    def test_offset_pages_fetch_one_extra_row_instead_of_counting(self):
+        query = "query ($offset: Int) { allCustomers(first: 2, offset: $offset) { edges { node { name } } pageInfo { hasNextPage } } }"
+        data, queries = self.capture(query, {"offset": 2})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("COUNT", queries[0])
+        self.assertIn("LIMIT 3", queries[0])
+        self.assertTrue(data["allCustomers"]["pageInfo"]["hasNextPage"])
+        data, _ = self.capture(query, {"offset": 3})
+        self.assertFalse(data["allCustomers"]["pageInfo"]["hasNextPage"])
+
+    def test_total_count_only_when_selected(self):
+        page = execute('{ allCustomers(name: "Customer", first: 2) { pageInfo { endCursor } } }')
+        after = page["allCustomers"]["pageInfo"]["endCursor"]
+        data, queries = self.capture(
+            'query ($after: String) { allCustomers(name: "Customer", first: 2, after: $after) { totalCount edges { node { name } } } }',
+            {"after": after},
+        )
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(data["allCustomers"]["totalCount"], 5)
+        self.assertEqual(len(data["allCustomers"]["edges"]), 2)
+
+    def test_approximate_total_count_is_cached(self):
+        query = "{ allOrders(first: 1) { approximateTotalCount } }"
+        data, queries = self.capture(query)
+        self.assertEqual((data["allOrders"]["approximateTotalCount"], len(queries)), (5, 2))
+        Customer.objects.create(name="Late", email="late@example.com")
+        Order.objects.create(customer=Customer.objects.get(email="late@example.com"))
+        data, queries = self.capture(query)
+        self.assertEqual((data["allOrders"]["approximateTotalCount"], len(queries)), (5, 1))
+
+    def test_nested_loader_connections_count_their_rows(self):
+        data = execute("{ allOrders(first: 2) { edges { node { products { totalCount } } } } }")
+        self.assertEqual([e["node"]["products"]["totalCount"] for e in data["allOrders"]["edges"]], [2, 2])
+
+
+class SearchTests(TestCase):
+    QUERY = """
+        query ($search: String, $after: String) {
+            allCustomers(search: $search, first: 2, after: $after) {
+                totalCount
+                edges { node { name } }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+    """
+
+    def setUp(self):
+        Customer.objects.create(name="Alice Smith", email="alice@example.com")
+        Customer.objects.create(name="Bob Alison", email="bob@example.com")
+        Customer.objects.create(name="Carol Jones", email="carol@alimail.com")
+        Customer.objects.create(name="Dave", email="dave@example.com")
+
+    def names(self, search):
+        return [edge["node"]["name"] for edge in execute(self.QUERY, {"search": search})["allCustomers"]["edges"]]
+
+    def test_search_matches_substrings_and_pages(self):
+        data = execute(self.QUERY, {"search": "ali"})["allCustomers"]
+        self.assertEqual(data["totalCount"], 3)
+        self.assertTrue(data["pageInfo"]["hasNextPage"])
+        rest = execute(self.QUERY, {"search": "ali", "after": data["pageInfo"]["endCursor"]})["allCustomers"]
+        found = [edge["node"]["name"] for edge in data["edges"] + rest["edges"]]
+        self.assertCountEqual(found, ["Alice Smith", "Bob Alison", "Carol Jones"])
+
+    def test_results_are_ranked(self):
+        # "alice" appears in both the name and the email of one customer.
+        self.assertEqual(self.names("alice")[0], "Alice Smith")
+        self.assertEqual(self.names("smith alice"), ["Alice Smith"])
+
+    def test_index_follows_writes(self):
+        dave = Customer.objects.get(name="Dave")
+        dave.name = "Dave Alighieri"
+        dave.save()
+        Customer.objects.filter(name="Bob Alison").delete()
+        self.assertCountEqual(self.names("alig"), ["Dave Alighieri"])
+        self.assertNotIn("Bob Alison", self.names("alison"))
+
+    def test_short_terms_fall_back_to_icontains(self):
+        self.assertCountEqual(self.names("Jo"), ["Carol Jones"])
+
+    def test_product_search(self):
+        Product.objects.create(name="Blue Widget", price=5)
+        Product.objects.create(name="Gadget", price=5)
+        data = execute('{ allProducts(search: "widg") { edges { node { name } } } }')
+        self.assertEqual([e["node"]["name"] for e in data["allProducts"]["edges"]], ["Blue Widget"])
+
+
+class SearchIndexTests(TransactionTestCase):
+    def test_migrate_restores_triggers_a_table_rebuild_dropped(self):
+        # SQLite drops a table's triggers when a migration rebuilds it.
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER IF EXISTS "crm_customer_search_insert"')
+        call_command("migrate", verbosity=0)
+        Customer.objects.create(name="Alice Smith", email="alice@example.com")
+        found = search.search(Customer.objects.all(), "smith")
+        self.assertEqual([customer.name for customer in found], ["Alice Smith"])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        seed_orders(5)
+        self.user = User.objects.create(username="analyst")
+        self.user.user_permissions.set(Permission.objects.filter(codename__in=["view_order", "view_customer"]))
+        self.client.force_login(self.user)
+
+    def test_exports_need_view_permissions(self):
+        self.user.user_permissions.remove(Permission.objects.get(codename="view_customer"))
+        self.assertEqual(self.client.get("/export/orders.csv").status_code, 403)
+        self.assertEqual(self.client.get("/export/products.csv").status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get("/export/customers.csv").status_code, 403)
+
+    def test_orders_stream_as_ndjson_with_filters(self):
+        response = self.client.get("/export/orders.ndjson", {"customer_name": "Customer 1"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["customer_name"] for row in rows], ["Customer 1"])
+        order = Order.objects.get(customer__name="Customer 1")
+        self.assertEqual(rows[0]["product_ids"], sorted(order.products.values_list("pk", flat=True)))
+
+    def test_csv_is_gzipped_when_accepted(self):
+        response = self.client.get("/export/customers.csv", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        text = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(text.splitlines()[0], "id,name,email,phone")
+        self.assertEqual(len(text.splitlines()), 6)
+
+    def test_related_rows_are_fetched_per_chunk(self):
+        # One query for the orders, one for the products of each chunk of two.
+        with self.assertNumQueries(4):
+            rows = list(export.rows("orders", chunk_size=2))
+        self.assertEqual(len(rows), 5)
+        self.assertTrue(all(len(row["product_names"]) == 2 for row in rows))
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get("/export/orders.csv", {"total_amount__gte": "lots"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("total_amount__gte", response.json()["errors"])
+
+    def test_command_writes_gzip_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "orders.ndjson.gz")
+            call_command("export_crm", "orders", "--output", path, "--filter", "product_name=Product 2", stderr=StringIO())
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(len(f.readlines()), 2)
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        laptop = Product.objects.create(name="Laptop", price=900, stock=5)
+        phone = Product.objects.create(name="Phone", price=100, stock=5)
+        for customer, day, total, products in [
+            (alice, "2025-01-06", 900, [laptop]),
+            (alice, "2025-01-07", 1000, [laptop, phone]),
+            (bob, "2025-02-03", 100, [phone]),
+        ]:
+            order = Order.objects.create(
+                customer=customer, total_amount=total, order_date=f"{day}T12:00:00Z"
+            )
+            order.products.set(products)
+
+    def test_totals_are_single_aggregate_queries(self):
+        with self.assertNumQueries(3):
+            data = execute("{ totalCustomers totalOrders totalRevenue }")
+        self.assertEqual(data, {"totalCustomers": 2, "totalOrders": 3, "totalRevenue": 2000.0})
+
+    def test_sales_summary_with_date_range(self):
+        data = execute('{ salesSummary(start: "2025-01-07", end: "2025-02-03") { totalOrders totalRevenue } }')
+        self.assertEqual(data["salesSummary"], {"totalOrders": 2, "totalRevenue": 1100.0})
+
+    def test_revenue_by_period(self):
+        data = execute("""{
+            days: revenueByPeriod(end: "2025-01-31") { period orders revenue }
+            months: revenueByPeriod(period: MONTH) { period revenue }
+        }""")
+        self.assertEqual(data["days"], [
+            {"period": "2025-01-06", "orders": 1, "revenue": 900.0},
+            {"period": "2025-01-07", "orders": 1, "revenue": 1000.0},
+        ])
+        self.assertEqual(data["months"], [
+            {"period": "2025-01-01", "revenue": 1900.0},
+            {"period": "2025-02-01", "revenue": 100.0},
+        ])
+
+    def test_revenue_by_customer_and_product(self):
+        with self.assertNumQueries(4):
+            data = execute("""{
+                revenueByCustomer(limit: 1) { customer { name } orders revenue }
+                revenueByProduct { product { name } orders revenue }
+            }""")
+        self.assertEqual(data["revenueByCustomer"], [{"customer": {"name": "Alice"}, "orders": 2, "revenue": 1900.0}])
+        self.assertEqual(data["revenueByProduct"], [
+            {"product": {"name": "Laptop"}, "orders": 2, "revenue": 1900.0},
+            {"product": {"name": "Phone"}, "orders": 2, "revenue": 1100.0},
+        ])
+
+
+class SalesRollupTests(TestCase):
+    setUp = AnalyticsTests.setUp
+
+    ROLLUP_QUERY = """{
+        salesTrend(period: MONTH) { period orders revenue }
+        topCustomers { customer { name } orders revenue }
+        topProducts { product { name } orders revenue }
+    }"""
+    LIVE_QUERY = """{
+        salesTrend: revenueByPeriod(period: MONTH) { period orders revenue }
+        topCustomers: revenueByCustomer { customer { name } orders revenue }
+        topProducts: revenueByProduct { product { name } orders revenue }
+    }"""
+
+    def assertRollupMatchesOrders(self):
+        self.assertEqual(execute(self.ROLLUP_QUERY), execute(self.LIVE_QUERY))
+
+    def test_rollup_tracks_saves_and_product_changes(self):
+        self.assertRollupMatchesOrders()
+        order = Order.objects.get(total_amount=900)
+        order.total_amount = 500
+        order.order_date = "2025-02-10T08:00:00Z"
+        order.customer = Customer.objects.get(name="Bob")
+        order.save()
+        self.assertRollupMatchesOrders()
+        order.products.add(Product.objects.get(name="Phone"))
+        Product.objects.get(name="Laptop").orders.clear()
+        self.assertRollupMatchesOrders()
+
+    def test_placed_order_refreshes_its_bucket_once(self):
+        customer = Customer.objects.get(name="Bob")
+        products = Product.objects.filter(name__in=["Laptop", "Phone"])
+        with CaptureQueriesContext(connection) as queries:
+            place_order(customer.pk, {product.pk: 1 for product in products})
+        deletes = [q["sql"] for q in queries if q["sql"].startswith('DELETE FROM "crm_dailysalesrollup"')]
+        self.assertEqual(len(deletes), 1)
+        self.assertRollupMatchesOrders()
+
+    def test_rollup_tracks_deletes(self):
+        Order.objects.get(total_amount=1000).delete()
+        self.assertRollupMatchesOrders()
+        Customer.objects.get(name="Bob").delete()
+        self.assertRollupMatchesOrders()
+
+    def test_rebuild_command(self):
+        def snapshot():
+            return list(
+                DailySalesRollup.objects.order_by("day", "customer", "product")
+                .values_list("day", "customer", "product", "order_count", "revenue")
+            )
+
+        expected = snapshot()
+        DailySalesRollup.objects.all().delete()
+        call_command("rebuild_sales_rollup", chunk_days=2, stdout=StringIO())
+        self.assertEqual(snapshot(), expected)
+
+
+class BulkMutationTests(TestCase):
+    def test_bulk_create_customers_validates_in_one_pass(self):
+        Customer.objects.create(name="Taken", email="taken@example.com")
+        items = [{"name": f"C{i}", "email": f"c{i}@example.com"} for i in range(50)]
+        items += [{"name": "Dup", "email": "c0@example.com"}, {"name": "Old", "email": "taken@example.com"}]
+        # Existing-email lookup, then one INSERT per batch of 20 (50 rows) in a savepoint.
+        with self.assertNumQueries(6):
+            data = execute(
+                "mutation ($input: [CustomerInput!]!) { bulkCreateCustomers(input: $input, batchSize: 20) "
+                "{ createdCount results { index success errors } } }",
+                {"input": items},
+            )["bulkCreateCustomers"]
+        self.assertEqual(data["createdCount"], 50)
+        self.assertEqual(data["results"][50]["errors"], ["Duplicate email in batch: c0@example.com."])
+        self.assertEqual(data["results"][51]["errors"], ["Email already exists: taken@example.com."])
+        self.assertEqual(Customer.objects.count(), 51)
+
+    def test_all_or_nothing_creates_nothing_on_error(self):
+        data = execute("""mutation {
+            bulkCreateProducts(allOrNothing: true, input: [{name: "Ok", price: 1}, {name: "Bad", price: -1}]) {
+                createdCount results { success errors }
+            }
+        }""")["bulkCreateProducts"]
+        self.assertEqual(data["createdCount"], 0)
+        self.assertEqual(data["results"][1]["errors"], ["Price must be a non-negative number."])
+        self.assertFalse(Product.objects.exists())
+
+    def test_bulk_create_orders_inserts_product_links(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        laptop = Product.objects.create(name="Laptop", price=900, stock=5)
+        phone = Product.objects.create(name="Phone", price=100, stock=5)
+        data = execute(
+            "mutation ($input: [OrderInput!]!) { bulkCreateOrders(input: $input) "
+            "{ createdCount results { errors order { totalAmount products { edges { node { name } } } } } } }",
+            {"input": [
+                {"customerId": customer.pk, "productIds": [laptop.pk, phone.pk, laptop.pk]},
+                {"customerId": customer.pk, "productIds": [phone.pk], "totalAmount": 80},
+                {"customerId": 999, "productIds": [998]},
+            ]},
+        )["bulkCreateOrders"]
+        self.assertEqual(data["createdCount"], 2)
+        self.assertEqual(data["results"][0]["order"]["totalAmount"], "1000.00")
+        self.assertEqual(len(data["results"][0]["order"]["products"]["edges"]), 2)
+        self.assertEqual(data["results"][2]["errors"], ["Customer not found: 999.", "Products not found: 998."])
+        self.assertEqual(Order.products.through.objects.count(), 3)
+        self.assertEqual(DailySalesRollup.objects.get(product=None).revenue, 1080)
+
+
+class UpdateLowStockProductsTests(TestCase):
+    MUTATION = """mutation ($threshold: Int, $ids: [ID!], $dryRun: Boolean, $limit: Int) {
+        updateLowStockProducts(threshold: $threshold, productIds: $ids, dryRun: $dryRun, limit: $limit) {
+            success updatedCount message updatedProducts { name stock }
+        }
+    }"""
+
+    def setUp(self):
+        for i in range(5):
+            Product.objects.create(name=f"P{i}", price=1, stock=i * 5)
+
+    def test_restocks_with_one_update(self):
+        events = []
+        pubsub.get_broker().listen(pubsub.STOCK_CHANGED, events.append)
+        self.addCleanup(pubsub.get_broker().unlisten, pubsub.STOCK_CHANGED, events.append)
+        # Key lookup, UPDATE and sample reload inside one savepoint, then a
+        # re-read for the events once committed.
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            data = execute(self.MUTATION, {"threshold": 12, "limit": 2})["updateLowStockProducts"]
+        self.assertEqual(len(queries), 6)
+        self.assertEqual(sum(query["sql"].startswith("UPDATE") for query in queries), 1)
+        # Every restocked product gets its event, not only the returned ones.
+        self.assertEqual([(event["previous"], event["stock"]) for event in events], [(0, 10), (5, 15), (10, 20)])
+        self.assertTrue(data["success"])
+        self.assertEqual(data["updatedCount"], 3)
+        self.assertEqual(data["updatedProducts"], [{"name": "P0", "stock": 10}, {"name": "P1", "stock": 15}])
+        self.assertEqual(list(Product.objects.order_by("pk").values_list("stock", flat=True)), [10, 15, 20, 15, 20])
+
+    def test_dry_run_and_product_filter(self):
+        ids = list(Product.objects.filter(name__in=["P0", "P3"]).values_list("pk", flat=True))
+        data = execute(self.MUTATION, {"threshold": 100, "ids": ids, "dryRun": True})["updateLowStockProducts"]
+        self.assertEqual(data["updatedCount"], 2)
+        self.assertEqual(data["message"], "Would update 2 products with stock < 100")
+        self.assertEqual(Product.objects.get(name="P0").stock, 0)
+
+    def test_invalid_product_ids_fail_validation(self):
+        data = execute(self.MUTATION, {"ids": ["1", "abc", "-2"]})["updateLowStockProducts"]
+        self.assertEqual((data["success"], data["updatedCount"]), (False, 0))
+        self.assertEqual(data["message"], "Invalid product ids: abc, -2")
+        self.assertEqual(Product.objects.get(name="P0").stock, 0)
+
+
+class CreateOrderTests(TestCase):
+    MUTATION = """mutation ($customer: ID!, $items: [OrderItemInput!]) {
+        createOrder(customerId: $customer, items: $items) { order { totalAmount products { edges { node { name } } } } }
+    }"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.laptop = Product.objects.create(name="Laptop", price="900.00", stock=2)
+        self.phone = Product.objects.create(name="Phone", price="100.50", stock=10)
+
+    def place(self, *items):
+        variables = {
+            "customer": self.customer.pk,
+            "items": [{"productId": product.pk, "quantity": qty} for product, qty in items],
+        }
+        request = RequestFactory().post("/graphql")
+        return schema.execute(self.MUTATION, variables=variables, context_value=request)
+
+    def test_total_is_computed_and_stock_decremented(self):
+        result = self.place((self.laptop, 1), (self.phone, 3))
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["createOrder"]["order"]["totalAmount"], "1201.50")
+        self.laptop.refresh_from_db()
+        self.phone.refresh_from_db()
+        self.assertEqual((self.laptop.stock, self.phone.stock), (1, 7))
+
+    def test_insufficient_stock_writes_nothing(self):
+        # The phone has enough but would be left with less than its quantity.
+        result = self.place((self.phone, 6), (self.laptop, 3))
+        self.assertEqual(result.errors[0].message, "Insufficient stock for: Laptop")
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 10)
+        self.assertFalse(Order.objects.exists())
+
+
+def write_file(directory, name, text):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+class ConcurrentOrderTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS = 5
+    STOCK = 25
+
+    def test_concurrent_orders_never_oversell(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        product = Product.objects.create(name="Widget", price=1, stock=self.STOCK)
+        placed, rejected = [], []
+
+        def worker():
+            try:
+                for _ in range(self.ATTEMPTS):
+                    try:
+                        placed.append(place_order(customer.pk, {product.pk: 1}).pk)
+                    except OrderError:
+                        rejected.append(1)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        logger.info("placed %d orders in %.3fs (%.0f orders/s)", len(placed), elapsed, len(placed) / elapsed)
+
+        product.refresh_from_db()
+        self.assertEqual(len(placed), self.STOCK)
+        self.assertEqual(len(rejected), self.THREADS * self.ATTEMPTS - self.STOCK)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_customers_csv_upserts_on_email(self):
+        Customer.objects.create(name="Old Alice", email="alice@example.com")
+        path = write_file(self.directory, "customers.csv", (
+            "name,email,phone\n"
+            "Alice,alice@example.com,+1234567890\n"
+            "Bob,bob@example.com,\n"
+            ",nameless@example.com,\n"
+            "Carol,not-an-email,\n"
+        ))
+        stats = importer.run("customers", {"path": path})
+        self.assertEqual((stats.rows, stats.created, stats.updated, stats.invalid), (4, 1, 1, 2))
+        self.assertEqual(stats.errors, ["row 3: Name is required.", "row 4: Invalid email: 'not-an-email'."])
+        alice = Customer.objects.get(email="alice@example.com")
+        self.assertEqual((alice.name, alice.phone), ("Alice", "+1234567890"))
+        self.assertIsNone(Customer.objects.get(email="bob@example.com").phone)
+
+    def test_existing_customers_can_be_skipped_or_rejected(self):
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        path = write_file(self.directory, "customers.ndjson", "\n".join([
+            json.dumps({"name": "Alice 2", "email": "alice@example.com"}),
+            json.dumps({"name": "Bob", "email": "bob@example.com"}),
+        ]))
+        stats = importer.run("customers", {"path": path}, on_conflict="skip")
+        self.assertEqual((stats.created, stats.skipped), (1, 1))
+        stats = importer.run("customers", {"path": path}, on_conflict="error")
+        self.assertEqual((stats.created, stats.invalid), (0, 2))
+        self.assertEqual(stats.errors[0], "row 1: Customer already exists: alice@example.com.")
+        self.assertEqual(Customer.objects.get(email="alice@example.com").name, "Alice")
+
+    def test_orders_link_products_and_refresh_the_rollup(self):
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        widget = Product.objects.create(name="Widget", price="2.50")
+        gadget = Product.objects.create(name="Gadget", price="10.00")
+        path = write_file(self.directory, "orders.ndjson.gz", "")
+        with gzip.open(path, "wt") as f:
+            f.write(json.dumps({
+                "customer_email": "alice@example.com", "product_ids": [widget.pk, gadget.pk, widget.pk],
+                "order_date": "2024-03-01T10:00:00",
+            }) + "\n")
+            f.write(json.dumps({"customer_email": "nobody@example.com", "product_ids": [widget.pk]}) + "\n")
+            f.write(json.dumps({"customer_id": alice.pk, "product_ids": f"{gadget.pk}", "total_amount": "9"}) + "\n")
+        out = StringIO()
+        call_command("import_crm", "orders", path, stdout=out, stderr=StringIO())
+        self.assertIn("orders: 3 rows", out.getvalue())
+        order = Order.objects.get(order_date__date=datetime.date(2024, 3, 1))
+        self.assertEqual(order.total_amount, 12.5)
+        self.assertEqual(set(order.products.all()), {widget, gadget})
+        self.assertEqual(Order.objects.filter(total_amount=9).count(), 1)
+        rollup = DailySalesRollup.objects.get(day=datetime.date(2024, 3, 1), product=None)
+        self.assertEqual((rollup.order_count, rollup.revenue), (1, 12.5))
+
+    def test_generate_is_reproducible(self):
+        call_command("import_crm", generate=True, customers=30, products=10, orders=50, stdout=StringIO())
+        self.assertEqual((Customer.objects.count(), Product.objects.count(), Order.objects.count()), (30, 10, 50))
+        first = list(Order.objects.order_by("pk").values_list("customer__email", "total_amount"))
+        Order.objects.all().delete()
+        call_command("import_crm", generate=True, customers=30, orders=50, stdout=StringIO())
+        self.assertEqual(Customer.objects.count(), 30)
+        self.assertEqual(list(Order.objects.order_by("pk").values_list("customer__email", "total_amount")), first)
+
+
+class ParallelImportTests(TransactionTestCase):
+    def test_workers_split_the_rows(self):
+        call_command("import_crm", generate=True, customers=200, products=20, orders=300, workers=2,
+                     batch_size=50, stdout=StringIO())
+        self.assertEqual(Customer.objects.count(), 200)
+        self.assertEqual(Order.objects.count(), 300)
+        self.assertFalse(Order.objects.filter(products=None).exists())
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_every_operation_runs_and_is_rolled_back(self):
+        benchmarks.populate(customers=30, products=10, orders=60)
+        counts = (Customer.objects.count(), Product.objects.count(), Order.objects.count())
+        results = benchmarks.run_suite(benchmarks.suite_cases(), repeat=2)
+        self.assertEqual(len(results), len(benchmarks.suite_cases()))
+        self.assertTrue(all(r["queries"] > 0 and r["p95"] >= r["p50"] for r in results.values()))
+        self.assertEqual((Customer.objects.count(), Product.objects.count(), Order.objects.count()), counts)
+
+    def test_compare_flags_slowdowns_extra_queries_and_memory(self):
+        baseline = {
+            "fast": {"p50": 10.0, "queries": 3, "peak_kb": 100.0},
+            "noisy": {"p50": 0.2, "queries": 3, "peak_kb": 100.0},
+        }
+        results = {
+            "fast": {"p50": 14.0, "queries": 4, "peak_kb": 200.0},
+            "noisy": {"p50": 0.9, "queries": 3, "peak_kb": 100.0},
+            "new": {"p50": 1.0, "queries": 1, "peak_kb": 1.0},
+        }
+        self.assertEqual(benchmarks.compare(results, baseline, threshold=0.25), [
+            "fast: p50 10.00 -> 14.00 ms", "fast: 3 -> 4 queries", "fast: peak memory 100.0 -> 200.0 KiB",
+        ])
+
+
+class TracingTests(TestCase):
+    QUERY = "{ allOrders(first: 3) { edges { node { id customer { name } } } } }"
+
+    def setUp(self):
+        seed_orders(12)
+        get_metrics().reset()
+
+    def post(self, query, **headers):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json", headers=headers).json()
+
+    @override_settings(DEBUG=True)
+    def test_trace_header_returns_apollo_tracing_and_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            extensions = self.post(self.QUERY, **{"X-GraphQL-Trace": "1"})["extensions"]
+        resolvers = extensions["tracing"]["execution"]["resolvers"]
+        customer = next(r for r in resolvers if r["path"] == ["allOrders", "edges", 0, "node", "customer"])
+        self.assertEqual((customer["parentType"], customer["returnType"]), ("OrderType", "CustomerType!"))
+        self.assertEqual(extensions["sql"]["count"], len(queries))
+        self.assertIn("allOrders", [entry["path"] for entry in extensions["sql"]["byPath"]])
+        self.assertEqual(extensions["sql"]["nPlusOne"], [])
+        self.assertNotIn("tracing", self.post(self.QUERY)["extensions"])
+
+    def test_trace_header_needs_debug_or_staff(self):
+        self.assertNotIn("tracing", self.post(self.QUERY, **{"X-GraphQL-Trace": "1"})["extensions"])
+
+    @override_settings(DEBUG=True)
+    def test_repeated_sql_is_flagged_as_n_plus_one(self):
+        # A filter argument bypasses the batching loader: one query per customer.
+        query = "{ allCustomers { edges { node { orders(totalAmount_Gte: 1) { edges { node { id } } } } } } }"
+        n_plus_one = self.post(query, **{"X-GraphQL-Trace": "1"})["extensions"]["sql"]["nPlusOne"]
+        self.assertTrue(n_plus_one)
+        self.assertTrue(all((entry["count"], entry["fields"]) == (12, ["CustomerType.orders"]) for entry in n_plus_one))
+
+    @override_settings(GRAPHQL_TRACING={"METRICS_TOKEN": "scrape"})
+    def test_metrics_aggregate_fields_across_requests(self):
+        self.post(self.QUERY)
+        self.post(self.QUERY)
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 403)
+        text = self.client.get("/metrics", headers={"Authorization": "Bearer scrape"}).content.decode()
+        self.assertIn("crm_graphql_request_duration_seconds_count 2", text)
+        self.assertIn('crm_graphql_resolver_duration_seconds_count{parent_type="OrderType",field="customer"} 6', text)
+        self.assertRegex(text, r'crm_graphql_sql_queries_total\{parent_type="Query",field="allOrders"\} [1-9]')
+
+
+class AsyncViewTests(TestCase):
+    QUERY = """{
+        totalCustomers totalOrders totalRevenue
+        salesSummary { totalOrders }
+        allOrders(first: 3) { edges { node { id customer { name } products { edges { node { name } } } } } }
+    }"""
+
+    def setUp(self):
+        seed_orders(12)
+
+    async def post(self, path, query, **headers):
+        response = await self.async_client.post(
+            path, {"query": query}, content_type="application/json", headers=headers,
+        )
+        return response.json()
+
+    async def test_matches_the_sync_view(self):
+        expected = (await sync_to_async(self.client.post)(
+            "/graphql", {"query": self.QUERY}, content_type="application/json",
+        )).json()["data"]
+        result = await self.post("/graphql/async", self.QUERY)
+        self.assertEqual(result["data"], expected)
+        self.assertEqual((result["data"]["totalCustomers"], result["data"]["totalOrders"]), (12, 12))
+
+    async def test_mutation(self):
+        result = await self.post(
+            "/graphql/async",
+            'mutation { createCustomer(name: "Zed", email: "zed@example.com") { customer { name } } }',
+        )
+        self.assertEqual(result["data"]["createCustomer"]["customer"], {"name": "Zed"})
+        self.assertTrue(await Customer.objects.filter(email="zed@example.com").aexists())
+
+    @override_settings(DEBUG=True)
+    async def test_sql_is_attributed_to_each_root_field(self):
+        result = await self.post("/graphql/async", self.QUERY, **{"X-GraphQL-Trace": "1"})
+        paths = {entry["path"] for entry in result["extensions"]["sql"]["byPath"]}
+        self.assertLessEqual({"totalCustomers", "totalOrders", "totalRevenue", "allOrders"}, paths)
+        self.assertNotIn("(root)", paths)
+
+
+class WebSocket:
+    """Drives the ASGI application's WebSocket handling in-process."""
+
+    def __init__(self, path="/graphql", subprotocols=("graphql-transport-ws",)):
+        from alx_backend_graphql.asgi import application
+
+        self.incoming, self.outgoing = asyncio.Queue(), asyncio.Queue()
+        scope = {"type": "websocket", "path": path, "subprotocols": list(subprotocols), "headers": []}
+        self.task = asyncio.ensure_future(application(scope, self.incoming.get, self.outgoing.put))
+
+    async def connect(self):
+        await self.incoming.put({"type": "websocket.connect"})
+        return await self.event()
+
+    async def event(self):
+        return await asyncio.wait_for(self.outgoing.get(), 5)
+
+    async def send(self, message):
+        await self.incoming.put({"type": "websocket.receive", "text": json.dumps(message)})
+
+    async def receive(self):
+        return json.loads((await self.event())["text"])
+
+    async def subscribe(self, id, query):
+        await self.send({"type": "subscribe", "id": id, "payload": {"query": query}})
+
+    async def disconnect(self):
+        await self.incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, 5)
+
+
+class SubscriptionTests(TransactionTestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.product = Product.objects.create(name="Widget", price=5, stock=12)
+
+    async def connect(self):
+        ws = WebSocket()
+        self.assertEqual((await ws.connect())["subprotocol"], "graphql-transport-ws")
+        await ws.send({"type": "connection_init"})
+        self.assertEqual(await ws.receive(), {"type": "connection_ack"})
+        return ws
+
+    async def streams(self, count):
+        # Subscribers join their stream once the operation task first runs.
+        hub = pubsub.get_hub()
+        while len(hub.streams) != count:
+            await asyncio.sleep(0.01)
+        return hub.streams
+
+    def place(self, quantity):
+        return place_order(self.customer.pk, {self.product.pk: quantity}).pk
+
+    async def test_order_and_stock_events_reach_subscribers(self):
+        ws = await self.connect()
+        await ws.subscribe("orders", "subscription { orderCreated { id customer { name } products { edges { node { name } } } } }")
+        await ws.subscribe("below5", "subscription { productStockChanged(threshold: 5) { product { name } previous stock } }")
+        await ws.subscribe("alerts", "subscription { lowStockAlert { product { name } previous stock } }")
+        await self.streams(3)
+
+        # 12 -> 11 -> 8 (drops below 10) -> 4 (below 5)
+        for quantity in (1, 3, 4):
+            await sync_to_async(self.place)(quantity)
+        received = defaultdict(list)
+        for _ in range(5):
+            message = await ws.receive()
+            self.assertEqual(message["type"], "next")
+            received[message["id"]].append(message["payload"]["data"])
+
+        self.assertEqual([data["orderCreated"]["customer"]["name"] for data in received["orders"]], ["Alice"] * 3)
+        self.assertEqual(received["orders"][0]["orderCreated"]["products"]["edges"], [{"node": {"name": "Widget"}}])
+        self.assertEqual(received["alerts"], [{"lowStockAlert": {"product": {"name": "Widget"}, "previous": 11, "stock": 8}}])
+        self.assertEqual(received["below5"], [{"productStockChanged": {"product": {"name": "Widget"}, "previous": 8, "stock": 4}}])
+        await ws.disconnect()
+        self.assertEqual(pubsub.get_hub().streams, {})
+
+    async def test_subscribers_with_the_same_arguments_share_a_stream(self):
+        ws = await self.connect()
+        for id, threshold in (("a", 5), ("b", 5), ("c", 3)):
+            await ws.subscribe(id, f"subscription {{ productStockChanged(threshold: {threshold}) {{ stock }} }}")
+        streams = await self.streams(2)
+        self.assertEqual(sorted(len(stream.subscribers) for stream in streams.values()), [1, 2])
+        self.assertEqual(len(pubsub.get_broker().listeners[pubsub.STOCK_CHANGED]), 2)
+
+        await sync_to_async(self.place)(8)
+        messages = [await ws.receive(), await ws.receive()]
+        self.assertEqual({message["id"] for message in messages}, {"a", "b"})
+
+        await ws.send({"type": "complete", "id": "a"})
+        await ws.send({"type": "complete", "id": "b"})
+        await self.streams(1)
+        await ws.disconnect()
+        self.assertNotIn(pubsub.STOCK_CHANGED, pubsub.get_broker().listeners)
+
+    async def test_a_failing_load_drops_only_its_event(self):
+        async def load(message):
+            if message["id"] == 1:
+                raise ValueError("gone")
+            return message
+
+        events = pubsub.get_hub().subscribe("test", load=load)
+        first = asyncio.ensure_future(events.__anext__())
+        await self.streams(1)
+        with self.assertLogs("crm.pubsub", "ERROR"):
+            pubsub.get_broker().publish("test", {"id": 1})
+            pubsub.get_broker().publish("test", {"id": 2})
+            self.assertEqual(await asyncio.wait_for(first, 5), {"id": 2})
+        await events.aclose()
+
+    def test_a_closed_loop_does_not_break_publishers(self):
+        loop = asyncio.new_event_loop()
+        loop.close()
+        stream = pubsub.Stream(pubsub.Hub(loop), "test", None)
+        pubsub.get_broker().listen("test", stream.receive)
+        pubsub.get_broker().publish("test", {"id": 1})
+        self.assertNotIn("test", pubsub.get_broker().listeners)
+
+    async def test_protocol_errors(self):
+        ws = WebSocket()
+        await ws.connect()
+        await ws.subscribe("1", "subscription { orderCreated { id } }")
+        self.assertEqual((await ws.event())["code"], 4401)
+        await ws.disconnect()
+
+        ws = await self.connect()
+        await ws.subscribe("1", "subscription { orderCreated { nope } }")
+        message = await ws.receive()
+        self.assertEqual((message["id"], message["type"]), ("1", "error"))
+        await ws.disconnect()
+
+        result = await sync_to_async(self.client.post)(
+            "/graphql", {"query": "subscription { orderCreated { id } }"}, content_type="application/json",
+        )
+        self.assertIn("WebSocket", result.json()["errors"][0]["message"])
+
+
+class BatchTests(TestCase):
+    PAGE = "{ allOrders(first: 6) { edges { node { customer { name } } } } }"
+    LOADED = "{ allOrders(first: 6) { edges { node { products { edges { node { name } } } } } } }"
+
+    def setUp(self):
+        seed_orders(6)
+        get_metrics().reset()
+
+    def post(self, body, path="/graphql"):
+        return self.client.post(path, body, content_type="application/json")
+
+    def test_results_come_back_in_order_and_share_loaders(self):
+        response = self.post([{"query": self.PAGE, "id": "a"}, {"query": "{ totalCustomers }", "id": "b"},
+                              {"query": self.LOADED, "id": "c"}])
+        results = response.json()
+        self.assertEqual([result["id"] for result in results], ["a", "b", "c"])
+        self.assertEqual(results[1]["data"], {"totalCustomers": 6})
+        self.assertEqual(len(results[2]["data"]["allOrders"]["edges"]), 6)
+        # Every operation resolved through the request's one set of loaders.
+        self.assertEqual(len(response.wsgi_request.crm_loaders.order_products._cache), 6)
+
+    def test_queries_after_a_mutation_see_its_write(self):
+        results = self.post([
+            {"query": self.PAGE},
+            {"query": 'mutation { createCustomer(name: "Zed", email: "zed@example.com") { customer { id } } }'},
+            {"query": "{ totalCustomers allCustomers(name: \"Zed\") { edges { node { name } } } }"},
+        ]).json()
+        self.assertEqual(results[2]["data"]["totalCustomers"], 7)
+        self.assertEqual(results[2]["data"]["allCustomers"]["edges"], [{"node": {"name": "Zed"}}])
+
+    def test_async_view_runs_batches(self):
+        results = self.post([{"query": "{ totalOrders }"}, {"query": self.PAGE}], path="/graphql/async").json()
+        self.assertEqual(results[0]["data"], {"totalOrders": 6})
+        self.assertEqual(len(results[1]["data"]["allOrders"]["edges"]), 6)
+
+    @override_settings(DEBUG=True)
+    def test_async_batch_traces_each_operation_alone(self):
+        batch = [{"query": self.PAGE}, {"query": "{ totalOrders }"}]
+
+        def sql(body, path="/graphql"):
+            results = self.client.post(path, body, content_type="application/json",
+                                       headers={"X-GraphQL-Trace": "1"}).json()
+            return [
+                (result["extensions"]["sql"]["count"], [entry["path"] for entry in result["extensions"]["sql"]["byPath"]])
+                for result in (results if isinstance(results, list) else [results])
+            ]
+
+        # The same SQL per operation as when each is sent alone.
+        alone = [sql(entry)[0] for entry in batch]
+        self.assertEqual(alone, [(1, ["allOrders"]), (1, ["totalOrders"])])
+        self.assertEqual(sql(batch, "/graphql/async"), alone)
+
+    @override_settings(GRAPHQL_BATCH={"MAX_OPERATIONS": 2})
+    def test_batch_size_is_limited_and_measured(self):
+        response = self.post([{"query": "{ totalOrders }"}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("exceeds the limit of 2", response.json()["errors"][0]["message"])
+        self.post([{"query": "{ totalOrders }"}] * 2)
+        self.client.force_login(User.objects.create(username="ops", is_staff=True))
+        text = self.client.get("/metrics").content.decode()
+        self.assertIn('crm_graphql_batch_size_bucket{le="1"} 0', text)
+        self.assertIn('crm_graphql_batch_size_bucket{le="2"} 1', text)
+        self.assertIn("crm_graphql_batch_size_count 1", text)
+
+
+class ParallelBatchTests(TransactionTestCase):
+    @override_settings(GRAPHQL_BATCH={"PARALLEL": True, "MAX_WORKERS": 3})
+    def test_queries_run_in_threads(self):
+        seed_orders(6)
+        queries = [{"query": BatchTests.PAGE}, {"query": "{ totalCustomers }"}, {"query": "{ totalOrders }"}]
+        parallel = self.client.post("/graphql", queries, content_type="application/json").json()
+        with override_settings(GRAPHQL_BATCH={"PARALLEL": False}):
+            sequential = self.client.post("/graphql", queries, content_type="application/json").json()
+        self.assertEqual([r["data"] for r in parallel], [r["data"] for r in sequential])
+
+
+class CountingTransport(Transport):
+    """gql transport posting to the test client and recording what it sends."""
+
+    def __init__(self):
+        self.connects = 0
+        self.queries = []
+
+    def connect(self):
+        self.connects += 1
+
+    def execute(self, request, *args, **kwargs):
+        from django.test import Client
+
+        query = print_ast(request.document)
+        self.queries.append(query)
+        body = Client().post(
+            "/graphql", {"query": query, "variables": request.variable_values}, content_type="application/json",
+        ).json()
+        return ExecutionResult(data=body.get("data"), errors=body.get("errors"))
+
+
+class GraphQLClientTests(TestCase):
+    def setUp(self):
+        use_job_log(self)
+        seed_orders(3)
+
+    def test_jobs_run_in_process_inside_django(self):
+        from . import cron
+
+        self.assertIsInstance(graphql_client.get_client(), graphql_client.LocalClient)
+        self.assertEqual(graphql_client.execute("{ totalCustomers }"), {"totalCustomers": 3})
+        with self.assertRaises(graphql_client.GraphQLClientError):
+            graphql_client.execute("{ totalCustomers nope }")
+
+        Product.objects.update(stock=2)
+        cron.update_low_stock()
+        self.assertEqual(set(Product.objects.values_list("stock", flat=True)), {12})
+
+    @override_settings(GRAPHQL_QUERY_COST={"MAX_COST": 1000, "MAX_DEPTH": 8})
+    def test_local_operations_are_costed_and_traced_like_requests(self):
+        get_metrics().reset()
+        with self.assertRaises(graphql_client.GraphQLClientError) as raised:
+            graphql_client.execute("{ allOrders(first: 100) { edges { node { products(first: 100) { edges { node { name } } } } } } }")
+        self.assertEqual(raised.exception.errors[0]["extensions"]["code"], "QUERY_TOO_COMPLEX")
+        graphql_client.execute("{ totalCustomers }")
+        self.assertIn("crm_graphql_request_duration_seconds_count 1", get_metrics().render())
+
+    def test_remote_client_keeps_one_session_and_caches_the_schema(self):
+        transport = CountingTransport()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = os.path.join(tmp, "schema.json")
+            client = graphql_client.RemoteClient("http://crm.test/graphql", cache)
+            client.transport = lambda: transport
+            for _ in range(3):
+                self.assertEqual(client.execute("{ totalOrders }"), {"totalOrders": 3})
+            with self.assertRaises(graphql_client.GraphQLClientError):
+                client.execute("{ totalOrders nope }")
+            # One session to introspect, one kept for every operation.
+            self.assertEqual(transport.connects, 2)
+
+            again = graphql_client.RemoteClient("http://crm.test/graphql", cache)
+            again.transport = lambda: transport
+            again.execute("{ totalOrders }")
+            self.assertEqual(sum("__schema" in query for query in transport.queries), 1)
+            self.assertEqual(len(transport.queries), 5)
+
+
+class OrderReminderTests(TestCase):
+    def setUp(self):
+        self.customers = [Customer.objects.create(name=f"C{i}", email=f"c{i}@example.com") for i in range(3)]
+        for i in range(7):
+            Order.objects.create(customer=self.customers[i % 3], total_amount=10 + i)
+        Order.objects.create(customer=self.customers[0], order_date=timezone.now() - datetime.timedelta(days=30))
+
+    def run_reminders(self, sender):
+        # Small pages and runs, so paging and the on-disk merge are exercised.
+        with override_settings(CRM_ORDER_REMINDERS={"PAGE_SIZE": 2, "RUN_SIZE": 3, "WORKERS": 2}):
+            return reminders.send_order_reminders(sender=sender)
+
+    def test_one_reminder_per_customer_and_reruns_skip_reminded_orders(self):
+        sender = reminders.LocMemSender()
+        result = self.run_reminders(sender)
+        self.assertEqual(result, {"orders": 7, "sent": 3, "failed": []})
+        self.assertEqual(
+            sorted((r.email, len(r.orders)) for r in sender.outbox),
+            [("c0@example.com", 3), ("c1@example.com", 2), ("c2@example.com", 2)],
+        )
+
+        sender = reminders.LocMemSender()
+        self.assertEqual(self.run_reminders(sender), {"orders": 0, "sent": 0, "failed": []})
+        Order.objects.create(customer=self.customers[1], total_amount=99)
+        self.assertEqual(self.run_reminders(sender)["orders"], 1)
+        [reminder] = sender.outbox
+        self.assertEqual(reminder.email, "c1@example.com")
+        self.assertEqual([total for _, _, total in reminder.orders], ["99.00"])
+
+    def test_email_sender_and_failures(self):
+        self.run_reminders(reminders.EmailSender(from_email="crm@example.com"))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["c0@example.com", "c1@example.com", "c2@example.com"])
+        self.assertTrue(any(m.body.startswith("Hello C0,") for m in mail.outbox))
+
+        class Failing(reminders.LocMemSender):
+            def send(self, reminder):
+                raise OSError("unreachable")
+
+        Order.objects.create(customer=self.customers[2], total_amount=5)
+        self.assertEqual(self.run_reminders(Failing())["failed"], ["c2@example.com"])
+
+
+class ChunkedJobTests(TestCase):
+    def setUp(self):
+        use_job_log(self)
+        # Eager tasks and an in-memory broker: no Redis and no worker.
+        eager = {
+            "task_always_eager": True, "task_eager_propagates": True,
+            "broker_url": "memory://", "result_backend": "cache+memory://",
+        }
+        previous = {key: celery_app.conf[key] for key in eager}
+        celery_app.conf.update(eager)
+        self.addCleanup(celery_app.conf.update, previous)
+        seed_orders(5)
+
+    def start(self, name, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            run = chunking.start(name, chunk_size=2, **params)
+        return chunking.progress(run.pk)
+
+    def test_report_aggregates_chunks(self):
+        progress = self.start("crm_report")
+        self.assertEqual(progress["chunks"], 3)
+        self.assertEqual(progress["completed"], 3)
+        self.assertTrue(progress["finished"])
+        self.assertEqual(progress["result"], {"customers": 5, "orders": 5, "revenue": "100.00"})
+
+    def test_chunks_are_idempotent(self):
+        Product.objects.update(stock=2)
+        progress = self.start("restock_low_stock")
+        self.assertEqual(progress["result"], {"updated": 3})
+        run = chunking.ChunkedRun.objects.get()
+        first = ChunkResult.objects.get(run=run, index=0)
+        lo, _ = chunking.id_ranges(Product.objects.all(), 2)[0]
+        # A redelivered chunk returns its saved result without restocking again.
+        self.assertEqual(tasks.process_chunk.delay(run.pk, 0, lo, lo + 2).get(), first.result)
+        self.assertEqual(set(Product.objects.values_list("stock", flat=True)), {12})
+
+    def test_a_failed_chunk_fails_the_run_and_frees_the_lease(self):
+        def process(start, end, params):
+            raise ValueError("disk full")
+
+        job = chunking.get_job("crm_report")
+        job.process = process
+        self.addCleanup(delattr, job, "process")
+        # As on a worker: the failure goes to the error callbacks, then the chord.
+        celery_app.conf.task_eager_propagates = False
+        with self.assertRaises(ValueError):
+            self.start("crm_report")
+        progress = chunking.progress(chunking.ChunkedRun.objects.get().pk)
+        self.assertTrue(progress["finished"])
+        self.assertEqual(progress["result"], {"error": "ValueError('disk full')"})
+        self.assertEqual(JobRun.objects.get(job="crm_report").outcome, JobRun.FAILURE)
+        self.assertIsNotNone(locks.Lease.acquire("crm_report"))
+
+    def test_the_lease_covers_every_queued_chunk(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            chunking.start("crm_report", chunk_size=2)
+        expires_in = JobLock.objects.get(name="crm_report").expires_at - timezone.now()
+        # 300 s of TTL plus 60 s for each of the three chunks not yet run.
+        self.assertAlmostEqual(expires_in.total_seconds(), 480, delta=5)
+
+    def test_rollups_and_reminders(self):
+        expected = rollups.rebuild()
+        DailySalesRollup.objects.all().delete()
+        self.assertEqual(self.start("rebuild_rollups")["result"], {"rows": expected})
+        self.assertEqual(DailySalesRollup.objects.count(), expected)
+
+        with override_settings(CRM_ORDER_REMINDERS={"SENDER": "crm.reminders.EmailSender"}):
+            self.assertEqual(self.start("order_reminders")["result"], {"orders": 5, "sent": 5, "failed": []})
+            self.assertEqual(len(mail.outbox), 5)
+            # The high-water mark is shared with reminders.send_order_reminders.
+            self.assertEqual(reminders.send_order_reminders(sender=reminders.LocMemSender())["orders"], 0)
+            self.assertEqual(self.start("order_reminders")["result"]["orders"], 0)
+        self.assertEqual(reminders.cursor_order_id(JobState.objects.get(job="order_reminders").data["cursor"]),
+                         Order.objects.latest("pk").pk)
+
+
+class JobLockTests(TestCase):
+    def setUp(self):
+        use_job_log(self)
+
+    def expire(self, name):
+        JobLock.objects.filter(name=name).update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+
+    def test_one_lease_holder_until_expiry(self):
+        first = locks.Lease.acquire("job")
+        self.assertIsNotNone(first)
+        self.assertIsNone(locks.Lease.acquire("job"))
+        self.assertTrue(first.renew())
+
+        self.expire("job")
+        second = locks.Lease.acquire("job")
+        self.assertIsNotNone(second)
+        self.assertFalse(first.renew())
+        first.release()
+        self.assertIsNone(locks.Lease.acquire("job"))
+        second.release()
+        self.assertIsNotNone(locks.Lease.acquire("job"))
+
+    def test_single_flight_skips_overlapping_runs_and_records_history(self):
+        from . import cron
+
+        Product.objects.create(name="Low", price=1, stock=2)
+        held = locks.Lease.acquire("crm.cron.update_low_stock")
+        self.assertIsNone(cron.update_low_stock())
+        self.assertEqual(Product.objects.get().stock, 2)
+        held.release()
+        cron.update_low_stock()
+        self.assertEqual(Product.objects.get().stock, 12)
+
+        @locks.single_flight("failing")
+        def failing():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            failing()
+
+        data = execute("""{
+            jobStatus { name running runs failures skipped lastRun { outcome error } lastSuccessAt }
+            jobRuns(job: "failing") { outcome duration }
+        }""")
+        status = {job["name"]: job for job in data["jobStatus"]}
+        job = status["crm.cron.update_low_stock"]
+        self.assertEqual((job["running"], job["runs"], job["failures"], job["skipped"]), (False, 2, 0, 1))
+        self.assertEqual(job["lastRun"]["outcome"], "SUCCESS")
+        self.assertIsNotNone(job["lastSuccessAt"])
+        self.assertEqual(status["failing"]["lastRun"], {"outcome": "FAILURE", "error": "ValueError('boom')"})
+        self.assertEqual(data["jobRuns"][0]["outcome"], "FAILURE")
+
+        data = execute("""{
+            null: jobRuns(limit: null) { outcome }
+            negative: jobRuns(limit: -1) { outcome }
+            huge: jobRuns(limit: 1000) { outcome }
+        }""")
+        self.assertEqual([len(data[key]) for key in ("null", "negative", "huge")], [3, 0, 3])
+
+    def test_chunked_run_holds_the_lease_until_aggregated(self):
+        self.addCleanup(celery_app.conf.update, task_always_eager=celery_app.conf.task_always_eager)
+        celery_app.conf.update(task_always_eager=True)
+        seed_orders(2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            run = chunking.start("crm_report")
+            self.assertIsNone(chunking.start("crm_report"))
+        self.assertTrue(locks.job_status()[0]["running"])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(chunking.progress(run.pk)["result"]["orders"], 2)
+        self.assertEqual(
+            list(JobRun.objects.order_by("pk").values_list("outcome", flat=True)), [JobRun.SKIPPED, JobRun.SUCCESS]
+        )
+        self.assertIsNotNone(chunking.start("crm_report"))
+
+
+class JobLogTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.path = os.path.join(tmp, "jobs.jsonl")
+        self.handler = joblog.BufferedJSONLinesHandler(self.path, max_bytes=4096, backup_count=2, capacity=10)
+        self.logger = logging.getLogger("crm.tests.joblog")
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.addCleanup(self.handler.close)
+
+    def log(self, event, level=logging.INFO, **fields):
+        self.logger.log(level, event, extra={"job": fields.pop("job", "test"), "fields": fields})
+
+    def lines(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_buffers_rotates_and_compresses(self):
+        self.log("one")
+        self.assertFalse(os.path.exists(self.path))
+        self.log("failed", logging.ERROR, error="boom")
+        self.assertEqual([entry["event"] for entry in self.lines()], ["one", "failed"])
+
+        threads = [
+            threading.Thread(target=lambda n=n: [self.log("tick", thread=n, i=i) for i in range(50)])
+            for n in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.handler.flush()
+        self.assertLessEqual(os.path.getsize(self.path), 4096)
+        self.assertTrue(os.path.exists(self.path + ".1.gz"))
+        self.assertTrue(os.path.exists(self.path + ".2.gz"))
+        self.assertFalse(os.path.exists(self.path + ".3.gz"))
+        with gzip.open(self.path + ".1.gz", "rt") as f:
+            rotated = [json.loads(line) for line in f]
+        self.assertEqual({entry["event"] for entry in rotated}, {"tick"})
+
+    def test_recent_reads_from_the_end(self):
+        for i in range(120):
+            self.log("run" if i % 3 else "other", job=f"job{i % 2}", i=i)
+        self.log("failed", logging.ERROR, job="job1", i=120)
+        self.handler.flush()
+
+        entries = joblog.recent(self.path, job="job0", event="run", limit=3)
+        self.assertEqual([entry["i"] for entry in entries], [112, 116, 118])
+        self.assertEqual([entry["i"] for entry in joblog.recent(self.path, level="error")], [120])
+        # Older records come from the rotated generations.
+        self.assertEqual(len(joblog.recent(self.path, limit=1000)), len(self.lines()) + sum(
+            1 for n in (1, 2) for _ in gzip.open(f"{self.path}.{n}.gz")
+        ))
+        # Small blocks split lines across reads.
+        with open(self.path, "rb") as f:
+            self.assertEqual([json.loads(line) for line in joblog.reversed_lines(f, block_size=7)], self.lines()[::-1])
+
+        out = StringIO()
+        with override_settings(CRM_JOB_LOG={"PATH": self.path}):
+            call_command("job_log", "--job", "job1", "--level", "ERROR", stdout=out)
+        self.assertIn("ERROR   job1 failed i=120", out.getvalue())
+
+    def test_jobs_log_under_their_name(self):
+        path = use_job_log(self)
+
+        @locks.single_flight("logged")
+        def work():
+            joblog.log("working", step=1)
+
+        work()
+        joblog.flush()
+        entries = joblog.recent(path, job="logged")
+        self.assertEqual([entry["event"] for entry in entries], ["working", "run"])
+        self.assertEqual((entries[0]["step"], entries[1]["outcome"]), (1, "success"))
+
+
+class DocumentCacheTests(TestCase):
+    QUERY = "{ totalCustomers }"
+
+    def setUp(self):
+        get_document_cache().clear()
+
+    def post(self, body):
+        return self.client.post("/graphql", body, content_type="application/json").json()
+
+    def test_repeated_queries_are_parsed_once(self):
+        self.post({"query": self.QUERY})
+        self.post({"query": self.QUERY})
+        stats = get_document_cache().stats()
+        self.assertEqual((stats["entries"], stats["hits"], stats["misses"]), (1, 1, 1))
+
+    def test_batched_operations_are_counted_once_and_exported(self):
+        self.post([{"query": self.QUERY}, {"query": "{ totalOrders }"}])
+        self.post([{"query": self.QUERY}])
+        stats = get_document_cache().stats()
+        self.assertEqual((stats["entries"], stats["hits"], stats["misses"]), (2, 1, 2))
+        self.client.force_login(User.objects.create(username="ops", is_staff=True))
+        text = self.client.get("/metrics").content.decode()
+        self.assertIn("crm_graphql_document_cache_hits_total 1\n", text)
+        self.assertIn("crm_graphql_document_cache_misses_total 2\n", text)
+        self.assertIn("crm_graphql_document_cache_entries 2\n", text)
+
+    def test_invalid_documents_are_not_cached(self):
+        response = self.post({"query": "{ noSuchField }"})
+        self.assertIn("errors", response)
+        self.assertEqual(get_document_cache().stats()["entries"], 0)
+
+    def test_lru_is_bounded_by_entries_and_bytes(self):
+        cache = DocumentCache(max_entries=2, max_bytes=40)
+        for query in ["{ a }", "{ b }", "{ c }"]:
+            cache.put(query_hash(query), query, None)
+        self.assertIsNone(cache.peek(query_hash("{ a }")))
+        cache.put("big", "x" * 38, None)
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.stats()["evictions"], 3)
+
+    def test_automatic_persisted_queries(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash(self.QUERY)}}
+        missing = self.post({"extensions": extensions})
+        self.assertEqual(missing["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+        self.assertEqual(self.post({"query": self.QUERY, "extensions": extensions})["data"], {"totalCustomers": 0})
+        self.assertEqual(self.post({"extensions": extensions})["data"], {"totalCustomers": 0})
+        response = self.client.get("/graphql", {"extensions": json.dumps(extensions)}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["data"], {"totalCustomers": 0})
+
+    def test_persisted_query_hash_must_match(self):
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}
+        response = self.post({"query": self.QUERY, "extensions": extensions})
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "INVALID_SHA256_HASH")
+
+
+@override_settings(GRAPHQL_RESPONSE_CACHE={"ENABLED": True, "CACHE": "default", "TIMEOUT": 60})
+class ResponseCacheTests(TestCase):
+    QUERY = "{ totalCustomers allProducts { edges { node { name stock } } } }"
+
+    def setUp(self):
+        caches["default"].clear()
+        get_response_cache().reset_stats()
+
+    def post(self, query, **extra):
+        return self.client.post("/graphql", {"query": query, **extra}, content_type="application/json").json()
+
+    def test_identical_queries_hit_the_cache(self):
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        first = self.post(self.QUERY)
+        with self.assertNumQueries(0):
+            # Whitespace differences normalize to the same key.
+            second = self.post("{totalCustomers allProducts{edges{node{name stock}}}}")
+        self.assertEqual(first, second)
+        self.assertEqual(get_response_cache().stats(), {"hits": 1, "misses": 1, "hit_ratio": 0.5})
+
+        self.client.force_login(User.objects.create(username="ops", is_staff=True))
+        text = self.client.get("/metrics").content.decode()
+        self.assertIn("crm_graphql_response_cache_hits_total 1\n", text)
+        self.assertIn("crm_graphql_response_cache_misses_total 1\n", text)
+        self.assertIn("crm_graphql_response_cache_hit_ratio 0.5\n", text)
+
+    def test_variables_are_part_of_the_key(self):
+        Customer.objects.create(name="Alice", email="alice@example.com")
+        query = "query ($name: String) { allCustomers(name: $name) { edges { node { name } } } }"
+        self.assertEqual(len(self.post(query, variables={"name": "ali"})["data"]["allCustomers"]["edges"]), 1)
+        self.assertEqual(len(self.post(query, variables={"name": "bob"})["data"]["allCustomers"]["edges"]), 0)
+
+    def test_writes_invalidate(self):
+        self.assertEqual(self.post(self.QUERY)["data"]["totalCustomers"], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.create(name="Alice", email="alice@example.com")
+        self.assertEqual(self.post(self.QUERY)["data"]["totalCustomers"], 1)
+
+        product = Product.objects.create(name="Widget", price=1, stock=1)
+        self.post(self.QUERY)
+        with self.captureOnCommitCallbacks(execute=True):
+            restock_low_stock(threshold=5, increment=4)
+        self.assertEqual(self.post(self.QUERY)["data"]["allProducts"]["edges"][0]["node"]["stock"], 5)
+
+    def test_mutations_are_never_cached(self):
+        mutation = 'mutation { createProduct(name: "W", price: 1, stock: 1) { product { name } } }'
+        self.post(mutation)
+        self.post(mutation)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(get_response_cache().stats()["hits"], 0)
+
+    def test_job_fields_are_never_cached(self):
+        use_job_log(self)
+        query = "query Runs { ... on Query { jobRuns { job } } }"
+        self.assertEqual(self.post(query)["data"]["jobRuns"], [])
+        locks.record_run("report", timezone.now(), JobRun.SUCCESS)
+        self.assertEqual(self.post(query)["data"]["jobRuns"], [{"job": "report"}])
+        self.post(self.QUERY)
+        self.post(self.QUERY)
+        self.assertEqual(get_response_cache().stats(), {"hits": 1, "misses": 1, "hit_ratio": 0.5})
+
+
+class QueryCostTests(TestCase):
+    def post(self, query, variables=None):
+        body = {"query": query, "variables": variables or {}}
+        return self.client.post("/graphql", body, content_type="application/json")
+
+    def test_cost_is_reported_in_extensions(self):
+        response = self.post(
+            "query ($n: Int) { allOrders(first: $n) { edges { node { id customer { name } } } } }",
+            {"n": 10},
+        ).json()
+        # allOrders once, then edges/node/id/customer/name for each of 10 orders.
+        self.assertEqual(response["extensions"]["cost"]["requested"], 51)
+        self.assertEqual(response["extensions"]["cost"]["depth"], 2)
+
+    @override_settings(GRAPHQL_QUERY_COST={"MAX_COST": 1000, "MAX_DEPTH": 8})
+    def test_nested_connections_over_budget_are_rejected(self):
+        with self.assertNumQueries(0):
+            response = self.post("""{
+                allOrders(first: 100) { edges { node {
+                    products(first: 100) { edges { node { name } } }
+                } } }
+            }""")
+        self.assertEqual(response.status_code, 400)
+        error = response.json()["errors"][0]
+        self.assertEqual(error["extensions"]["code"], "QUERY_TOO_COMPLEX")
+
+    @override_settings(GRAPHQL_QUERY_COST={"MAX_COST": 10 ** 9, "MAX_DEPTH": 3})
+    def test_deep_queries_are_rejected(self):
+        response = self.post("""{
+            allOrders(first: 1) { edges { node { customer { orders(first: 1) { edges { node {
+                products(first: 1) { edges { node { name } } }
+            } } } } } } }
+        }""")
+        self.assertEqual(response.json()["errors"][0]["extensions"]["code"], "QUERY_TOO_DEEP")
@@ -0,0 +1,367 @@
+import datetime
+import hmac
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from inspect import isawaitable
+from time import perf_counter_ns
+
+from django.conf import settings
+from django.utils import timezone
+
+from .documents import get_document_cache
+from .response_cache import get_response_cache
+
+DEFAULTS = {
+    # Time resolvers and SQL on every request for the Prometheus metrics.
+    "ENABLED": True,
+    # Requests with this header get the trace in ``extensions``; only in
+    # DEBUG or for staff users, since it includes SQL.
+    "HEADER": "X-GraphQL-Trace",
+    # A statement shape run this many times in one request is an N+1.
+    "N_PLUS_ONE_THRESHOLD": 10,
+    # Histogram bucket bounds, in seconds.
+    "BUCKETS": (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+    # Bearer token a scraper sends to read /metrics; staff users need none.
+    "METRICS_TOKEN": None,
+}
+
+# Histogram bucket bounds for operations per batched request.
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, "GRAPHQL_TRACING", {})}
+
+
+_numbers = re.compile(r"\b\d+\b")
+_in_lists = re.compile(r"IN \((?:%s, )*%s\)")
+
+
+def sql_shape(sql):
+    """``sql`` with literals and ``IN`` list lengths folded, for spotting repeats."""
+    return _numbers.sub("?", _in_lists.sub("IN (...)", sql))
+
+
+# ``(field, path label)`` of the resolver running, read when SQL executes.
+# A context variable, because asyncio tasks and sync_to_async copy it along.
+_current = ContextVar("crm_tracing_current")
+# The ``Tracer`` of the operation running in this context.  Concurrent
+# operations on one connection each install a wrapper; only the wrapper of
+# the operation running a query records it.
+_tracer = ContextVar("crm_tracing_tracer", default=None)
+
+
+def path_label(path):
+    # List indexes are dropped, so every row of a page shares one label.
+    return ".".join(str(key) for key in path if not isinstance(key, int))
+
+
+class FieldStats:
+    __slots__ = ("calls", "duration", "buckets", "queries", "sql_duration", "n_plus_one")
+
+    def __init__(self, bucket_count):
+        self.calls = self.duration = self.queries = self.sql_duration = self.n_plus_one = 0
+        self.buckets = [0] * (bucket_count + 1)
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.duration += other.duration
+        self.queries += other.queries
+        self.sql_duration += other.sql_duration
+        self.n_plus_one += other.n_plus_one
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+
+class Tracer:
+    """Resolver and SQL timings of one GraphQL request.
+
+    ``TracingMiddleware`` calls ``resolve`` for every field and the view
+    installs ``execute_sql`` as a database execute wrapper.  Queries are
+    attributed to the resolver that ran last in the current context: the
+    resolver running them or the one whose returned queryset is being
+    evaluated.  Async resolvers are timed until they complete.  With
+    ``detailed`` set, every resolver call is kept for an Apollo tracing
+    response.
+    """
+
+    ROOT = ("Operation", "(root)")
+
+    def __init__(self, detailed=False, threshold=10, buckets=DEFAULTS["BUCKETS"]):
+        self.detailed = detailed
+        self.threshold = threshold
+        self.bounds = [int(bound * 1e9) for bound in buckets]
+        self.start_time = timezone.now()
+        self.started = perf_counter_ns()
+        self.duration = 0
+        self.fields = {}
+        self.resolvers = []
+        self.paths = defaultdict(lambda: [0, 0])
+        self.shapes = Counter()
+        self.shape_fields = defaultdict(set)
+        _current.set((self.ROOT, ""))
+        _tracer.set(self)
+
+    def stats(self, field):
+        stats = self.fields.get(field)
+        if stats is None:
+            stats = self.fields[field] = FieldStats(len(self.bounds))
+        return stats
+
+    def resolve(self, next, root, info, args):
+        field = (info.parent_type.name, info.field_name)
+        path = info.path.as_list() if self.detailed else None
+        current = (field, path_label(path) if self.detailed else "")
+        _current.set(current)
+        start = perf_counter_ns()
+        try:
+            result = next(root, info, **args)
+        except Exception:
+            self.record(field, path, info, start)
+            raise
+        if isawaitable(result):
+            return self.resolve_async(result, current, path, info, start)
+        self.record(field, path, info, start)
+        return result
+
+    async def resolve_async(self, result, current, path, info, start):
+        # Runs in its own task once graphql-core gathers the root fields.
+        _current.set(current)
+        try:
+            return await result
+        finally:
+            self.record(current[0], path, info, start)
+
+    def record(self, field, path, info, start):
+        duration = perf_counter_ns() - start
+        stats = self.stats(field)
+        stats.calls += 1
+        stats.duration += duration
+        stats.buckets[bisect_left(self.bounds, duration)] += 1
+        if self.detailed:
+            self.resolvers.append({
+                "path": path,
+                "parentType": field[0],
+                "fieldName": field[1],
+                "returnType": str(info.return_type),
+                "startOffset": start - self.started,
+                "duration": duration,
+            })
+
+    def execute_sql(self, execute, sql, params, many, context):
+        if _tracer.get() is not self:
+            return execute(sql, params, many, context)
+        start = perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter_ns() - start
+            field, path = _current.get((self.ROOT, ""))
+            stats = self.stats(field)
+            stats.queries += 1
+            stats.sql_duration += duration
+            shape = sql_shape(sql)
+            self.shapes[shape] += 1
+            self.shape_fields[shape].add(field)
+            if self.detailed:
+                self.paths[path][0] += 1
+                self.paths[path][1] += duration
+
+    def finish(self):
+        self.duration = perf_counter_ns() - self.started
+        for field in {field for shape in self.n_plus_one() for field in self.shape_fields[shape]}:
+            self.stats(field).n_plus_one += 1
+
+    def n_plus_one(self):
+        """SQL shapes run at least ``threshold`` times in this request."""
+        return [shape for shape, count in self.shapes.most_common() if count >= self.threshold]
+
+    def extensions(self):
+        """``tracing`` in the Apollo format, plus the request's ``sql``."""
+        end_time = self.start_time + datetime.timedelta(microseconds=self.duration // 1000)
+        return {
+            "tracing": {
+                "version": 1,
+                "startTime": self.start_time.isoformat(),
+                "endTime": end_time.isoformat(),
+                "duration": self.duration,
+                "execution": {"resolvers": self.resolvers},
+            },
+            "sql": {
+                "count": sum(stats.queries for stats in self.fields.values()),
+                "duration": sum(stats.sql_duration for stats in self.fields.values()),
+                "byPath": [
+                    {"path": path or "(root)", "count": count, "duration": duration}
+                    for path, (count, duration) in sorted(self.paths.items(), key=lambda item: -item[1][1])
+                ],
+                "nPlusOne": [
+                    {
+                        "sql": shape,
+                        "count": self.shapes[shape],
+                        "fields": sorted(".".join(field) for field in self.shape_fields[shape]),
+                    }
+                    for shape in self.n_plus_one()
+                ],
+            },
+        }
+
+
+class TracingMiddleware:
+    """Graphene middleware feeding resolver timings to the request's ``Tracer``."""
+
+    def resolve(self, next, root, info, **args):
+        tracer = getattr(info.context, "graphql_tracer", None)
+        if tracer is None:
+            return next(root, info, **args)
+        return tracer.resolve(next, root, info, args)
+
+
+def wants_trace(request, options):
+    if not request.headers.get(options["HEADER"]):
+        return False
+    user = getattr(request, "user", None)
+    return settings.DEBUG or bool(user is not None and user.is_staff)
+
+
+def can_read_metrics(request, options=None):
+    options = options or get_options()
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    token = options["METRICS_TOKEN"]
+    sent = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    return bool(token) and hmac.compare_digest(sent.encode(), token.encode())
+
+
+def start_trace(request):
+    """Attach a ``Tracer`` to ``request``, or return ``None`` when tracing is off."""
+    options = get_options()
+    detailed = wants_trace(request, options)
+    if not (options["ENABLED"] or detailed):
+        return None
+    request.graphql_tracer = Tracer(detailed, options["N_PLUS_ONE_THRESHOLD"], options["BUCKETS"])
+    return request.graphql_tracer
+
+
+class Metrics:
+    """Per-field resolver and SQL totals across requests, for Prometheus.
+
+    Totals live in this process; with several worker processes each one
+    serves its own, which Prometheus sums by ``instance``.
+    """
+
+    def __init__(self, buckets=DEFAULTS["BUCKETS"]):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.request_duration = FieldStats(len(self.buckets))
+            self.fields = {}
+            self.batch_sizes = Counter()
+
+    def record(self, tracer):
+        request = FieldStats(len(self.buckets))
+        request.calls, request.duration = 1, tracer.duration
+        request.buckets[bisect_left(tracer.bounds, tracer.duration)] += 1
+        with self._lock:
+            self.requests += 1
+            self.request_duration.merge(request)
+            for field, stats in tracer.fields.items():
+                if field not in self.fields:
+                    self.fields[field] = FieldStats(len(self.buckets))
+                self.fields[field].merge(stats)
+
+    def record_batch(self, size):
+        with self._lock:
+            self.batch_sizes[size] += 1
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            fields = sorted(self.fields.items())
+            request = self.request_duration
+            lines = []
+            self._histogram(lines, "crm_graphql_request_duration_seconds", "GraphQL operation execution time.",
+                            [("", request)])
+            labelled = [(f'parent_type="{parent}",field="{name}"', stats) for (parent, name), stats in fields]
+            self._histogram(lines, "crm_graphql_resolver_duration_seconds", "Resolver time per field.",
+                            [(labels, stats) for labels, stats in labelled if stats.calls])
+            self._counter(lines, "crm_graphql_sql_queries_total", "SQL queries attributed to a field.",
+                          [(labels, stats.queries) for labels, stats in labelled])
+            self._counter(lines, "crm_graphql_sql_seconds_total", "SQL time attributed to a field.",
+                          [(labels, stats.sql_duration / 1e9) for labels, stats in labelled])
+            self._counter(lines, "crm_graphql_n_plus_one_total", "Requests in which a field repeated one SQL shape.",
+                          [(labels, stats.n_plus_one) for labels, stats in labelled])
+            self._batch_histogram(lines)
+        self._document_cache(lines)
+        self._response_cache(lines)
+        return "\n".join(lines) + "\n"
+
+    def _batch_histogram(self, lines):
+        name = "crm_graphql_batch_size"
+        lines += [f"# HELP {name} Operations per batched request.", f"# TYPE {name} histogram"]
+        for bound in (*BATCH_BUCKETS, "+Inf"):
+            count = sum(n for size, n in self.batch_sizes.items() if bound == "+Inf" or size <= bound)
+            lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f"{name}_sum {sum(size * n for size, n in self.batch_sizes.items())}")
+        lines.append(f"{name}_count {sum(self.batch_sizes.values())}")
+
+    def _document_cache(self, lines):
+        stats = get_document_cache().stats()
+        self._counter(lines, "crm_graphql_document_cache_hits_total",
+                      "Operations whose query was already parsed and validated.", [("", stats["hits"])])
+        self._counter(lines, "crm_graphql_document_cache_misses_total",
+                      "Operations whose query was parsed and validated.", [("", stats["misses"])])
+        self._counter(lines, "crm_graphql_document_cache_evictions_total",
+                      "Documents dropped from the full cache.", [("", stats["evictions"])])
+        self._gauge(lines, "crm_graphql_document_cache_entries", "Documents cached.", [("", stats["entries"])])
+
+    def _response_cache(self, lines):
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return
+        stats = response_cache.stats()
+        self._counter(lines, "crm_graphql_response_cache_hits_total",
+                      "Query operations answered from the response cache.", [("", stats["hits"])])
+        self._counter(lines, "crm_graphql_response_cache_misses_total",
+                      "Query operations not found in the response cache.", [("", stats["misses"])])
+        self._gauge(lines, "crm_graphql_response_cache_hit_ratio",
+                    "Share of response cache lookups that hit, in this process.", [("", stats["hit_ratio"])])
+
+    def _counter(self, lines, name, help, samples):
+        self._samples(lines, name, help, "counter", samples)
+
+    def _gauge(self, lines, name, help, samples):
+        self._samples(lines, name, help, "gauge", samples)
+
+    def _samples(self, lines, name, help, kind, samples):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{{{labels}}} {value}" if labels else f"{name} {value}" for labels, value in samples]
+
+    def _histogram(self, lines, name, help, samples):
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+        for labels, stats in samples:
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), stats.buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {stats.duration / 1e9}")
+            lines.append(f"{name}_count{suffix} {stats.calls}")
+
+
+_metrics = None
+
+
+def get_metrics():
+    global _metrics
+    buckets = tuple(get_options()["BUCKETS"])
+    if _metrics is None or _metrics.buckets != buckets:
+        _metrics = Metrics(buckets)
+    return _metrics
@@ -1,3 +1,460 @@
-from django.shortcuts import render
+import asyncio
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from copy import copy
+from inspect import isawaitable
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast, parse, validate_schema
+
+from . import export
+from .asynchronous import ThreadedResolverMiddleware
+from .cost import QueryCost
+from .documents import PersistedQueryError, get_document_cache, query_hash, resolve_persisted_query
+from .loaders import Loaders
+from .response_cache import get_response_cache
+from .tracing import can_read_metrics, get_metrics, start_trace
+
+BATCH_DEFAULTS = {
+    # Operations allowed in one batched request.
+    "MAX_OPERATIONS": 10,
+    # Run batches of queries in threads, each with its own connection and
+    # loaders.  Batches containing a mutation always run in order.
+    "PARALLEL": False,
+    "MAX_WORKERS": 4,
+}
+
+
+def get_batch_options():
+    return {**BATCH_DEFAULTS, **getattr(settings, "GRAPHQL_BATCH", {})}
+
+
+class CRMGraphQLView(GraphQLView):
+    """GraphQL endpoint that reuses parsed documents across requests.
+
+    Query text is parsed and validated once per distinct query (see
+    ``crm.documents``), and clients may send a query's sha256 alone using
+    Automatic Persisted Queries.  Operations over the ``crm.cost`` budget
+    are rejected before they run, and the estimate is reported under
+    ``extensions.cost``.  When ``GRAPHQL_RESPONSE_CACHE`` is enabled,
+    results of query operations are served from ``crm.response_cache``.
+    Executed operations are traced by ``crm.tracing``.
+
+    A JSON array body is a batch of operations, answered with an array of
+    results.  They share the request's loaders and database connection
+    (see ``GRAPHQL_BATCH``).
+    """
+
+    document_cache = None
+
+    def get_document_cache(self):
+        return self.document_cache or get_document_cache()
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            batch = self.parse_batch(request)
+            if batch is None:
+                return super().dispatch(request, *args, **kwargs)
+            return self.batch_response(self.get_batch_responses(request, batch))
+        except HttpError as e:
+            return self.error_response(request, e)
+
+    def parse_batch(self, request):
+        """The operations of a batched request (a JSON array body), or ``None``."""
+        if (
+            request.method.lower() != "post"
+            or self.get_content_type(request) != "application/json"
+            or not request.body.lstrip().startswith(b"[")
+        ):
+            return None
+        self.batch = True
+        batch = self.parse_body(request)
+        limit = get_batch_options()["MAX_OPERATIONS"]
+        if len(batch) > limit:
+            raise HttpError(HttpResponseBadRequest(f"Batch of {len(batch)} operations exceeds the limit of {limit}."))
+        if not all(isinstance(entry, dict) for entry in batch):
+            raise HttpError(HttpResponseBadRequest("Batched operations must be JSON objects."))
+        get_metrics().record_batch(len(batch))
+        return batch
+
+    def operation_type(self, request, data):
+        """The type of ``data``'s operation, or ``None`` when it cannot run.
+
+        The cache is only peeked at, so its counters still see each
+        operation once, when ``prepare_operation`` looks it up; an
+        uncached query is parsed but not validated.
+        """
+        cache = self.get_document_cache()
+        query, _, operation_name, _ = self.get_graphql_params(request, data)
+        try:
+            query = resolve_persisted_query(cache, query, self.get_extensions(request, data))
+            entry = cache.peek(query_hash(query))
+            document = entry[1] if entry is not None else parse(query)
+        except Exception:
+            return None
+        operation_ast = get_operation_ast(document, operation_name)
+        return None if operation_ast is None else operation_ast.operation
+
+    def operation_requests(self, request, batch):
+        """A shallow copy of ``request`` per operation, sharing one set of loaders.
+
+        Each copy gets its own tracer and flags.  Returns the copies and
+        whether the batch is only queries, which may run concurrently.
+        """
+        request.crm_loaders = Loaders()
+        read_only = all(self.operation_type(request, entry) == OperationType.QUERY for entry in batch)
+        return [copy(request) for _ in batch], read_only
+
+    def get_batch_responses(self, request, batch):
+        requests, read_only = self.operation_requests(request, batch)
+        options = get_batch_options()
+        if read_only and options["PARALLEL"] and len(batch) > 1:
+            for operation_request in requests:
+                # Loaders are not thread-safe.
+                operation_request.crm_loaders = None
+            with ThreadPoolExecutor(min(len(batch), options["MAX_WORKERS"])) as pool:
+                return list(pool.map(self.get_threaded_response, requests, batch))
+        responses = []
+        for operation_request, entry in zip(requests, batch):
+            responses.append(self.get_response(operation_request, entry))
+            if not read_only:
+                # Later operations must see what a mutation wrote.
+                request.crm_loaders.clear()
+        return responses
+
+    def get_threaded_response(self, request, data):
+        try:
+            return self.get_response(request, data)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def batch_response(responses):
+        result = "[{}]".format(",".join(response[0] for response in responses))
+        status_code = max((response[1] for response in responses), default=200)
+        return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+    def error_response(self, request, error):
+        response = error.response
+        response["Content-Type"] = "application/json"
+        response.content = self.json_encode(request, {"errors": [self.format_error(error)]})
+        return response
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        operation = self.prepare_operation(request, data, query, variables, operation_name, show_graphiql)
+        if not isinstance(operation, Operation):
+            return operation
+        with self.traced(operation):
+            result = self.execute_operation(request, *operation.args)
+        return self.finish_operation(operation, result)
+
+    @staticmethod
+    def traced(operation):
+        if operation.tracer is None:
+            return nullcontext()
+        return connection.execute_wrapper(operation.tracer.execute_sql)
+
+    def prepare_operation(self, request, data, query, variables, operation_name, show_graphiql=False):
+        """Everything up to execution: an ``Operation`` to run, or the final result."""
+        cache = self.get_document_cache()
+        try:
+            query = resolve_persisted_query(cache, query, self.get_extensions(request, data))
+        except PersistedQueryError as e:
+            return ExecutionResult(errors=[GraphQLError(str(e), extensions={"code": e.code})])
+
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            document, validation_errors = cache.get_or_parse(
+                schema, query, self.validation_rules, graphene_settings.MAX_VALIDATION_ERRORS
+            )
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(operation_ast.operation.value),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        if operation_ast is not None and operation_ast.operation == OperationType.SUBSCRIPTION:
+            return ExecutionResult(errors=[GraphQLError("Subscriptions are served over WebSocket at /graphql.")])
+
+        cost = QueryCost(schema, document, variables, operation_name).analyze()
+        extensions = {"cost": cost.extensions()}
+        cost_errors = cost.errors()
+        if cost_errors:
+            return ExecutionResult(errors=cost_errors, extensions=extensions)
+
+        response_cache = cache_key = None
+        if operation_ast is not None and operation_ast.operation == OperationType.QUERY:
+            response_cache = get_response_cache()
+            if response_cache is not None and not response_cache.cacheable(document, operation_ast):
+                response_cache = None
+        if response_cache is not None:
+            cache_key = response_cache.key(document, operation_name, variables)
+            data = response_cache.get(cache_key)
+            if data is not None:
+                return ExecutionResult(data=data, extensions=extensions)
+
+        return Operation(
+            (schema, document, operation_ast, variables, operation_name),
+            extensions, response_cache, cache_key, start_trace(request),
+        )
+
+    def finish_operation(self, operation, result):
+        tracer = operation.tracer
+        if tracer is not None:
+            tracer.finish()
+            get_metrics().record(tracer)
+            if tracer.detailed:
+                operation.extensions.update(tracer.extensions())
+        if operation.response_cache is not None and not result.errors:
+            operation.response_cache.set(operation.cache_key, result.data)
+        result.extensions = {**(result.extensions or {}), **operation.extensions}
+        return result
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    def format_response(self, request, execution_result, id=None, show_graphiql=False):
+        # As GraphQLView.get_response, plus the result's ``extensions``.
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if not execution_result:
+            return None, status_code
+
+        response = {}
+        if execution_result.errors:
+            set_rollback()
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.errors and any(not getattr(e, "path", None) for e in execution_result.errors):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def execute_options(self, request, variables, operation_name):
+        options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            options["execution_context_class"] = self.execution_context_class
+        return options
+
+    def execute_operation(self, request, schema, document, operation_ast, variables, operation_name):
+        try:
+            execute_options = self.execute_options(request, variables, operation_name)
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+class Operation:
+    """A parsed, validated and costed operation, ready to execute."""
+
+    def __init__(self, args, extensions, response_cache, cache_key, tracer):
+        self.args = args
+        self.extensions = extensions
+        self.response_cache = response_cache
+        self.cache_key = cache_key
+        self.tracer = tracer
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """``CRMGraphQLView`` executing on the event loop, for ASGI servers.
+
+    Async resolvers (see ``crm.asynchronous``) run on the loop, and the
+    root fields of a query run concurrently.  Synchronous resolvers run in
+    the request's thread, so an in-flight request only holds a thread
+    while it runs Python or SQL.  Parsing, validation, costing and the
+    response cache run there too, in one hop before and one after
+    execution.  GraphiQL and ``ATOMIC_MUTATIONS`` are not supported.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await self.dispatch(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.dispatch(request, *args, **kwargs)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(HttpResponseNotAllowed(["GET", "POST"], "GraphQL only supports GET and POST requests."))
+            batch = self.parse_batch(request)
+            if batch is not None:
+                return self.batch_response(await self.get_batch_responses_async(request, batch))
+            result, status_code = await self.get_response_async(request, self.parse_body(request))
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+        except HttpError as e:
+            return self.error_response(request, e)
+
+    async def get_batch_responses_async(self, request, batch):
+        # Queries run concurrently; their sync resolvers still take turns in
+        # the request's thread, so sharing the loaders is safe.
+        requests, read_only = self.operation_requests(request, batch)
+        if read_only:
+            return await asyncio.gather(*map(self.get_response_async, requests, batch))
+        responses = []
+        for operation_request, entry in zip(requests, batch):
+            responses.append(await self.get_response_async(operation_request, entry))
+            request.crm_loaders.clear()
+        return responses
+
+    async def get_response_async(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        operation = await sync_to_async(self.prepare_threaded)(request, data, query, variables, operation_name)
+        if isinstance(operation, Operation):
+            result = await self.execute_operation_async(request, operation)
+            operation = await sync_to_async(self.finish_threaded)(operation, result)
+        return self.format_response(request, operation, id)
+
+    # Database connections are per thread, so the tracer's SQL wrapper is
+    # installed in the request's thread, where the queries run.
+    def prepare_threaded(self, *args):
+        operation = self.prepare_operation(*args)
+        if isinstance(operation, Operation) and operation.tracer is not None:
+            connection.execute_wrappers.append(operation.tracer.execute_sql)
+        return operation
+
+    def finish_threaded(self, operation, result):
+        if operation.tracer is not None:
+            connection.execute_wrappers.remove(operation.tracer.execute_sql)
+        return self.finish_operation(operation, result)
+
+    def get_middleware(self, request):
+        return [*(self.middleware or ()), ThreadedResolverMiddleware()]
+
+    async def execute_operation_async(self, request, operation):
+        schema, document, operation_ast, variables, operation_name = operation.args
+        request.graphql_async = True
+        try:
+            result = execute(schema, document, **self.execute_options(request, variables, operation_name))
+            return await result if isawaitable(result) else result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+accepts_gzip = re.compile(r"\bgzip\b").search
+
+
+def export_view(request, kind, fmt):
+    """Stream ``kind`` (orders, customers, products) as NDJSON or CSV.
+
+    Query parameters are the same filters the GraphQL connections take,
+    e.g. ``/export/orders.csv?order_date__gte=2024-01-01``.  The body is
+    generated while it is sent, gzipped when the client accepts it.  Only
+    users with the view permissions in ``export.PERMISSIONS`` may export.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    if kind not in export.EXPORTS or fmt not in export.FORMATS:
+        raise Http404(f"No export for {kind}.{fmt}")
+    if not request.user.has_perms(export.PERMISSIONS[kind]):
+        return HttpResponseForbidden(f"Exporting {kind} needs the {', '.join(export.PERMISSIONS[kind])} permissions.")
+    try:
+        content = export.batched(export.lines(kind, fmt, request.GET))
+    except ValidationError as e:
+        return JsonResponse({"errors": e.message_dict}, status=400)
+
+    content = (chunk.encode("utf-8") for chunk in content)
+    gzipped = accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    response = StreamingHttpResponse(
+        compress_sequence(content) if gzipped else content, content_type=export.FORMATS[fmt]
+    )
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    response.headers["Content-Disposition"] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+def metrics_view(request):
+    """GraphQL resolver and SQL metrics of this process, for Prometheus to scrape.
+
+    Open to staff users and to requests bearing ``GRAPHQL_TRACING["METRICS_TOKEN"]``.
+    """
+    if not can_read_metrics(request):
+        return HttpResponseForbidden("Metrics need a staff login or the metrics token.")
+    return HttpResponse(get_metrics().render(), content_type="text/plain; version=0.0.4; charset=utf-8")
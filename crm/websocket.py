@@ -0,0 +1,213 @@
+import asyncio
+import json
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, instantiate_middleware
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast
+from graphql.execution import create_source_event_stream
+
+from . import pubsub
+from .asynchronous import ThreadedResolverMiddleware
+from .cost import QueryCost
+from .documents import get_document_cache
+
+PROTOCOL = "graphql-transport-ws"
+
+
+class OperationContext:
+    """``info.context`` of operations received over a WebSocket.
+
+    Resolvers run as under ``AsyncCRMGraphQLView``.  A fresh context is
+    made for every subscription event, so loaders never serve stale rows.
+    """
+
+    graphql_async = True
+
+    def __init__(self, scope):
+        self.scope = scope
+
+
+class GraphQLWebSocket:
+    """ASGI application serving GraphQL over WebSocket.
+
+    Speaks the ``graphql-transport-ws`` protocol of the ``graphql-ws``
+    client.  Subscriptions stream one ``next`` message per event; queries
+    and mutations answer once.  Documents go through the same document
+    cache and cost limits as the HTTP views.
+    """
+
+    def __init__(self, schema=None, init_timeout=None):
+        self.schema = schema or graphene_settings.SCHEMA
+        self.init_timeout = init_timeout or pubsub.get_options()["CONNECTION_INIT_TIMEOUT"]
+        self.middleware = [*instantiate_middleware(graphene_settings.MIDDLEWARE), ThreadedResolverMiddleware()]
+
+    async def __call__(self, scope, receive, send):
+        await Session(self, scope, receive, send).run()
+
+
+class Session:
+    """One WebSocket connection and its running operations, by id."""
+
+    def __init__(self, app, scope, receive, send):
+        self.app = app
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.acknowledged = False
+        self.closed = False
+        self.operations = {}
+
+    async def run(self):
+        if (await self.receive())["type"] != "websocket.connect":
+            return
+        if PROTOCOL not in self.scope.get("subprotocols", ()):
+            await self.send({"type": "websocket.close", "code": 4406})
+            return
+        await self.send({"type": "websocket.accept", "subprotocol": PROTOCOL})
+        try:
+            while not self.closed:
+                try:
+                    timeout = None if self.acknowledged else self.app.init_timeout
+                    message = await asyncio.wait_for(self.receive(), timeout)
+                except asyncio.TimeoutError:
+                    await self.close(4408, "Connection initialisation timeout")
+                    break
+                if message["type"] == "websocket.disconnect":
+                    break
+                await self.handle(message.get("text") or message.get("bytes"))
+        finally:
+            tasks = list(self.operations.values())
+            for task in tasks:
+                task.cancel()
+            # Let them close their streams before the connection is gone.
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self, code, reason):
+        self.closed = True
+        await self.send({"type": "websocket.close", "code": code, "reason": reason})
+
+    async def send_json(self, message):
+        if not self.closed:
+            await self.send({"type": "websocket.send", "text": json.dumps(message, cls=DjangoJSONEncoder)})
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            kind = message["type"]
+        except (TypeError, ValueError, KeyError):
+            return await self.close(4400, "Invalid message received")
+
+        if kind == "connection_init":
+            if self.acknowledged:
+                return await self.close(4429, "Too many initialisation requests")
+            self.acknowledged = True
+            await self.send_json({"type": "connection_ack"})
+        elif kind == "ping":
+            await self.send_json({"type": "pong"})
+        elif kind == "pong":
+            pass
+        elif kind == "subscribe":
+            if not self.acknowledged:
+                return await self.close(4401, "Unauthorized")
+            id = message.get("id")
+            if id in self.operations:
+                return await self.close(4409, f"Subscriber for {id} already exists")
+            self.operations[id] = asyncio.ensure_future(self.run_operation(id, message.get("payload") or {}))
+        elif kind == "complete":
+            task = self.operations.pop(message.get("id"), None)
+            if task is not None:
+                task.cancel()
+        else:
+            await self.close(4400, f"Unexpected message type: {kind}")
+
+    def prepare(self, payload):
+        """The operation of ``payload`` ready to execute, or a list of errors."""
+        schema = self.app.schema.graphql_schema
+        query = payload.get("query")
+        variables, operation_name = payload.get("variables"), payload.get("operationName")
+        if not query:
+            return [GraphQLError("Must provide query string.")]
+        try:
+            document, errors = get_document_cache().get_or_parse(
+                schema, query, None, graphene_settings.MAX_VALIDATION_ERRORS
+            )
+        except GraphQLError as e:
+            return [e]
+        if errors:
+            return errors
+        operation_ast = get_operation_ast(document, operation_name)
+        if operation_ast is None:
+            return [GraphQLError("Unknown operation.")]
+        errors = QueryCost(schema, document, variables, operation_name).analyze().errors()
+        if errors:
+            return errors
+        return schema, document, operation_ast, variables, operation_name
+
+    async def execute(self, schema, document, variables, operation_name, root_value=None):
+        try:
+            result = execute(
+                schema, document, root_value=root_value, context_value=OperationContext(self.scope),
+                variable_values=variables, operation_name=operation_name, middleware=self.app.middleware,
+            )
+            if isawaitable(result):
+                result = await result
+        except Exception as e:
+            result = ExecutionResult(errors=[e])
+        await sync_to_async(close_old_connections)()
+        return result
+
+    async def run_operation(self, id, payload):
+        try:
+            prepared = self.prepare(payload)
+            if isinstance(prepared, list):
+                return await self.send_json({"id": id, "type": "error", "payload": self.format_errors(prepared)})
+            schema, document, operation_ast, variables, operation_name = prepared
+
+            if operation_ast.operation != OperationType.SUBSCRIPTION:
+                result = await self.execute(schema, document, variables, operation_name)
+                await self.send_json({"id": id, "type": "next", "payload": self.format_result(result)})
+            else:
+                stream = await create_source_event_stream(
+                    schema, document, context_value=OperationContext(self.scope),
+                    variable_values=variables, operation_name=operation_name,
+                )
+                if isinstance(stream, ExecutionResult):
+                    return await self.send_json({"id": id, "type": "error", "payload": self.format_errors(stream.errors)})
+                try:
+                    async for event in stream:
+                        result = await self.execute(schema, document, variables, operation_name, event)
+                        await self.send_json({"id": id, "type": "next", "payload": self.format_result(result)})
+                finally:
+                    await stream.aclose()
+            await self.send_json({"id": id, "type": "complete"})
+        finally:
+            # A task the client completed is already gone.
+            if self.operations.get(id) is asyncio.current_task():
+                del self.operations[id]
+
+    def format_errors(self, errors):
+        return [GraphQLView.format_error(error) for error in errors]
+
+    def format_result(self, result):
+        payload = {"data": result.data}
+        if result.errors:
+            payload["errors"] = self.format_errors(result.errors)
+        return payload
+
+
+def router(http, websocket, path="/graphql"):
+    """ASGI application sending WebSocket connections to ``path`` to ``websocket``, the rest to ``http``."""
+
+    async def application(scope, receive, send):
+        if scope["type"] != "websocket":
+            return await http(scope, receive, send)
+        if scope["path"].rstrip("/") == path:
+            return await websocket(scope, receive, send)
+        await receive()
+        await send({"type": "websocket.close"})
+
+    return application
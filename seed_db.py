@@ -1,29 +1,36 @@
 # seed_db.py
+import argparse
 import django, os
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql.settings")
 django.setup()
 
-from crm.models import Customer, Product
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection
 
-def run():
-    Customer.objects.all().delete()
-    Product.objects.all().delete()
+from crm import response_cache
+from crm.models import Customer, Product, Order, DailySalesRollup
 
-    customers = [
-        ("Alice", "alice@example.com", "+1234567890"),
-        ("Bob", "bob@example.com", "123-456-7890"),
-    ]
-    for name, email, phone in customers:
-        Customer.objects.create(name=name, email=email, phone=phone)
+def run(append=False):
+    # Starts from an empty CRM unless --append is given, so reseeding does
+    # not duplicate the generated products and orders.
+    if not append:
+        # Flushed like `manage.py flush` does, in one transaction: the
+        # per-order rollup signals of QuerySet.delete() would take minutes on
+        # a large database and leave nothing to keep.
+        models = (Order.products.through, DailySalesRollup, Order, Customer, Product)
+        connection.ops.execute_sql_flush(
+            connection.ops.sql_flush(no_style(), [model._meta.db_table for model in models])
+        )
+        response_cache.invalidate()
 
-    products = [
-        ("Laptop", 999.99, 10),
-        ("Phone", 499.99, 20),
-    ]
-    for name, price, stock in products:
-        Product.objects.create(name=name, price=price, stock=stock)
+    # Synthetic rows through the bulk importer; for real volumes use
+    # `manage.py import_crm --generate --customers ... --workers ...` directly.
+    call_command("import_crm", generate=True, customers=50, products=20, orders=200)
 
     print("Database seeded successfully!")
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Seed the CRM with synthetic data.")
+    parser.add_argument("--append", action="store_true", help="Add to the existing data instead of replacing it.")
+    run(append=parser.parse_args().append)